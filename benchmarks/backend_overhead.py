@@ -0,0 +1,82 @@
+"""
+Compares the per-call overhead of each profiler backend.
+
+Runs a workload of many small python function calls with no profiler
+and then under each backend that can be loaded, reporting the extra
+nanoseconds each call costs.
+
+usage: python benchmarks/backend_overhead.py [calls] [repeats]
+
+"""
+import sys
+import time
+
+from os_code_profiler.common.profiling import Config as ProfilingConfig
+from os_code_profiler.common.utils import PluginLoader
+
+
+def leaf(x):
+    return x + 1
+
+
+def workload(calls):
+    total = 0
+    for i in xrange(calls):
+        total = leaf(total)
+    return total
+
+
+def best_time(calls, repeats):
+    """
+    Returns the fastest of repeats runs of the workload in seconds.
+
+    """
+    best = None
+    for i in range(repeats):
+        began = time.time()
+        workload(calls)
+        elapsed = time.time() - began
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def measure(name, calls, repeats):
+    """
+    Returns the fastest workload time under the named backend or None
+    if the backend cannot be loaded.
+
+    """
+    try:
+        backend = PluginLoader().load(ProfilingConfig.backends[name], {})
+    except ImportError:
+        return None
+    backend.set_clock_type('cpu')
+    backend.start()
+    try:
+        return best_time(calls, repeats)
+    finally:
+        backend.stop()
+        backend.clear_stats()
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    baseline = best_time(calls, repeats)
+    print '%-18s %10s %12s %10s' % ('backend', 'seconds', 'ns/call', 'slowdown')
+    print '%-18s %10.4f %12s %10s' % ('none', baseline, '-', '1.00x')
+    for name in sorted(ProfilingConfig.backends):
+        elapsed = measure(name, calls, repeats)
+        if elapsed is None:
+            print '%-18s %10s' % (name, 'unavailable')
+            continue
+        overhead = (elapsed - baseline) / calls * 1e9
+        print '%-18s %10.4f %12.1f %9.2fx' % (
+            name, elapsed, overhead, elapsed / baseline
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Measures what filtering by module saves on an eventlet workload.
+
+Green threads run application functions from this module that switch
+through the eventlet hub and call into the standard library, so most
+traced frames belong to eventlet and the stdlib. Each backend runs the
+workload without a filter and then keeping only this module, reporting
+the workload time, the time to capture and convert the stats, the
+number of functions kept and the size of the dump.
+
+Only the sampler filters while profiling, so only its workload time
+drops. The tracing backends trace every function whatever the filter,
+and for them the filter only shrinks the snapshot and the dump.
+
+usage: python benchmarks/module_filter.py [threads] [iterations]
+
+"""
+import json
+import marshal
+import os
+import sys
+import time
+
+import eventlet
+
+from os_code_profiler.common.filtering import ModuleFilter
+from os_code_profiler.common.profiling import Config as ProfilingConfig
+from os_code_profiler.common.utils import PluginLoader
+
+APP = os.path.splitext(os.path.basename(__file__))[0]
+
+
+def handle(request):
+    body = json.dumps({'id': request, 'items': range(5)})
+    eventlet.sleep(0)
+    return validate(json.loads(body))
+
+
+def validate(document):
+    return len(document['items']) == 5
+
+
+def green_thread(iterations):
+    for i in xrange(iterations):
+        handle(i)
+
+
+def workload(threads, iterations):
+    """
+    Runs the green threads to completion and returns the seconds taken.
+
+    """
+    began = time.time()
+    pool = eventlet.GreenPool(threads)
+    for i in range(threads):
+        pool.spawn(green_thread, iterations)
+    pool.waitall()
+    return time.time() - began
+
+
+def measure(name, module_filter, threads, iterations):
+    """
+    Returns (workload seconds, snapshot seconds, functions, bytes) for
+    the named backend or None if it cannot be loaded.
+
+    """
+    try:
+        backend = PluginLoader().load(ProfilingConfig.backends[name], {})
+    except ImportError:
+        return None
+    if module_filter is not None:
+        backend.set_module_filter(module_filter)
+    backend.set_clock_type('cpu')
+    backend.clear_stats()
+    backend.start()
+    try:
+        elapsed = workload(threads, iterations)
+        began = time.time()
+        snapshot = backend.snapshot(reset=True)
+        stats = snapshot.stats() if hasattr(snapshot, '_convert') \
+            else snapshot
+        converted = time.time() - began
+    finally:
+        backend.stop()
+        backend.clear_stats()
+    return elapsed, converted, len(stats), len(marshal.dumps(stats.stats))
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    baseline = workload(threads, iterations)
+    keep_app = ModuleFilter(include=[APP])
+    print 'no profiler: %.4f seconds' % baseline
+    print '%-18s %-8s %10s %10s %10s %10s' % (
+        'backend', 'filter', 'workload', 'snapshot', 'functions', 'bytes'
+    )
+    for name in sorted(ProfilingConfig.backends):
+        if name == 'noop':
+            continue
+        for label, module_filter in [('none', None), ('app', keep_app)]:
+            result = measure(name, module_filter, threads, iterations)
+            if result is None:
+                print '%-18s %-8s %10s' % (name, label, 'unavailable')
+                continue
+            print '%-18s %-8s %10.4f %10.4f %10d %10d' % (
+                (name, label) + result
+            )
+
+
+if __name__ == '__main__':
+    main()
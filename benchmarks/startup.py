@@ -0,0 +1,68 @@
+"""
+Measures what importing os_code_profiler adds to process startup when
+profiling is disabled.
+
+Starts fresh interpreters that import nothing, then ones that import
+the nova decorator module and install the import hook with
+OS_CODE_PROFILER_CONFIG unset, as a .pth file would. Reports the best
+startup time of each and fails if the difference exceeds the limit or
+if eventlet or a profiler was imported.
+
+usage: python benchmarks/startup.py [runs] [limit_ms]
+
+"""
+import os
+import subprocess
+import sys
+import time
+
+BASELINE = 'import sys'
+
+DISABLED = '''
+import sys
+import os_code_profiler.common.import_hook as hook
+hook.install_from_env()
+import os_code_profiler.decorators.nova
+heavy = ['eventlet', 'greenlet', 'GreenletProfiler', 'yappi', 'socket']
+loaded = [name for name in heavy if sys.modules.get(name) is not None]
+if loaded:
+    sys.exit('imported %s' % ', '.join(loaded))
+'''
+
+
+def best_startup(code, runs, env):
+    """
+    Returns the fastest of runs interpreter starts running code,
+    in seconds.
+
+    """
+    best = None
+    for i in range(runs):
+        began = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        elapsed = time.time() - began
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    limit_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+
+    env = dict(os.environ)
+    env.pop('OS_CODE_PROFILER_CONFIG', None)
+    baseline = best_startup(BASELINE, runs, env)
+    disabled = best_startup(DISABLED, runs, env)
+    overhead_ms = (disabled - baseline) * 1000
+
+    print '%-10s %10s' % ('startup', 'ms')
+    print '%-10s %10.1f' % ('baseline', baseline * 1000)
+    print '%-10s %10.1f' % ('disabled', disabled * 1000)
+    print '%-10s %10.1f (limit %.1f)' % ('overhead', overhead_ms, limit_ms)
+    assert overhead_ms <= limit_ms, \
+        'import overhead %.1fms exceeds %.1fms' % (overhead_ms, limit_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+from os_code_profiler.common.stats import Stats
+
+
+class BackendNotImplemented(Exception):
+    """
+    Simple exception that is raised when a base class backend method
+        is called.
+    """
+    pass
+
+
+class Base(object):
+    """
+    Interface between the dumper and a profiler.
+    Backends should subclass this class and are loaded with the
+    PluginLoader, so __init__ must accept a single config dictionary.
+
+    """
+    def __init__(self, config):
+        """
+        Inits the base backend.
+
+        @param config - Dictionary
+
+        """
+        self._config = config
+        self._module_filter = None
+
+    def _not_implemented(self, name):
+        raise BackendNotImplemented(
+            "need to implement %s in subclasses" % name
+        )
+
+    def set_clock_type(self, clock_type):
+        """
+        Sets the clock used for timing. Called before start.
+
+        @param clock_type - String. cpu|wall
+
+        """
+        self._not_implemented('set_clock_type')
+
+    def set_module_filter(self, module_filter):
+        """
+        Limits the stats to functions from some modules. Backends should
+        apply the filter as early as they can. Only the sampler filters
+        while profiling. Tracing backends still trace every function and
+        filter when dumping, which shrinks dumps but not the overhead.
+        Called before start.
+
+        @param module_filter - ModuleFilter object
+
+        """
+        self._module_filter = module_filter
+
+    def start(self):
+        """
+        Starts or resumes profiling.
+
+        """
+        self._not_implemented('start')
+
+    def stop(self):
+        """
+        Stops profiling. Collected stats are kept.
+
+        """
+        self._not_implemented('stop')
+
+    def is_running(self):
+        """
+        Returns whether or not the profiler is running.
+
+        """
+        self._not_implemented('is_running')
+
+    def clear_stats(self):
+        """
+        Discards collected stats.
+
+        """
+        self._not_implemented('clear_stats')
+
+    def get_func_stats(self):
+        """
+        Returns the collected function stats. The returned object must
+        provide a save(path) method for use by outputs.
+
+        """
+        self._not_implemented('get_func_stats')
+
+    def snapshot(self, reset=False):
+        """
+        Captures the collected stats without stopping the profiler,
+        optionally clearing them so that the next snapshot only covers
+        what happened after this one.
+
+        Backends should override this to capture and reset atomically
+        and defer expensive conversion to a Snapshot. This default is
+        built from get_func_stats and clear_stats.
+
+        @param reset - Boolean. Clear the stats after capturing them.
+        @returns - Object providing a save(path) method
+
+        """
+        stats = self.get_func_stats()
+        if reset:
+            self.clear_stats()
+        if self._module_filter is not None and isinstance(stats, Stats):
+            stats = self._module_filter.filter_stats(stats)
+        return stats
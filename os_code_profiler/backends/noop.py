@@ -0,0 +1,32 @@
+from os_code_profiler.backends.base import Base
+from os_code_profiler.common.stats import Stats
+
+
+class NoopBackend(Base):
+    """
+    Backend that collects nothing. Useful for measuring the cost of the
+    dumping machinery itself or for disabling profiling of a service
+    without removing its decoration.
+
+    """
+    def __init__(self, config):
+        super(NoopBackend, self).__init__(config)
+        self._running = False
+
+    def set_clock_type(self, clock_type):
+        pass
+
+    def start(self):
+        self._running = True
+
+    def stop(self):
+        self._running = False
+
+    def is_running(self):
+        return self._running
+
+    def clear_stats(self):
+        pass
+
+    def get_func_stats(self):
+        return Stats()
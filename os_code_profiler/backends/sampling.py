@@ -0,0 +1,64 @@
+from os_code_profiler.backends.base import Base
+from os_code_profiler.common.profiling import ConfigException
+from os_code_profiler.common.sampling import Sampler
+
+
+class SamplingBackend(Base):
+    """
+    Low overhead statistical profiling with a Sampler.
+
+    Config:
+        hz - Samples per second. Defaults to 100.
+        max_depth - Maximum frames recorded per sample. Defaults to 64.
+        timer - thread|signal. Defaults to thread.
+
+    """
+    def __init__(self, config):
+        super(SamplingBackend, self).__init__(config)
+        hz = float(config.get('hz', 100))
+        if hz <= 0:
+            raise ConfigException("hz must be positive")
+
+        max_depth = int(config.get('max_depth', 64))
+        if max_depth < 1:
+            raise ConfigException("max_depth must be at least 1")
+
+        timer = str(config.get('timer', 'thread')).lower()
+        if timer not in Sampler.valid_timers:
+            raise ConfigException("timer must be thread|signal")
+
+        self._sampler = Sampler(hz=hz, max_depth=max_depth, timer=timer)
+
+    def set_clock_type(self, clock_type):
+        self._sampler.set_clock_type(clock_type)
+
+    def set_module_filter(self, module_filter):
+        """
+        Skips frames of filtered functions while sampling.
+
+        """
+        super(SamplingBackend, self).set_module_filter(module_filter)
+        self._sampler.set_module_filter(module_filter)
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        self._sampler.stop()
+
+    def is_running(self):
+        return self._sampler.is_running()
+
+    def clear_stats(self):
+        self._sampler.clear_stats()
+
+    def get_func_stats(self):
+        return self._sampler.get_func_stats()
+
+    def snapshot(self, reset=False):
+        """
+        Captures the samples without converting them. Filtered frames
+        were never recorded, so there is nothing left to filter.
+
+        """
+        return self._sampler.snapshot(reset=reset)
@@ -0,0 +1,240 @@
+import cProfile
+import functools
+import importlib
+import os
+import time
+
+from os_code_profiler.backends.base import Base
+from os_code_profiler.common.stats import Snapshot, Stats
+
+# Process cpu time in seconds
+cpu_time = getattr(time, 'process_time', time.clock)
+
+
+def yappi_to_stats(raw, keep=None):
+    """
+    Converts raw entries from yappi's enum_func_stats to Stats.
+
+    Each entry starts with (name, module, lineno, ncall, nactualcall,
+    builtin, ttot, tsub, index, children) where each child is
+    (index, ncall, nactualcall, ttot, tsub).
+
+    @param raw - List of tuples
+    @param keep - Optional callable taking a file name and returning
+        whether its functions are kept.
+    @returns - Stats object. traced_calls is set when keep is given.
+
+    """
+    keys = {}
+    traced_calls = 0
+    for entry in raw:
+        name, module = entry[0], entry[1]
+        # Do not show profile stats of yappi itself
+        if os.path.basename(module) == 'yappi.py' or module == '_yappi':
+            continue
+        traced_calls += entry[3]
+        if keep is not None and not keep(module):
+            continue
+        keys[entry[8]] = (module, entry[2], name)
+
+    result = {}
+    for entry in raw:
+        func = keys.get(entry[8])
+        if func is not None:
+            result[func] = (entry[4], entry[3], entry[7], entry[6], {})
+
+    for entry in raw:
+        caller = keys.get(entry[8])
+        if caller is None:
+            continue
+        for index, ncall, nactualcall, ttot, tsub in entry[9]:
+            func = keys.get(index)
+            # Children may point to entries that were never recorded
+            if func is not None:
+                result[func][4][caller] = (nactualcall, ncall, tsub, ttot)
+    stats = Stats(result)
+    if keep is not None:
+        stats.traced_calls = traced_calls
+    return stats
+
+
+def _cprofile_label(code):
+    """
+    Returns the pstats key for a cProfile code entry.
+
+    """
+    if isinstance(code, str):
+        return ('~', 0, code)
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def cprofile_to_stats(entries, keep=None):
+    """
+    Converts entries from cProfile.Profile.getstats to Stats.
+    Mirrors cProfile.Profile.snapshot_stats.
+
+    @param entries - List of profiler_entry objects
+    @param keep - Optional callable taking a file name and returning
+        whether its functions are kept.
+    @returns - Stats object. traced_calls is set when keep is given.
+
+    """
+    traced_calls = None
+    if keep is not None:
+        traced_calls = sum(entry.callcount for entry in entries)
+        entries = [entry for entry in entries
+                   if keep(_cprofile_label(entry.code)[0])]
+    result = {}
+    callersdicts = {}
+    for entry in entries:
+        func = _cprofile_label(entry.code)
+        nc = entry.callcount
+        cc = nc - entry.reccallcount
+        callers = {}
+        callersdicts[id(entry.code)] = callers
+        result[func] = (cc, nc, entry.inlinetime, entry.totaltime, callers)
+    for entry in entries:
+        if entry.calls:
+            func = _cprofile_label(entry.code)
+            for sub in entry.calls:
+                try:
+                    callers = callersdicts[id(sub.code)]
+                except KeyError:
+                    continue
+                nc = sub.callcount
+                cc = nc - sub.reccallcount
+                callers[func] = (cc, nc, sub.inlinetime, sub.totaltime)
+    stats = Stats(result)
+    stats.traced_calls = traced_calls
+    return stats
+
+
+class YappiBackend(Base):
+    """
+    Deterministic tracing with yappi.
+
+    yappi's tracer is written in C with no hook to skip functions, so a
+    module filter is applied to the raw entries of each snapshot. It
+    reduces what is converted and written, not the cost of tracing.
+
+    Config:
+        builtins - Also profile builtin functions. Defaults to False.
+
+    """
+
+    module_name = 'yappi'
+    c_module_name = '_yappi'
+
+    def __init__(self, config):
+        super(YappiBackend, self).__init__(config)
+        self._profiler = importlib.import_module(self.module_name)
+        self._c_profiler = importlib.import_module(self.c_module_name)
+        self._builtins = bool(config.get('builtins', False))
+
+    def set_clock_type(self, clock_type):
+        self._profiler.set_clock_type(clock_type)
+
+    def start(self):
+        self._profiler.start(builtins=self._builtins)
+
+    def stop(self):
+        self._profiler.stop()
+
+    def is_running(self):
+        return self._profiler.is_running()
+
+    def clear_stats(self):
+        self._profiler.clear_stats()
+
+    def get_func_stats(self):
+        return self._profiler.get_func_stats()
+
+    def snapshot(self, reset=False):
+        """
+        Copies yappi's raw entries and optionally clears them while
+        tracing is paused, without building any YFuncStat objects.
+
+        """
+        raw = []
+        self._c_profiler._pause()
+        try:
+            self._c_profiler.enum_func_stats(raw.append)
+            if reset:
+                self._c_profiler.clear_stats()
+        finally:
+            self._c_profiler._resume()
+        return Snapshot(raw, functools.partial(yappi_to_stats,
+                                               keep=self._module_filter))
+
+
+class GreenletProfilerBackend(YappiBackend):
+    """
+    Greenlet aware tracing with GreenletProfiler, the vendored yappi
+    that accounts time per greenlet instead of per thread.
+
+    """
+
+    module_name = 'GreenletProfiler'
+    c_module_name = '_GreenletProfiler_yappi'
+
+
+class CProfileBackend(Base):
+    """
+    Deterministic tracing with the standard library cProfile.
+
+    cProfile only traces the thread that starts it and is not aware of
+    greenlet switches, so time spent by other green threads while a
+    function is switched out is included in its cumulative time.
+
+    Like yappi, every function is traced and a module filter is applied
+    to the entries of each snapshot.
+
+    """
+    def __init__(self, config):
+        super(CProfileBackend, self).__init__(config)
+        self._timer = None
+        self._running = False
+        self._profile = cProfile.Profile()
+
+    def set_clock_type(self, clock_type):
+        """
+        Uses process cpu time for cpu, cProfile's default clock for wall.
+        Must be called while stopped.
+
+        """
+        self._timer = cpu_time if clock_type == 'cpu' else None
+        if self._timer is None:
+            self._profile = cProfile.Profile()
+        else:
+            self._profile = cProfile.Profile(self._timer)
+
+    def start(self):
+        self._profile.enable()
+        self._running = True
+
+    def stop(self):
+        self._profile.disable()
+        self._running = False
+
+    def is_running(self):
+        return self._running
+
+    def clear_stats(self):
+        self._profile.clear()
+
+    def get_func_stats(self):
+        return cprofile_to_stats(self._profile.getstats(),
+                                 keep=self._module_filter)
+
+    def snapshot(self, reset=False):
+        """
+        Copies cProfile's entries and optionally clears them without
+        disabling the profiler.
+
+        """
+        entries = self._profile.getstats()
+        if reset:
+            self._profile.clear()
+        return Snapshot(entries, functools.partial(
+            cprofile_to_stats, keep=self._module_filter
+        ))
@@ -0,0 +1,139 @@
+import marshal
+
+from os_code_profiler.common import compression
+
+
+class CollectorNotImplemented(Exception):
+    """
+    Simple exception that is raised when a base class collector method
+        is called.
+    """
+    pass
+
+
+class Document(object):
+    """
+    Data captured by a collector, written by outputs like stats.
+
+    The data must be made of types marshal can write. Like stats files,
+    the data is followed by the context of the dump.
+
+    """
+    def __init__(self, data):
+        """
+        @param data - Marshallable object
+
+        """
+        self.data = data
+
+    def dump(self, f):
+        """
+        Writes the data to an open file object.
+
+        @param f - File object or file like object opened for
+            binary writing
+
+        """
+        if isinstance(f, file):
+            marshal.dump(self.data, f)
+        else:
+            f.write(marshal.dumps(self.data, compression.marshal_version))
+
+    def save(self, path):
+        """
+        Writes the data to path.
+
+        @param path - String
+
+        """
+        with open(path, 'wb') as f:
+            self.dump(f)
+
+
+def load(path):
+    """
+    Loads a file written from a Document.
+
+    @param path - String
+    @returns - Tuple. (data, context dictionary or None)
+
+    """
+    objects = compression.load_marshal(path, 2)
+    if len(objects) < 2:
+        return objects[0], None
+    return objects[0], objects[1]
+
+
+class LazyDocument(Document):
+    """
+    Document whose data is computed on first use, which is when the
+    writer thread writes it. Lets collectors defer expensive work off
+    the dumper's green thread.
+
+    """
+    def __init__(self, compute):
+        """
+        @param compute - Callable returning marshallable data
+
+        """
+        self._compute = compute
+        self._data = None
+
+    @property
+    def data(self):
+        if self._compute is not None:
+            self._data = self._compute()
+            self._compute = None
+        return self._data
+
+
+class Base(object):
+    """
+    Collects measurements other than function stats alongside the
+    profiler. Collectors run for as long as the dumper and are dumped
+    with each interval's stats, to files of their own kind.
+
+    Collectors are loaded with the PluginLoader, so __init__ must accept
+    a single config dictionary.
+
+    """
+
+    # Names the files the collector is written to. ex: 'histograms'
+    kind = None
+
+    def __init__(self, config):
+        """
+        @param config - Dictionary
+
+        """
+        self._config = config
+
+    def _not_implemented(self, name):
+        raise CollectorNotImplemented(
+            "need to implement %s in subclasses" % name
+        )
+
+    def start(self):
+        """
+        Starts collecting.
+
+        """
+        self._not_implemented('start')
+
+    def stop(self):
+        """
+        Stops collecting and undoes any instrumentation.
+
+        """
+        self._not_implemented('stop')
+
+    def snapshot(self, reset=True):
+        """
+        Captures what was collected so far. Called from the dumper's
+        green thread.
+
+        @param reset - Boolean. Start collecting from scratch afterward.
+        @returns - Document object
+
+        """
+        self._not_implemented('snapshot')
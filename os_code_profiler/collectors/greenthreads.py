@@ -0,0 +1,221 @@
+"""
+Accounts the time each green thread spends running.
+
+"""
+import functools
+import inspect
+import time
+
+import greenlet
+
+from os_code_profiler.collectors.base import Base, Document
+from os_code_profiler.collectors.instrument import Patch
+from os_code_profiler.common.sampling import cpu_time
+
+# Order of the counters of each site in a dump
+SITE_FIELDS = ['cpu', 'wall', 'switches', 'finished', 'live']
+
+# Order of the counters of each green thread in a dump
+GREENTHREAD_FIELDS = ['id', 'site', 'cpu', 'wall', 'switches', 'age']
+
+
+def spawn_site(function):
+    """
+    Names the function a green thread was spawned to run.
+
+    @param function - Callable
+    @returns - String. ex: 'nova.compute.manager:ComputeManager.run'
+
+    """
+    while isinstance(function, functools.partial):
+        function = function.func
+    name = getattr(function, '__name__', None) or type(function).__name__
+    owner = getattr(function, '__self__', None)
+    if owner is not None:
+        if not inspect.isclass(owner):
+            owner = type(owner)
+        name = '%s.%s' % (owner.__name__, name)
+    module = getattr(function, '__module__', None) or '?'
+    return '%s:%s' % (module, name)
+
+
+class GreenthreadCollector(Base):
+    """
+    Records the cpu time, wall time and number of switches of every
+    green thread, using greenlet's switch tracing.
+
+    Green threads are grouped by spawn site, the function they were
+    spawned with. When a green thread finishes its counters are added to
+    its site, so short lived green threads only cost memory while they
+    run. Each dump has the totals of every site and the counters of the
+    live green threads that used the most cpu.
+
+    The hub is reported as <hub>, the main greenlet as <main> and other
+    greenlets by their type until they run a spawned function. Cpu time
+    is process cpu time, so it includes any native threads running at
+    the same time.
+
+    Config keys:
+        max_greenthreads - Live green threads listed in each dump.
+            Defaults to 50.
+
+    """
+
+    kind = 'greenthreads'
+
+    main_target = 'eventlet.greenthread:GreenThread.main'
+
+    def __init__(self, config):
+        super(GreenthreadCollector, self).__init__(config)
+        self._max_greenthreads = int(config.get('max_greenthreads', 50))
+        self._records = {}
+        self._sites = {}
+        self._hub = None
+        self._current = None
+        self._wall_mark = None
+        self._cpu_mark = None
+        self._previous_trace = None
+        self._patch = None
+
+    def _new_record(self, glet):
+        """
+        Returns [site, cpu, wall, switches, first seen] for a green
+        thread seen for the first time.
+
+        """
+        if glet.parent is None:
+            site = '<main>'
+        elif glet is getattr(self._hub, 'greenlet', None):
+            site = '<hub>'
+        else:
+            site = '<%s>' % type(glet).__name__
+        record = [site, 0.0, 0.0, 0, time.time()]
+        self._records[id(glet)] = record
+        return record
+
+    def _finish(self, glet):
+        """
+        Adds the counters of a finished green thread to its site.
+
+        """
+        record = self._records.pop(id(glet), None)
+        if record is None:
+            return
+        totals = self._sites.get(record[0])
+        if totals is None:
+            totals = self._sites[record[0]] = [0.0, 0.0, 0, 0]
+        totals[0] += record[1]
+        totals[1] += record[2]
+        totals[2] += record[3]
+        totals[3] += 1
+
+    def _trace(self, event, args):
+        """
+        Greenlet trace function. Charges the time since the last switch
+        to the green thread switched from.
+
+        """
+        if self._previous_trace is not None:
+            self._previous_trace(event, args)
+        if event not in ('switch', 'throw'):
+            return
+        origin, target = args
+        wall = time.time()
+        cpu = cpu_time()
+        record = self._current
+        if record is not None:
+            record[1] += cpu - self._cpu_mark
+            record[2] += wall - self._wall_mark
+        if origin.dead:
+            self._finish(origin)
+        record = self._records.get(id(target))
+        if record is None:
+            record = self._new_record(target)
+        record[3] += 1
+        self._current = record
+        self._wall_mark = wall
+        self._cpu_mark = cpu
+
+    def _name_site(self, original):
+        """
+        Wraps GreenThread.main to name the site of each green thread
+        when it starts.
+
+        """
+        def main(gt, function, args, kwargs):
+            record = self._records.get(id(gt))
+            if record is not None:
+                record[0] = spawn_site(function)
+            return original(gt, function, args, kwargs)
+        return main
+
+    def start(self):
+        if self._patch is not None:
+            return
+        import eventlet.hubs
+        self._hub = eventlet.hubs.get_hub()
+        patch = Patch()
+        patch.add(self.main_target, self._name_site)
+        self._patch = patch
+        current = greenlet.getcurrent()
+        self._current = self._records.get(id(current)) or \
+            self._new_record(current)
+        self._wall_mark = time.time()
+        self._cpu_mark = cpu_time()
+        self._previous_trace = greenlet.settrace(self._trace)
+
+    def stop(self):
+        if self._patch is None:
+            return
+        greenlet.settrace(self._previous_trace)
+        self._previous_trace = None
+        self._patch.remove()
+        self._patch = None
+        # Live green threads are no longer followed
+        self._records = {}
+        self._current = None
+
+    def snapshot(self, reset=True):
+        # Charge the running green thread up to now
+        record = self._current
+        if record is not None:
+            wall = time.time()
+            cpu = cpu_time()
+            record[1] += cpu - self._cpu_mark
+            record[2] += wall - self._wall_mark
+            self._wall_mark = wall
+            self._cpu_mark = cpu
+
+        sites = dict((site, totals + [0])
+                     for site, totals in self._sites.iteritems())
+        for site, cpu, wall, switches, seen in self._records.itervalues():
+            totals = sites.get(site)
+            if totals is None:
+                totals = sites[site] = [0.0, 0.0, 0, 0, 0]
+            totals[0] += cpu
+            totals[1] += wall
+            totals[2] += switches
+            totals[4] += 1
+
+        now = time.time()
+        busiest = sorted(self._records.iteritems(),
+                         key=lambda item: item[1][1], reverse=True)
+        greenthreads = [
+            (ident, site, cpu, wall, switches, now - seen)
+            for ident, (site, cpu, wall, switches, seen)
+            in busiest[:self._max_greenthreads]
+        ]
+
+        if reset:
+            self._sites = {}
+            for record in self._records.itervalues():
+                record[1] = 0.0
+                record[2] = 0.0
+                record[3] = 0
+        return Document({
+            'site_fields': SITE_FIELDS,
+            'sites': dict((site, tuple(totals))
+                          for site, totals in sites.iteritems()),
+            'greenthread_fields': GREENTHREAD_FIELDS,
+            'greenthreads': greenthreads
+        })
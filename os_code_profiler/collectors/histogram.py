@@ -0,0 +1,265 @@
+"""
+Per function latency histograms.
+
+Histograms are log-linear, in the style of HdrHistogram. Latencies are
+recorded in whole microseconds. Values below 64 each get a bucket and
+every power of two above that is split into 32 equal buckets, so any
+recorded value is within about 3% of the bucket it lands in. Values
+from about 19 hours up share the last bucket.
+
+"""
+import array
+import time
+
+from os_code_profiler.collectors.base import Base, Document, load
+from os_code_profiler.collectors.instrument import Patch, targets
+
+# Sub buckets per power of two, as bits
+SUB_BITS = 5
+SUB_COUNT = 1 << SUB_BITS
+
+# Values below this are counted exactly
+LINEAR_LIMIT = SUB_COUNT << 1
+
+# Largest value in microseconds that gets a bucket of its own
+MAX_VALUE = (1 << 36) - 1
+
+BUCKETS = (MAX_VALUE.bit_length() - SUB_BITS) * SUB_COUNT + SUB_COUNT
+
+# Quantiles included in every dump
+QUANTILES = [('p50', 0.5), ('p99', 0.99), ('p999', 0.999)]
+
+
+def bucket_index(value):
+    """
+    Returns the bucket of a value.
+
+    @param value - Non negative integer microseconds
+    @returns - Integer
+
+    """
+    if value < LINEAR_LIMIT:
+        return value
+    if value > MAX_VALUE:
+        value = MAX_VALUE
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift << SUB_BITS) + (value >> shift)
+
+
+def bucket_lower(index):
+    """
+    Returns the smallest value counted by a bucket.
+
+    @param index - Integer
+    @returns - Integer microseconds
+
+    """
+    if index < LINEAR_LIMIT:
+        return index
+    shift = (index >> SUB_BITS) - 1
+    return (index - (shift << SUB_BITS)) << shift
+
+
+def bucket_upper(index):
+    """
+    Returns the largest value counted by a bucket.
+
+    @param index - Integer
+    @returns - Integer microseconds
+
+    """
+    return bucket_lower(index + 1) - 1
+
+
+class Histogram(object):
+    """
+    Fixed size latency histogram backed by an array of counts.
+    Recording is constant time.
+
+    """
+    def __init__(self):
+        self.counts = array.array('L', [0]) * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        """
+        Records one latency.
+
+        @param seconds - Float
+
+        """
+        value = int(seconds * 1000000)
+        if value < 0:
+            value = 0
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Adds the counts of another histogram into this one.
+
+        @param other - Histogram object
+        @returns - self
+
+        """
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """
+        Returns the value below which a fraction q of the recorded
+        values fall, as the upper bound of the bucket reaching it.
+
+        @param q - Float within [0, 1]
+        @returns - Float seconds or None if nothing was recorded
+
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(round(q * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_upper(index), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+    def to_dict(self):
+        """
+        Returns the histogram as plain values. Only buckets with counts
+        are kept. Quantiles are included for readers but are not needed
+        to load the histogram.
+
+        @returns - Dict
+
+        """
+        result = {
+            'count': self.count,
+            'sum': self.total,
+            'max': self.max,
+            'buckets': dict((index, count) for index, count
+                            in enumerate(self.counts) if count)
+        }
+        for name, q in QUANTILES:
+            result[name] = self.quantile(q)
+        return result
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Creates a histogram from a dictionary made by to_dict.
+
+        @param d - Dict
+        @returns - Histogram object
+
+        """
+        histogram = cls()
+        for index, count in d['buckets'].iteritems():
+            histogram.counts[index] += count
+        histogram.count = d['count']
+        histogram.total = d['sum']
+        histogram.max = d['max']
+        return histogram
+
+
+def merge_files(paths):
+    """
+    Merges histogram files from any number of processes and hosts.
+
+    @param paths - Iterable of file names
+    @returns - Tuple. ({function: Histogram object}, files merged, errors)
+
+    """
+    totals = {}
+    merged = 0
+    errors = 0
+    for path in paths:
+        try:
+            data, context = load(path)
+        except Exception:
+            errors += 1
+            continue
+        for function, d in data['functions'].iteritems():
+            histogram = Histogram.from_dict(d)
+            if function in totals:
+                totals[function].merge(histogram)
+            else:
+                totals[function] = histogram
+        merged += 1
+    return totals, merged, errors
+
+
+class HistogramCollector(Base):
+    """
+    Records the wall time of every call to an allowlist of functions.
+
+    Config keys:
+        functions - List or comma separated string of functions to time,
+            named module:function or module:Class.method. Wall time
+            includes time spent switched out to other green threads.
+
+    """
+
+    kind = 'histograms'
+
+    def __init__(self, config):
+        super(HistogramCollector, self).__init__(config)
+        self._functions = targets(config.get('functions'))
+        self._histograms = self._empty()
+        self._patch = None
+
+    def _empty(self):
+        return dict((function, Histogram()) for function in self._functions)
+
+    def _timed(self, function):
+        """
+        Returns a wrapper factory that records calls into the current
+        histogram of function.
+
+        """
+        def make_wrapper(original):
+            def wrapper(*args, **kwargs):
+                began = time.time()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self._histograms[function].record(time.time() - began)
+            return wrapper
+        return make_wrapper
+
+    def start(self):
+        if self._patch is not None:
+            return
+        patch = Patch()
+        try:
+            for function in self._functions:
+                patch.add(function, self._timed(function))
+        except Exception:
+            patch.remove()
+            raise
+        self._patch = patch
+
+    def stop(self):
+        if self._patch is not None:
+            self._patch.remove()
+            self._patch = None
+
+    def snapshot(self, reset=True):
+        histograms = self._histograms
+        if reset:
+            self._histograms = self._empty()
+        return Document({'functions': dict(
+            (function, histogram.to_dict())
+            for function, histogram in histograms.iteritems()
+        )})
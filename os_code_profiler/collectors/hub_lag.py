@@ -0,0 +1,173 @@
+"""
+Detects code blocking the eventlet hub.
+
+"""
+import collections
+import sys
+import time
+import traceback
+
+import eventlet
+
+from os_code_profiler.collectors.base import Base, Document
+from os_code_profiler.collectors.histogram import Histogram
+from os_code_profiler.common import utils
+from os_code_profiler.common.profiling import ConfigException
+
+
+class HubLagCollector(Base):
+    """
+    Measures how late the eventlet hub runs green threads.
+
+    A ticker green thread sleeps for period seconds over and over and
+    records how much later than asked it wakes up into a histogram. Any
+    green thread that holds on to the hub, with non green I/O or a long
+    cpu section, delays the ticker by as long as it blocks.
+
+    A native watchdog thread checks the ticker every check_interval
+    seconds. When the ticker is late by more than threshold seconds, the
+    hub's thread is still running the offending green thread, so the
+    watchdog captures that thread's stack. The stack is kept with the
+    total lag once the ticker wakes up, in a bounded ring buffer.
+
+    Config keys:
+        period - Seconds the ticker sleeps. Defaults to 0.1.
+        threshold - Seconds late after which the blocking stack is
+            captured. Defaults to 0.5.
+        check_interval - Seconds between watchdog checks. Defaults
+            to 0.1.
+        buffer_size - Stalls kept between dumps. Defaults to 20.
+
+    """
+
+    kind = 'hub_lag'
+
+    def __init__(self, config):
+        super(HubLagCollector, self).__init__(config)
+        self._period = float(config.get('period', 0.1))
+        self._threshold = float(config.get('threshold', 0.5))
+        self._check_interval = float(config.get('check_interval', 0.1))
+        if self._period <= 0 or self._threshold <= 0 or \
+                self._check_interval <= 0:
+            raise ConfigException(
+                "period, threshold and check_interval must be positive"
+            )
+        self._histogram = Histogram()
+        self._stalls = collections.deque(
+            maxlen=int(config.get('buffer_size', 20))
+        )
+        self._recorded = 0
+        self._pending = None
+        self._due = None
+        self._hub_ident = None
+        self._ticker = None
+        self._thread = None
+        self._wakeup = None
+
+    def _tick(self, lag):
+        """
+        Records one wake up of the ticker and files the stack captured
+        while it was late.
+
+        @param lag - Float seconds the ticker woke up late
+
+        """
+        self._histogram.record(lag)
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            del pending['due']
+            pending['lag'] = lag
+            self._stalls.append(pending)
+            self._recorded += 1
+
+    def _run_ticker(self):
+        """
+        Ticker green thread loop.
+
+        """
+        while True:
+            self._due = time.time() + self._period
+            eventlet.sleep(self._period)
+            lag = max(0.0, time.time() - self._due)
+            self._due = None
+            self._tick(lag)
+
+    def _check(self, now):
+        """
+        Captures the stack running on the hub's thread if the ticker is
+        late by more than the threshold. Called from the watchdog.
+
+        @param now - Float seconds
+        @returns - Boolean. True if a stack was captured.
+
+        """
+        due = self._due
+        if due is None or now - due <= self._threshold:
+            return False
+        if self._pending is not None and self._pending['due'] == due:
+            # Already captured for this stall
+            return False
+        frame = sys._current_frames().get(self._hub_ident)
+        if frame is None:
+            return False
+        self._pending = {
+            'due': due,
+            'started': utils.utc_seconds() - (now - due),
+            'stack': [tuple(entry)
+                      for entry in traceback.extract_stack(frame)]
+        }
+        return True
+
+    def _run_watchdog(self):
+        """
+        Native watchdog thread loop.
+
+        """
+        while not self._wakeup.wait(self._check_interval):
+            self._check(time.time())
+
+    def start(self):
+        if self._ticker is not None:
+            return
+        self._hub_ident = utils.original_module('thread').get_ident()
+        self._ticker = eventlet.spawn(self._run_ticker)
+        threading = utils.original_module('threading')
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run_watchdog,
+                                        name='os_code_profiler_watchdog')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._ticker is None:
+            return
+        self._ticker.kill()
+        self._ticker = None
+        self._due = None
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def snapshot(self, reset=True):
+        """
+        Returns the lag histogram and flushes the captured stalls.
+        Stalls are events, so they are flushed whether or not reset
+        is set.
+
+        @param reset - Boolean. Start a new histogram.
+        @returns - Document object
+
+        """
+        histogram = self._histogram
+        if reset:
+            self._histogram = Histogram()
+        stalls = list(self._stalls)
+        self._stalls.clear()
+        recorded = self._recorded
+        self._recorded = 0
+        return Document({
+            'lag': histogram.to_dict(),
+            'stalls': stalls,
+            'dropped': recorded - len(stalls),
+            'threshold': self._threshold
+        })
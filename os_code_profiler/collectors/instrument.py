@@ -0,0 +1,113 @@
+"""
+Wraps named functions and methods with instrumentation.
+
+Targets are named 'module:function' or 'module:Class.method'.
+
+"""
+import functools
+import importlib
+import inspect
+
+
+class InstrumentException(Exception):
+    """Simple instrument exception"""
+    pass
+
+
+def targets(value):
+    """
+    Returns a list of targets from a list or a comma separated string.
+
+    """
+    if not value:
+        return []
+    if isinstance(value, basestring):
+        value = value.split(',')
+    return [str(target).strip() for target in value if target.strip()]
+
+
+def resolve(target):
+    """
+    Finds the object holding a target and the target's attribute.
+
+    @param target - String. ex: 'nova.compute.manager:ComputeManager.run'
+    @returns - Tuple. (owner, attribute name, raw attribute value)
+
+    """
+    if ':' not in target:
+        raise InstrumentException(
+            "target %s must be module:function or module:Class.method" %
+            target
+        )
+    modulename, path = target.split(':', 1)
+    try:
+        owner = importlib.import_module(modulename)
+    except ImportError as e:
+        raise InstrumentException("cannot import %s: %s" % (modulename, e))
+    names = path.split('.')
+    try:
+        for name in names[:-1]:
+            owner = getattr(owner, name)
+        name = names[-1]
+        if inspect.isclass(owner):
+            # Read the class dictionary to keep static and class methods
+            for klass in inspect.getmro(owner):
+                if name in klass.__dict__:
+                    return owner, name, klass.__dict__[name]
+            raise AttributeError(name)
+        return owner, name, getattr(owner, name)
+    except AttributeError:
+        raise InstrumentException("cannot find %s" % target)
+
+
+def wrap(value, make_wrapper):
+    """
+    Wraps a raw attribute value, keeping it a static or class method.
+
+    @param value - Function, staticmethod or classmethod
+    @param make_wrapper - Callable taking a function and returning
+        its replacement
+    @returns - Replacement attribute value
+
+    """
+    if isinstance(value, (staticmethod, classmethod)):
+        return type(value)(wrap(value.__func__, make_wrapper))
+    if not callable(value):
+        raise InstrumentException("%r is not callable" % value)
+    return functools.wraps(value)(make_wrapper(value))
+
+
+class Patch(object):
+    """
+    Replaces targets with wrapped versions until removed.
+
+    """
+    def __init__(self):
+        self._patched = []
+
+    def add(self, target, make_wrapper):
+        """
+        Wraps target.
+
+        @param target - String. module:function or module:Class.method
+        @param make_wrapper - Callable taking the original function and
+            returning its replacement
+
+        """
+        owner, name, value = resolve(target)
+        had_own = inspect.isclass(owner) and name in owner.__dict__
+        setattr(owner, name, wrap(value, make_wrapper))
+        self._patched.append((owner, name, value, had_own))
+
+    def remove(self):
+        """
+        Restores every wrapped target, last wrapped first.
+
+        """
+        while self._patched:
+            owner, name, value, had_own = self._patched.pop()
+            if inspect.isclass(owner) and not had_own:
+                # The method was inherited. Uncover it again.
+                delattr(owner, name)
+            else:
+                setattr(owner, name, value)
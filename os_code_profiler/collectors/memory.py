@@ -0,0 +1,204 @@
+"""
+Tracks where memory is allocated and how it grows between dumps.
+
+"""
+import gc
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from os_code_profiler.collectors.base import Base, LazyDocument
+from os_code_profiler.common import utils
+from os_code_profiler.common.profiling import ConfigException
+
+# Order of the counters of each site in a dump
+SITE_FIELDS = ['site', 'size', 'count']
+
+# Multiplicative hashing of object addresses, which are aligned and
+# allocated in runs, to sample objects evenly
+_hash_multiplier = 2654435761
+_hash_range = 2 ** 32
+
+# Objects visited between yields of the interpreter lock when counting
+# types, so the census does not starve the service's threads
+_slice = 10000
+
+
+def _top(sites, n, key):
+    """
+    Returns the n sites with the largest key as (site, size, count)
+    tuples.
+
+    """
+    ordered = sorted(sites.iteritems(), key=key, reverse=True)
+    return [(site, size, count) for site, (size, count) in ordered[:n]]
+
+
+class MemoryCollector(Base):
+    """
+    Records where live memory is held, by allocation site or by type,
+    and its growth since the previous dump.
+
+    Two modes are available:
+        tracemalloc - Live allocations grouped by the stack that made
+            them, up to depth frames. Sites are lists of (filename,
+            lineno). Needs the tracemalloc module, which is built into
+            python 3 and available as pytracemalloc for python 2.
+        types - A census of the live objects tracked by the garbage
+            collector, grouped by type. Sites are type names rather than
+            allocation sites, and depth has no effect. Strings, numbers
+            and other objects that cannot hold references are not
+            counted. Python 2.7 also stops tracking dicts and tuples
+            that only hold such atomic values, so most growth of those
+            types is not seen. Every tracked object is visited on each
+            dump. With sample_every, about one object in sample_every is
+            measured, chosen by its address so that an object stays in
+            or out of the sample across dumps and growth compares the
+            same objects, and the totals are scaled up. This saves the
+            measuring, not the walk.
+
+    Both modes capture on the dumper's green thread only what must be
+    taken at the end of the interval. Grouping, and the whole census in
+    types mode, happen when the writer thread writes the document. The
+    census yields the interpreter lock every _slice objects so the
+    service keeps running, although listing the objects is one call
+    that holds it.
+
+    Config keys:
+        mode - tracemalloc|types. Defaults to tracemalloc when the module
+            is importable, otherwise types.
+        depth - Frames kept for each allocation in tracemalloc mode.
+            Defaults to 10.
+        top_n - Sites listed by size and by growth. Defaults to 20.
+        sample_every - Objects per measured object in types mode.
+            Defaults to 1.
+
+    """
+
+    kind = 'memory'
+
+    valid_modes = ['tracemalloc', 'types']
+
+    def __init__(self, config):
+        super(MemoryCollector, self).__init__(config)
+        default_mode = 'types' if tracemalloc is None else 'tracemalloc'
+        self._mode = str(config.get('mode', default_mode)).lower()
+        if self._mode not in self.valid_modes:
+            raise ConfigException("mode must be tracemalloc|types")
+        if self._mode == 'tracemalloc' and tracemalloc is None:
+            raise ConfigException("tracemalloc is not available")
+        self._depth = int(config.get('depth', 10))
+        self._top_n = int(config.get('top_n', 20))
+        self._sample_every = int(config.get('sample_every', 1))
+        if self._depth < 1 or self._top_n < 1 or self._sample_every < 1:
+            raise ConfigException(
+                "depth, top_n and sample_every must be at least 1"
+            )
+        self._previous = None
+        self._started_tracing = False
+
+    def _tracemalloc_sites(self, snapshot):
+        """
+        Returns {site: (size, count)} of live traced allocations.
+
+        @param snapshot - tracemalloc.Snapshot object
+
+        """
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__)
+        ])
+        sites = {}
+        for stat in snapshot.statistics('traceback'):
+            site = tuple((frame.filename, frame.lineno)
+                         for frame in stat.traceback)
+            sites[site] = (stat.size, stat.count)
+        return sites
+
+    def _type_sites(self):
+        """
+        Returns {type name: (size, count)} of a sample of the objects
+        tracked by the garbage collector.
+
+        """
+        every = self._sample_every
+        # The census runs on the writer's native thread
+        sleep = utils.original_module('time').sleep
+        # Objects whose mixed address falls below this are sampled
+        limit = _hash_range // every
+        objects = gc.get_objects()
+        sizes = {}
+        for index, obj in enumerate(objects):
+            if not index % _slice:
+                sleep(0)
+            if every > 1 and \
+                    (id(obj) >> 3) * _hash_multiplier % _hash_range >= limit:
+                continue
+            cls = type(obj)
+            name = '%s.%s' % (cls.__module__, cls.__name__)
+            counters = sizes.get(name)
+            if counters is None:
+                counters = sizes[name] = [0, 0]
+            counters[0] += sys.getsizeof(obj, 0)
+            counters[1] += 1
+        del objects
+        return dict((name, (size * every, count * every))
+                    for name, (size, count) in sizes.iteritems())
+
+    def start(self):
+        if self._mode == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start(self._depth)
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def snapshot(self, reset=True):
+        """
+        Captures the live allocations, to be measured by the writer
+        thread. Growth is always measured from the previous document
+        that was written.
+
+        @param reset - Boolean. Ignored.
+        @returns - LazyDocument object
+
+        """
+        if self._mode == 'tracemalloc':
+            snapshot = tracemalloc.take_snapshot()
+            return LazyDocument(
+                lambda: self._measure(self._tracemalloc_sites(snapshot))
+            )
+        return LazyDocument(lambda: self._measure(self._type_sites()))
+
+    def _measure(self, sites):
+        """
+        Returns the data of a dump and keeps sites for the next one.
+
+        @param sites - Dict. {site: (size, count)}
+        @returns - Dict
+
+        """
+        growth = []
+        if self._previous is not None:
+            previous = self._previous
+            changes = {}
+            for site, (size, count) in sites.iteritems():
+                old_size, old_count = previous.get(site, (0, 0))
+                if size > old_size:
+                    changes[site] = (size - old_size, count - old_count)
+            growth = _top(changes, self._top_n,
+                          key=lambda item: item[1][0])
+        self._previous = sites
+
+        return {
+            'mode': self._mode,
+            'site_fields': SITE_FIELDS,
+            'size': sum(size for size, count in sites.itervalues()),
+            'count': sum(count for size, count in sites.itervalues()),
+            'top': _top(sites, self._top_n, key=lambda item: item[1][0]),
+            'growth': growth
+        }
@@ -0,0 +1,164 @@
+"""
+Captures calls that run longer than a threshold.
+
+"""
+import collections
+import sys
+import time
+import traceback
+
+from os_code_profiler.collectors.base import Base, Document
+from os_code_profiler.collectors.instrument import Patch, targets
+from os_code_profiler.common import utils
+
+
+def summarize(value, limit):
+    """
+    Returns a repr of value cut to limit characters.
+
+    @param value - Object
+    @param limit - Integer
+    @returns - String
+
+    """
+    try:
+        text = repr(value)
+    except Exception:
+        text = '<%s>' % type(value).__name__
+    if len(text) > limit:
+        text = text[:limit - 3] + '...'
+    return text
+
+
+class SlowCallCollector(Base):
+    """
+    Records each call to a configured function that takes longer than
+    the function's threshold, with the stack of the green thread that
+    made it, a summary of its arguments and its timing.
+
+    Calls are kept in a bounded ring buffer. When it is full the oldest
+    calls are dropped. Every dump flushes the buffer, so each call is
+    written once.
+
+    A fast call costs two timestamps and a comparison.
+
+    Config keys:
+        functions - Dictionary of function to threshold in seconds, or
+            a list or comma separated string of functions using the
+            default threshold. Functions are named module:function or
+            module:Class.method.
+        threshold - Default threshold in seconds. Defaults to 1.
+        buffer_size - Calls kept between dumps. Defaults to 100.
+        max_arg_length - Characters kept of each argument's repr.
+            Defaults to 80.
+
+    """
+
+    kind = 'slow_calls'
+
+    def __init__(self, config):
+        super(SlowCallCollector, self).__init__(config)
+        threshold = float(config.get('threshold', 1.0))
+        functions = config.get('functions')
+        if isinstance(functions, dict):
+            self._thresholds = dict(
+                (str(function).strip(), float(seconds))
+                for function, seconds in functions.iteritems()
+            )
+        else:
+            self._thresholds = dict(
+                (function, threshold) for function in targets(functions)
+            )
+        self._buffer_size = int(config.get('buffer_size', 100))
+        self._max_arg_length = int(config.get('max_arg_length', 80))
+        self._calls = collections.deque(maxlen=self._buffer_size)
+        self._recorded = 0
+        self._patch = None
+
+    def _record(self, function, duration, args, kwargs, error, frame):
+        """
+        Adds a slow call to the buffer.
+
+        @param function - String target name
+        @param duration - Float seconds
+        @param args - Tuple of positional arguments
+        @param kwargs - Dict of keyword arguments
+        @param error - Exception type name or None
+        @param frame - Frame that made the call
+
+        """
+        limit = self._max_arg_length
+        arguments = [summarize(arg, limit) for arg in args]
+        arguments.extend('%s=%s' % (name, summarize(value, limit))
+                         for name, value in sorted(kwargs.iteritems()))
+        self._calls.append({
+            'function': function,
+            'started': utils.utc_seconds() - duration,
+            'duration': duration,
+            'args': arguments,
+            'error': error,
+            'stack': [tuple(entry)
+                      for entry in traceback.extract_stack(frame)]
+        })
+        self._recorded += 1
+
+    def _timed(self, function):
+        """
+        Returns a wrapper factory that records calls to function slower
+        than its threshold.
+
+        """
+        threshold = self._thresholds[function]
+
+        def make_wrapper(original):
+            def wrapper(*args, **kwargs):
+                began = time.time()
+                error = None
+                try:
+                    return original(*args, **kwargs)
+                except BaseException as e:
+                    error = type(e).__name__
+                    raise
+                finally:
+                    duration = time.time() - began
+                    if duration > threshold:
+                        self._record(function, duration, args, kwargs,
+                                     error, sys._getframe(1))
+            return wrapper
+        return make_wrapper
+
+    def start(self):
+        if self._patch is not None:
+            return
+        patch = Patch()
+        try:
+            for function in sorted(self._thresholds):
+                patch.add(function, self._timed(function))
+        except Exception:
+            patch.remove()
+            raise
+        self._patch = patch
+
+    def stop(self):
+        if self._patch is not None:
+            self._patch.remove()
+            self._patch = None
+
+    def snapshot(self, reset=True):
+        """
+        Flushes the buffered calls. Calls are events, so they are
+        flushed whether or not reset is set.
+
+        @param reset - Boolean. Ignored.
+        @returns - Document object
+
+        """
+        calls = list(self._calls)
+        self._calls.clear()
+        recorded = self._recorded
+        self._recorded = 0
+        return Document({
+            'calls': calls,
+            'dropped': recorded - len(calls),
+            'thresholds': self._thresholds
+        })
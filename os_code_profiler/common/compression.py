@@ -0,0 +1,298 @@
+import bz2
+import marshal
+import struct
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# Bytes read or written at a time when streaming
+chunk_size = 64 * 1024
+
+# Marshal version of objects written through a CompressedWriter. Unlike
+# later versions, version 0 never refers back to strings written by an
+# earlier call, so separately marshalled objects can be read together.
+marshal_version = 0
+
+
+class CompressionException(Exception):
+    """Simple compression exception"""
+    pass
+
+
+class Method(object):
+    """
+    Describes a stdlib compression method.
+
+    """
+    def __init__(self, name, extension, magic, levels, default_level,
+                 compressor, decompressor):
+        """
+        @param name - String
+        @param extension - String file name suffix. ex: '.gz'
+        @param magic - String. First bytes of compressed data.
+        @param levels - Tuple. (lowest, highest) integer levels accepted
+        @param default_level - Integer
+        @param compressor - Callable taking a level and returning an
+            object with compress and flush methods.
+        @param decompressor - Callable returning an object with a
+            decompress method.
+
+        """
+        self.name = name
+        self.extension = extension
+        self.magic = magic
+        self.levels = levels
+        self.default_level = default_level
+        self.compressor = compressor
+        self.decompressor = decompressor
+
+    def level(self, level):
+        """
+        Returns a configured level as an integer, or the default level.
+
+        @param level - Integer, string or None
+        @returns - Integer
+        @raises CompressionException if the level is not accepted
+
+        """
+        if level is None:
+            return self.default_level
+        try:
+            level = int(level)
+        except (TypeError, ValueError):
+            raise CompressionException(
+                "compression_level must be an integer"
+            )
+        lowest, highest = self.levels
+        if not lowest <= level <= highest:
+            raise CompressionException(
+                "compression_level for %s must be within [%s, %s]" %
+                (self.name, lowest, highest)
+            )
+        return level
+
+
+methods = {
+    'gzip': Method(
+        'gzip', '.gz', '\x1f\x8b', (0, 9), 6,
+        lambda level: zlib.compressobj(level, zlib.DEFLATED, 31),
+        lambda: zlib.decompressobj(31)
+    ),
+    'zlib': Method(
+        'zlib', '.zlib', '\x78', (0, 9), 6,
+        lambda level: zlib.compressobj(level),
+        zlib.decompressobj
+    ),
+    'bz2': Method(
+        'bz2', '.bz2', 'BZh', (1, 9), 9,
+        bz2.BZ2Compressor,
+        bz2.BZ2Decompressor
+    )
+}
+if lzma is not None:
+    methods['lzma'] = Method(
+        'lzma', '.xz', '\xfd7zXZ\x00', (0, 9), 6,
+        lambda level: lzma.LZMACompressor(preset=level),
+        lzma.LZMADecompressor
+    )
+
+
+def get_method(name):
+    """
+    Returns the method with name.
+
+    @param name - String
+    @returns - Method object
+    @raises CompressionException if the method is not available
+
+    """
+    try:
+        return methods[name]
+    except KeyError:
+        raise CompressionException(
+            "compression must be one of %s" % '|'.join(sorted(methods))
+        )
+
+
+def detect(head):
+    """
+    Returns the method that compressed data starting with head.
+
+    @param head - String. At least the first 6 bytes of the data.
+    @returns - Method object or None for uncompressed data
+
+    """
+    for method in methods.itervalues():
+        if head.startswith(method.magic):
+            return method
+    return None
+
+
+class CompressedWriter(object):
+    """
+    File like object that compresses everything written to it into
+    another open file. finish must be called once everything has been
+    written.
+
+    """
+    def __init__(self, f, method, level=None):
+        """
+        @param f - File object opened for binary writing
+        @param method - Method object
+        @param level - Optional integer compression level
+
+        """
+        if level is None:
+            level = method.default_level
+        self._f = f
+        self._compressor = method.compressor(level)
+
+    def write(self, data):
+        self._f.write(self._compressor.compress(data))
+
+    def finish(self):
+        self._f.write(self._compressor.flush())
+
+
+def compress_file(src, dst, method, level=None):
+    """
+    Compresses the file src into the file dst.
+
+    @param src - String
+    @param dst - String
+    @param method - Method object
+    @param level - Optional integer compression level
+
+    """
+    with open(src, 'rb') as f_in:
+        with open(dst, 'wb') as f_out:
+            writer = CompressedWriter(f_out, method, level)
+            for chunk in iter(lambda: f_in.read(chunk_size), ''):
+                writer.write(chunk)
+            writer.finish()
+
+
+def _tuple_header(count):
+    """
+    Returns the marshal encoding that starts a tuple of count objects.
+
+    """
+    return '(' + struct.pack('<i', count)
+
+
+def _open(path):
+    """
+    Opens a file and detects how it was compressed.
+
+    @returns - Tuple. (file object at the start, Method object or None)
+
+    """
+    f = open(path, 'rb')
+    head = f.read(6)
+    f.seek(0)
+    method = detect(head)
+    if method is None and lzma is None and head == '\xfd7zXZ\x00':
+        f.close()
+        raise CompressionException("lzma is not available")
+    return f, method
+
+
+def _decompressed_chunks(f, method):
+    """
+    Yields the decompressed data of f a chunk at a time.
+
+    """
+    decompressor = method.decompressor()
+    for chunk in iter(lambda: f.read(chunk_size), ''):
+        yield decompressor.decompress(chunk)
+    if hasattr(decompressor, 'flush'):
+        yield decompressor.flush()
+
+
+def read_head(path, size):
+    """
+    Returns the first bytes of a file's data, decompressing only as
+    much as needed.
+
+    @param path - String
+    @param size - Integer bytes
+    @returns - String. Shorter than size for short files.
+    @raises CompressionException if the method used is not available
+
+    """
+    f, method = _open(path)
+    with f:
+        if method is None:
+            return f.read(size)
+        head = ''
+        for data in _decompressed_chunks(f, method):
+            head += data
+            if len(head) >= size:
+                break
+        return head[:size]
+
+
+def read(path):
+    """
+    Reads all of a file's data into memory, decompressing it if needed.
+
+    @param path - String
+    @returns - String
+    @raises CompressionException if the method used is not available
+
+    """
+    f, method = _open(path)
+    with f:
+        if method is None:
+            return f.read()
+        return ''.join(_decompressed_chunks(f, method))
+
+
+def load_marshal(path, count):
+    """
+    Loads objects marshalled one after another into a file that may be
+    compressed.
+
+    Uncompressed files are read by marshal directly. Compressed files
+    are decompressed into memory and framed as a marshalled tuple, so
+    that all the objects are read in one call without a real file.
+    This relies on the objects having been written with
+    marshal_version, which never refers back to strings of an earlier
+    object.
+
+    @param path - String
+    @param count - Integer most objects to load
+    @returns - List of objects. Shorter than count for files holding
+        fewer objects.
+    @raises EOFError if the file holds no object
+    @raises CompressionException if the method used is not available
+
+    """
+    f, method = _open(path)
+    with f:
+        if method is None:
+            objects = []
+            while len(objects) < count:
+                try:
+                    objects.append(marshal.load(f))
+                except EOFError:
+                    if not objects:
+                        raise
+                    break
+            return objects
+        data = ''.join([_tuple_header(count)] +
+                       list(_decompressed_chunks(f, method)))
+    while True:
+        try:
+            return list(marshal.loads(data))
+        except EOFError:
+            count -= 1
+            if not count:
+                raise
+            data = _tuple_header(count) + data[len(_tuple_header(0)):]
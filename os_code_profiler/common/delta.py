@@ -0,0 +1,164 @@
+from stats import Stats
+
+
+def diff_callers(current, previous):
+    """
+    Returns the callers whose counters changed, with the change.
+
+    @param current - Dict. {caller_key: (cc, nc, tt, ct)}
+    @param previous - Dict. {caller_key: (cc, nc, tt, ct)}
+    @returns - Dict
+
+    """
+    changed = {}
+    for func, counters in current.iteritems():
+        old = previous.get(func)
+        if old is None:
+            changed[func] = counters
+        elif old != counters:
+            changed[func] = tuple([i[0] - i[1] for i in zip(counters, old)])
+    return changed
+
+
+def diff(current, previous):
+    """
+    Returns the functions whose counters changed between two cumulative
+    pstats style dictionaries, with only the change. Functions that did
+    not change are left out.
+
+    @param current - Dict. {func: (cc, nc, tt, ct, callers)}
+    @param previous - Dict. {func: (cc, nc, tt, ct, callers)}
+    @returns - Dict
+
+    """
+    changed = {}
+    for func, entry in current.iteritems():
+        old = previous.get(func)
+        if old is None:
+            changed[func] = entry
+        elif old != entry:
+            changed[func] = (
+                entry[0] - old[0], entry[1] - old[1],
+                entry[2] - old[2], entry[3] - old[3],
+                diff_callers(entry[4], old[4])
+            )
+    return changed
+
+
+def was_reset(current, previous):
+    """
+    Returns whether cumulative counters went back since previous, as
+    they do when the profiler is restarted or cleared. Counters only
+    grow, so any function with fewer calls or less own time than before,
+    or any function missing, means a reset.
+
+    @param current - Dict. {func: (cc, nc, tt, ct, callers)}
+    @param previous - Dict. {func: (cc, nc, tt, ct, callers)}
+    @returns - Boolean
+
+    """
+    if len(current) < len(previous):
+        return True
+    for func, old in previous.iteritems():
+        entry = current.get(func)
+        if entry is None or entry[1] < old[1] or entry[2] < old[2]:
+            return True
+    return False
+
+
+class DeltaEncoder(object):
+    """
+    Writer transform that turns cumulative snapshots into deltas.
+
+    The counters of the last snapshot it saw are kept, keyed by
+    (module, lineno, name), and each new snapshot is replaced by only the
+    functions that changed since then. The first snapshot, and any
+    snapshot taken after the profiler's counters were reset, is emitted
+    whole as a new base.
+
+    Each context is tagged in metadata['delta'] with:
+        sequence - 0 for a base, then 1, 2, ... for each following delta
+        base_started - Start of the cumulative counters
+
+    and its start is moved to the end of the previous snapshot, so files
+    from one process cover consecutive windows even if the writer
+    dropped a snapshot in between.
+
+    """
+    def __init__(self):
+        self._previous = None
+        self._previous_ended = None
+        self._base_started = None
+        self._sequence = 0
+
+    def __call__(self, ctx, stats):
+        """
+        @param ctx - Context object. Updated in place.
+        @param stats - Stats or Snapshot object of cumulative counters
+        @returns - Stats object
+
+        """
+        if not isinstance(stats, Stats):
+            stats = stats.stats()
+        current = stats.stats
+
+        if self._previous is None or was_reset(current, self._previous):
+            self._sequence = 0
+            self._base_started = ctx.started
+            changed = current
+        else:
+            self._sequence += 1
+            ctx.started = self._previous_ended
+            changed = diff(current, self._previous)
+
+        ctx.metadata['delta'] = {
+            'sequence': self._sequence,
+            'base_started': self._base_started
+        }
+        self._previous = current
+        self._previous_ended = ctx.ended
+        return Stats(changed)
+
+
+class DeltaSequenceException(Exception):
+    """Raised when a chain of deltas is missing a file."""
+    pass
+
+
+def accumulate(files):
+    """
+    Rebuilds cumulative stats from the delta files of one process.
+
+    @param files - Iterable of Stats objects with contexts, in the order
+        they were written.
+    @returns - Generator of Stats objects. The cumulative view as of
+        each file, with that file's context.
+    @raises DeltaSequenceException if a delta is missing from the chain
+
+    """
+    cumulative = None
+    expected = 0
+    for stats in files:
+        delta = stats.context['metadata'].get('delta')
+        if delta is None:
+            # A regular file is already cumulative or cleared
+            cumulative = Stats(dict(stats.stats))
+            expected = None
+        elif delta['sequence'] == 0:
+            cumulative = Stats(dict(stats.stats))
+            expected = 1
+        elif expected is None or delta['sequence'] != expected:
+            raise DeltaSequenceException(
+                "expected delta %s but found %s at %s" %
+                (expected, delta['sequence'], stats.context['ended'])
+            )
+        else:
+            cumulative.add(stats)
+            expected += 1
+
+        context = dict(stats.context)
+        if delta is not None:
+            context['started'] = delta['base_started']
+            context['metadata'] = dict(context['metadata'])
+            del context['metadata']['delta']
+        yield Stats(dict(cumulative.stats), context)
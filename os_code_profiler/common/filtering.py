@@ -0,0 +1,122 @@
+import fnmatch
+import os
+import sys
+
+from stats import Stats
+
+_source_extensions = ['.py', '.pyc', '.pyo']
+
+
+def _matches(module, patterns):
+    """
+    Returns whether module matches any pattern. A pattern matches its
+    module name as a glob and every module in the package it names.
+
+    """
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(module, pattern) or \
+                module.startswith(pattern + '.'):
+            return True
+    return False
+
+
+class ModuleFilter(object):
+    """
+    Decides which functions are kept by the module they are defined in.
+
+    Profilers only know the file name of each function, so file names
+    are converted to module names by removing the longest sys.path entry
+    they are under. The decision is cached per file name, so checking a
+    frame costs a single dictionary lookup once its file has been seen.
+
+    Patterns are globs such as 'nova.*'. A plain name such as 'nova'
+    matches the package and everything in it. Functions without a file,
+    such as builtins, only pass when no include patterns are given.
+
+    """
+    def __init__(self, include=None, exclude=None, paths=None):
+        """
+        @param include - Optional list of module patterns to keep.
+            Everything is kept when empty.
+        @param exclude - Optional list of module patterns to drop.
+            Applied after include.
+        @param paths - Optional list of import paths. Defaults to
+            sys.path.
+
+        """
+        self._include = list(include or [])
+        self._exclude = list(exclude or [])
+        if paths is None:
+            paths = sys.path
+        self._paths = sorted(
+            set(os.path.abspath(path) for path in paths if path),
+            key=len, reverse=True
+        )
+        self._cache = {}
+
+    def module_name(self, filename):
+        """
+        Returns the dotted module name for a source file name.
+
+        @param filename - String
+        @returns - String
+
+        """
+        path = os.path.abspath(filename)
+        relative = None
+        for root in self._paths:
+            if path.startswith(root + os.sep):
+                relative = path[len(root) + 1:]
+                break
+        if relative is None:
+            relative = os.path.basename(filename)
+        base, extension = os.path.splitext(relative)
+        if extension in _source_extensions:
+            relative = base
+        parts = relative.split(os.sep)
+        if len(parts) > 1 and parts[-1] == '__init__':
+            parts.pop()
+        return '.'.join(parts)
+
+    def __call__(self, filename):
+        """
+        Returns whether functions defined in filename are kept.
+
+        @param filename - String
+        @returns - Boolean
+
+        """
+        keep = self._cache.get(filename)
+        if keep is None:
+            module = self.module_name(filename)
+            keep = (not self._include or _matches(module, self._include)) \
+                and not _matches(module, self._exclude)
+            self._cache[filename] = keep
+        return keep
+
+    def filter_stats(self, stats):
+        """
+        Returns stats with only the kept functions and the callers
+        among them.
+
+        @param stats - Stats or Snapshot object
+        @returns - Stats object
+
+        """
+        if not isinstance(stats, Stats):
+            stats = stats.stats()
+        result = {}
+        traced_calls = 0
+        for func, (cc, nc, tt, ct, callers) in stats.stats.iteritems():
+            traced_calls += nc
+            if not self(func[0]):
+                continue
+            kept = dict((caller, counters)
+                        for caller, counters in callers.iteritems()
+                        if self(caller[0]))
+            result[func] = (cc, nc, tt, ct, kept)
+        filtered = Stats(result, stats.context)
+        filtered.traced_calls = traced_calls
+        if stats.traced_calls is not None:
+            filtered.traced_calls = stats.traced_calls
+        return filtered
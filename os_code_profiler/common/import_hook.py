@@ -0,0 +1,182 @@
+"""
+Decorates modules as they are imported.
+
+Services can be profiled without changing their code by installing the
+hook from the environment, for instance from a .pth file in the
+service's site-packages:
+
+    import os_code_profiler.common.import_hook as h; h.install_from_env()
+
+install_from_env reads the JSON file named by OS_CODE_PROFILER_CONFIG:
+
+    {
+        "modules": {
+            "nova.openstack.common.service": {
+                "decorator": "nova_service",
+                "config": {"interval": 300, "outputs": {...}}
+            }
+        }
+    }
+
+Each module name maps to a decorator, by short name or by the full path
+of a decorator instance, and the config passed to it. Nothing else is
+imported unless the variable is set.
+
+"""
+import os
+import sys
+
+# Environment variable naming the config file
+ENV_VAR = 'OS_CODE_PROFILER_CONFIG'
+
+# Short names for the bundled decorators
+decorators = {
+    'nova_service': 'os_code_profiler.decorators.nova.Service'
+}
+
+
+class ImportHookException(Exception):
+    """Simple import hook exception"""
+    pass
+
+
+class ImportHook(object):
+    """
+    sys.meta_path finder that decorates target modules once they are
+    imported.
+
+    Imports of other modules only cost a dictionary lookup. A target is
+    imported by the regular machinery and then passed to its decorator,
+    which is loaded with the PluginLoader on first use. A decorator that
+    fails leaves the module as it was imported. The exception is logged
+    and kept in errors.
+
+    """
+    def __init__(self, modules):
+        """
+        @param modules - Dictionary of module name to a dictionary with
+            decorator and optional config.
+
+        """
+        self._targets = {}
+        for name, target in modules.iteritems():
+            if 'decorator' not in target:
+                raise ImportHookException(
+                    "module %s needs a decorator" % name
+                )
+            decorator = str(target['decorator'])
+            self._targets[str(name)] = (
+                decorators.get(decorator, decorator),
+                dict(target.get('config') or {})
+            )
+        self._loading = set()
+        self.errors = {}
+
+    def find_module(self, fullname, path=None):
+        """
+        Claims the import of a target module.
+
+        @param fullname - String
+        @param path - Ignored
+        @returns - self for targets, otherwise None
+
+        """
+        if fullname in self._targets and fullname not in self._loading:
+            return self
+        return None
+
+    def load_module(self, fullname):
+        """
+        Imports a target module and decorates it.
+
+        @param fullname - String
+        @returns - Module
+
+        """
+        module = sys.modules.get(fullname)
+        if module is None:
+            import importlib
+            self._loading.add(fullname)
+            try:
+                module = importlib.import_module(fullname)
+            finally:
+                self._loading.discard(fullname)
+        return self.decorate(fullname, module)
+
+    def decorate(self, fullname, module):
+        """
+        Passes a target module to its decorator.
+
+        @param fullname - String
+        @param module - Module
+        @returns - Decorated module
+
+        """
+        decorator, config = self._targets[fullname]
+        try:
+            from os_code_profiler.common.utils import PluginLoader
+            decorated = PluginLoader().find(decorator)(module, config)
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).exception(
+                "Failed to decorate %s with %s", fullname, decorator
+            )
+            self.errors[fullname] = e
+            return module
+        sys.modules[fullname] = decorated
+        return decorated
+
+    def install(self):
+        """
+        Adds the hook to sys.meta_path and decorates targets that were
+        already imported.
+
+        """
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+        for fullname in self._targets:
+            module = sys.modules.get(fullname)
+            if module is not None:
+                self.decorate(fullname, module)
+
+    def uninstall(self):
+        """
+        Removes the hook from sys.meta_path.
+
+        """
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+
+def install(modules):
+    """
+    Installs an import hook for modules.
+
+    @param modules - Dictionary of module name to a dictionary with
+        decorator and optional config.
+    @returns - ImportHook object
+
+    """
+    hook = ImportHook(modules)
+    hook.install()
+    return hook
+
+
+def install_from_env(environ=None):
+    """
+    Installs an import hook configured by the file named in
+    OS_CODE_PROFILER_CONFIG, if it is set.
+
+    @param environ - Optional dictionary. Defaults to os.environ.
+    @returns - ImportHook object or None
+
+    """
+    if environ is None:
+        environ = os.environ
+    path = environ.get(ENV_VAR)
+    if not path:
+        return None
+    import json
+    with open(path) as f:
+        config = json.load(f)
+    return install(config.get('modules', {}))
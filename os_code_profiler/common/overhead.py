@@ -0,0 +1,153 @@
+from sampling import cpu_time
+from stats import Stats
+
+# Calls timed with and without the profiler when calibrating
+calibration_calls = 100000
+
+
+def _noop():
+    pass
+
+
+def _call(n):
+    for i in xrange(n):
+        _noop()
+
+
+def calibrate(backend, calls=calibration_calls):
+    """
+    Estimates the cpu time the backend adds to each profiled call by
+    timing a loop of calls with and without it. Stats recorded while
+    calibrating are cleared.
+
+    @param backend - Backend object that is not running
+    @param calls - Integer number of calls to time
+    @returns - Float seconds per call
+
+    """
+    began = cpu_time()
+    _call(calls)
+    plain = cpu_time() - began
+
+    backend.start()
+    try:
+        began = cpu_time()
+        _call(calls)
+        profiled = cpu_time() - began
+    finally:
+        backend.stop()
+        backend.clear_stats()
+    return max(0.0, (profiled - plain) / calls)
+
+
+class OverheadBudget(object):
+    """
+    Keeps the cost of profiling under a percentage of the process's cpu.
+
+    The cost of each interval is estimated as:
+
+        calls traced * calibrated cost per call
+        + cpu time spent capturing the snapshot on the service's thread
+        + time the writer spent on the previous snapshot
+
+    and compared to the cpu time the process used during the interval.
+    Instances are writer transforms that do this and record the result
+    in metadata['overhead']. Calls dropped by a module filter are
+    counted from Stats.traced_calls, because they were traced all the
+    same. The budget must therefore see the stats before other
+    transforms rebuild them.
+
+    The fraction of intervals profiled is then set so the average cost
+    stays under the budget. The dumper asks should_profile before each
+    interval, and intervals that are skipped are not profiled or dumped.
+
+    """
+
+    # Weight of the latest measurement in the running average
+    smoothing = 0.5
+
+    def __init__(self, max_overhead_pct, per_call=0.0, cumulative=False):
+        """
+        @param max_overhead_pct - Float percentage of cpu
+        @param per_call - Float seconds each profiled call costs
+        @param cumulative - Boolean. Whether measured stats keep counting
+            from earlier intervals.
+
+        """
+        self.max_overhead_pct = max_overhead_pct
+        self.per_call = per_call
+        self.fraction = 1.0
+        self._cumulative = cumulative
+        self._previous_calls = 0
+        self._average_pct = None
+        self._credit = 0.0
+
+    def should_profile(self):
+        """
+        Returns whether the next interval should be profiled, spreading
+        the profiled intervals evenly.
+
+        @returns - Boolean
+
+        """
+        self._credit += self.fraction
+        if self._credit >= 1.0:
+            self._credit -= 1.0
+            return True
+        return False
+
+    def __call__(self, ctx, stats):
+        """
+        Records the estimated overhead of the interval in
+        ctx.metadata['overhead'] and updates the fraction.
+
+        ctx.metadata['overhead'] must already hold 'dump' and 'cpu'
+        seconds measured by the dumper.
+
+        @param ctx - Context object
+        @param stats - Stats or Snapshot object
+        @returns - Stats object
+
+        """
+        if not isinstance(stats, Stats):
+            stats = stats.stats()
+        calls = stats.traced_calls
+        if calls is None:
+            calls = sum(entry[1] for entry in stats.stats.itervalues())
+        if self._cumulative:
+            total = calls
+            if calls >= self._previous_calls:
+                calls -= self._previous_calls
+            self._previous_calls = total
+
+        overhead = ctx.metadata.setdefault('overhead', {})
+        write = ctx.metadata.get('writer', {}).get('last_latency') or 0.0
+        tracing = calls * self.per_call
+        seconds = tracing + overhead.get('dump', 0.0) + write
+        cpu = overhead.get('cpu', 0.0)
+        pct = 0.0
+        if cpu > 0:
+            pct = 100.0 * seconds / cpu
+
+        fraction = self.fraction
+        if self._average_pct is None:
+            self._average_pct = pct
+        else:
+            self._average_pct += self.smoothing * (pct - self._average_pct)
+        if self._average_pct > self.max_overhead_pct:
+            self.fraction = self.max_overhead_pct / self._average_pct
+        else:
+            self.fraction = 1.0
+
+        overhead.update({
+            'calls': calls,
+            'per_call': self.per_call,
+            'tracing': tracing,
+            'write': write,
+            'seconds': seconds,
+            'pct': pct,
+            'budget_pct': self.max_overhead_pct,
+            'fraction': fraction,
+            'next_fraction': self.fraction
+        })
+        return stats
@@ -1,5 +1,4 @@
 import os
-import socket
 
 import utils
 
@@ -9,6 +8,19 @@ class ConfigException(Exception):
     pass
 
 
+def _module_patterns(value):
+    """
+    Returns a list of module patterns from a list or a comma separated
+    string.
+
+    """
+    if not value:
+        return []
+    if isinstance(value, basestring):
+        value = value.split(',')
+    return [str(pattern).strip() for pattern in value if pattern]
+
+
 class Config():
     """
     Configuration object for setting up profiling.
@@ -17,6 +29,29 @@ class Config():
 
     valid_clock_types = ['cpu', 'wall']
 
+    # Short names for the bundled backends. Any other backend is named
+    # by the full path of its class.
+    backends = {
+        'greenletprofiler':
+            'os_code_profiler.backends.tracing.GreenletProfilerBackend',
+        'yappi': 'os_code_profiler.backends.tracing.YappiBackend',
+        'cprofile': 'os_code_profiler.backends.tracing.CProfileBackend',
+        'sampling': 'os_code_profiler.backends.sampling.SamplingBackend',
+        'noop': 'os_code_profiler.backends.noop.NoopBackend'
+    }
+
+    # Short names for the bundled collectors
+    collector_classes = {
+        'histogram':
+            'os_code_profiler.collectors.histogram.HistogramCollector',
+        'slow_calls':
+            'os_code_profiler.collectors.slow_calls.SlowCallCollector',
+        'hub_lag': 'os_code_profiler.collectors.hub_lag.HubLagCollector',
+        'greenthreads':
+            'os_code_profiler.collectors.greenthreads.GreenthreadCollector',
+        'memory': 'os_code_profiler.collectors.memory.MemoryCollector'
+    }
+
     def __init__(self, config_dict):
         """
         Inits the config object
@@ -30,9 +65,113 @@ class Config():
             raise ConfigException("clock_type must be cpu|wall")
 
         self.interval = int(config_dict.get("interval", 60 * 5))
+        if self.interval < 1:
+            raise ConfigException("interval must be at least 1")
         self.clear_each_interval = \
             bool(config_dict.get('clear_each_interval', True))
 
+        # Dump on multiples of the interval since the epoch so that every
+        # process covers the same windows
+        self.align_intervals = \
+            bool(config_dict.get('align_intervals', True))
+
+        # Delta dumps need cumulative counters to compare against
+        self.delta_each_interval = \
+            bool(config_dict.get('delta_each_interval', False))
+        if self.delta_each_interval:
+            self.clear_each_interval = False
+
+        # Duty cycle. Profile for duty_cycle_on seconds out of every
+        # duty_cycle_period seconds, offset by up to duty_cycle_jitter
+        # seconds chosen at random by each process.
+        self.duty_cycle_on = config_dict.get('duty_cycle_on')
+        if self.duty_cycle_on is not None:
+            self.duty_cycle_on = float(self.duty_cycle_on)
+            self.duty_cycle_period = float(
+                config_dict.get('duty_cycle_period', self.interval)
+            )
+            self.duty_cycle_jitter = \
+                float(config_dict.get('duty_cycle_jitter', 0))
+            if self.duty_cycle_on <= 0 or self.duty_cycle_jitter < 0 or \
+                    self.duty_cycle_on + self.duty_cycle_jitter > \
+                    self.duty_cycle_period:
+                raise ConfigException(
+                    "duty cycle must fit duty_cycle_on and "
+                    "duty_cycle_jitter within duty_cycle_period"
+                )
+            if self.delta_each_interval:
+                raise ConfigException(
+                    "delta_each_interval cannot be used with a duty cycle"
+                )
+            # Each window is profiled from scratch
+            self.clear_each_interval = True
+
+        # Percentage of processes profiled in each interval
+        self.select_pct = config_dict.get('select_pct')
+        if self.select_pct is not None:
+            self.select_pct = float(self.select_pct)
+            if not 0 < self.select_pct <= 100:
+                raise ConfigException("select_pct must be within (0, 100]")
+
+        # Percentage of the process's cpu profiling may cost
+        self.max_overhead_pct = config_dict.get('max_overhead_pct')
+        if self.max_overhead_pct is not None:
+            self.max_overhead_pct = float(self.max_overhead_pct)
+            if self.max_overhead_pct <= 0:
+                raise ConfigException("max_overhead_pct must be positive")
+
+        self.writer_queue_size = \
+            int(config_dict.get('writer_queue_size', 4))
+        if self.writer_queue_size < 1:
+            raise ConfigException("writer_queue_size must be at least 1")
+
+        # Keep the top functions of each dump and those above a share
+        # of the total time. The rest are summed into one function.
+        self.prune_top_n = config_dict.get('prune_top_n')
+        if self.prune_top_n is not None:
+            self.prune_top_n = int(self.prune_top_n)
+            if self.prune_top_n < 1:
+                raise ConfigException("prune_top_n must be at least 1")
+        self.prune_threshold_pct = config_dict.get('prune_threshold_pct')
+        if self.prune_threshold_pct is not None:
+            self.prune_threshold_pct = float(self.prune_threshold_pct)
+        self.prune_sort = str(config_dict.get('prune_sort', 'tottime'))
+        if self.prune_sort not in ['tottime', 'cumtime']:
+            raise ConfigException("prune_sort must be tottime|cumtime")
+
+        # Only keep functions from these modules, ex: ['nova.*']
+        # The sampler skips other frames while profiling. Tracing
+        # backends trace everything and drop them from each dump.
+        self.include_modules = \
+            _module_patterns(config_dict.get('include_modules'))
+        self.exclude_modules = \
+            _module_patterns(config_dict.get('exclude_modules'))
+
+        # Workers forked by a multi process service. At most max_workers
+        # are profiled at a time. With aggregation they send their dumps
+        # to the parent, which writes one merged dump per interval.
+        self.max_workers = config_dict.get('max_workers')
+        if self.max_workers is not None:
+            self.max_workers = int(self.max_workers)
+            if self.max_workers < 1:
+                raise ConfigException("max_workers must be at least 1")
+        self.aggregate_workers = \
+            bool(config_dict.get('aggregate_workers', False))
+        self.aggregate_timeout = \
+            float(config_dict.get('aggregate_timeout', self.interval))
+
+        self.backend = str(config_dict.get('backend', 'greenletprofiler'))
+        self.backend = self.backends.get(self.backend.lower(), self.backend)
+        self.backend_config = dict(config_dict.get('backend_config', {}))
+
+        # Collectors to run alongside the backend, by name or full class
+        # path, each with its config. ex: {'histogram': {'functions': []}}
+        self.collectors = {}
+        for name, collector_config in \
+                config_dict.get('collectors', {}).iteritems():
+            name = self.collector_classes.get(str(name).lower(), str(name))
+            self.collectors[name] = dict(collector_config or {})
+
 
 class Context():
     """
@@ -43,16 +182,18 @@ class Context():
     topic - many kinds of services on a node
     start_timestamp_utc - in seconds
     end_timestamp_utc - in seconds
+    kind - what was collected. 'stats' for function stats, otherwise
+        the kind of the collector.
 
-    Also provides a way to store others.
+    Also provides a way to store others in the metadata dictionary.
 
     """
     def __init__(
         self, hostname=None, pid=None,
-        started=None, ended=None, topic=None
+        started=None, ended=None, topic=None, metadata=None, kind=None
     ):
         if hostname is None:
-            hostname = socket.gethostname()
+            hostname = utils.hostname()
         self.hostname = hostname
 
         if pid is None:
@@ -70,3 +211,44 @@ class Context():
         if topic is None:
             topic = "unknown"
         self.topic = topic
+
+        if metadata is None:
+            metadata = {}
+        self.metadata = metadata
+
+        if kind is None:
+            kind = 'stats'
+        self.kind = kind
+
+    def to_dict(self):
+        """
+        Returns the context as a dictionary of plain values.
+
+        @returns - Dict
+
+        """
+        return {
+            'hostname': self.hostname,
+            'pid': self.pid,
+            'started': self.started,
+            'ended': self.ended,
+            'topic': self.topic,
+            'metadata': self.metadata,
+            'kind': self.kind
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Creates a context from a dictionary made by to_dict.
+
+        @param d - Dict
+        @returns - Context object
+
+        """
+        return cls(
+            hostname=d.get('hostname'), pid=d.get('pid'),
+            started=d.get('started'), ended=d.get('ended'),
+            topic=d.get('topic'), metadata=d.get('metadata'),
+            kind=d.get('kind')
+        )
@@ -0,0 +1,116 @@
+import heapq
+
+from stats import Stats
+
+# Key of the function that stands in for everything pruned
+OTHER = ('~', 0, '<other>')
+
+
+def _add(counters, other):
+    return (counters[0] + other[0], counters[1] + other[1],
+            counters[2] + other[2], counters[3] + other[3])
+
+
+class Pruner(object):
+    """
+    Writer transform that keeps only the functions that matter.
+
+    The top_n functions by own or cumulative time are kept, together
+    with any function whose time is at least threshold_pct percent of
+    the total. When sorting by own time the total is the sum of own
+    times. When sorting by cumulative time it is the largest cumulative
+    time, which is that of the outermost function. Everything else is
+    folded into a single OTHER function, so total calls and own time
+    still add up:
+
+        - OTHER gets the calls and own time of every pruned function.
+          Its cumulative time is its own time.
+        - Calls from kept functions into pruned ones are recorded as
+          calls into OTHER, and calls from pruned functions are recorded
+          as calls from OTHER.
+
+    The context is tagged in metadata['pruned'] with the number of
+    functions kept and removed.
+
+    """
+
+    sort_keys = {'tottime': 2, 'cumtime': 3}
+
+    def __init__(self, top_n=None, threshold_pct=None, sort='tottime'):
+        """
+        @param top_n - Optional number of functions to keep
+        @param threshold_pct - Optional percentage of the total time
+            above which a function is always kept
+        @param sort - String. tottime|cumtime
+
+        """
+        self._top_n = top_n
+        self._threshold_pct = threshold_pct
+        self._sort = sort
+        self._index = self.sort_keys[sort]
+
+    def __call__(self, ctx, stats):
+        """
+        @param ctx - Context object. Updated in place.
+        @param stats - Stats or Snapshot object
+        @returns - Stats object
+
+        """
+        if not isinstance(stats, Stats):
+            stats = stats.stats()
+        entries = stats.stats
+        index = self._index
+
+        keep = set()
+        if self._top_n:
+            top = heapq.nlargest(self._top_n, entries.iteritems(),
+                                 key=lambda item: item[1][index])
+            keep.update(func for func, entry in top)
+        if self._threshold_pct is not None and entries:
+            if self._sort == 'cumtime':
+                total = max(entry[3] for entry in entries.itervalues())
+            else:
+                total = sum(entry[2] for entry in entries.itervalues())
+            minimum = total * self._threshold_pct / 100.0
+            keep.update(func for func, entry in entries.iteritems()
+                        if entry[index] >= minimum)
+
+        removed = len(entries) - len(keep)
+        ctx.metadata['pruned'] = {
+            'kept': len(keep),
+            'removed': removed,
+            'top_n': self._top_n,
+            'threshold_pct': self._threshold_pct,
+            'sort': self._sort
+        }
+        if not removed:
+            return stats
+
+        result = {}
+        other = [0, 0, 0.0, 0.0]
+        other_callers = {}
+        for func, (cc, nc, tt, ct, callers) in entries.iteritems():
+            if func in keep:
+                kept_callers = {}
+                for caller, counters in callers.iteritems():
+                    if caller not in keep:
+                        caller = OTHER
+                    old = kept_callers.get(caller)
+                    kept_callers[caller] = counters if old is None \
+                        else _add(old, counters)
+                result[func] = (cc, nc, tt, ct, kept_callers)
+                continue
+
+            other[0] += cc
+            other[1] += nc
+            other[2] += tt
+            for caller, counters in callers.iteritems():
+                # Calls among pruned functions happen inside OTHER
+                if caller not in keep:
+                    continue
+                old = other_callers.get(caller)
+                other_callers[caller] = counters if old is None \
+                    else _add(old, counters)
+        result[OTHER] = (other[0], other[1], other[2], other[2],
+                         other_callers)
+        return Stats(result, stats.context)
@@ -0,0 +1,311 @@
+import signal
+import sys
+import time
+
+import utils
+from stats import Snapshot, Stats
+
+# Process cpu time in seconds
+cpu_time = getattr(time, 'process_time', time.clock)
+
+
+class SamplingException(Exception):
+    """Simple sampling exception"""
+    pass
+
+
+class Sampler(object):
+    """
+    Statistical profiler that periodically records the python stack
+    instead of tracing every call.
+
+    Provides the functions the dumper uses from a backend: start, stop,
+    is_running, clear_stats, set_clock_type, get_func_stats and snapshot.
+
+    Stacks are read from each thread's current frame. Under eventlet the
+    current frame of the hub's thread belongs to whichever greenlet is
+    running, and its chain of frames ends at that greenlet's entry point,
+    so each sample is the stack of a single green thread.
+
+    Samples are aggregated as {stack: [hits, seconds]} where a stack is a
+    tuple of code objects, leaf first. Nothing is converted to names
+    until the stats are requested.
+
+    Two timers are available:
+
+    thread - A native thread wakes up hz times per second and samples
+        every other thread. Each sample is weighted with the wall or
+        process cpu time elapsed since the previous one.
+    signal - An interval timer delivers SIGPROF (cpu) or SIGALRM (wall)
+        to the main thread, which samples itself. Blocking system calls
+        may be interrupted with EINTR, so thread is the safer default.
+
+    """
+
+    valid_timers = ['thread', 'signal']
+
+    def __init__(self, hz=100, max_depth=64, timer='thread'):
+        """
+        @param hz - Samples per second
+        @param max_depth - Maximum number of frames recorded per sample
+        @param timer - String. One of valid_timers
+
+        """
+        if timer not in self.valid_timers:
+            raise SamplingException("timer must be thread|signal")
+        self._period = 1.0 / hz
+        self._max_depth = max_depth
+        self._timer = timer
+        self._clock_type = 'wall'
+
+        self._stacks = {}
+        self._module_filter = None
+        self._running = False
+        self._thread = None
+        self._wakeup = None
+        self._previous_handler = None
+
+    def set_clock_type(self, clock_type):
+        """
+        Sets the clock used to weigh samples.
+
+        @param clock_type - String. cpu|wall
+
+        """
+        self._clock_type = clock_type
+
+    def set_module_filter(self, module_filter):
+        """
+        Records only frames from functions kept by module_filter.
+        Frames that are dropped are skipped as the stack is walked, so
+        callers of a kept frame are the nearest kept frames above it.
+
+        @param module_filter - ModuleFilter object
+
+        """
+        self._module_filter = module_filter
+
+    def is_running(self):
+        """
+        Returns whether or not the sampler is running.
+
+        """
+        return self._running
+
+    def clear_stats(self):
+        """
+        Discards every recorded sample.
+
+        """
+        self._stacks = {}
+
+    def start(self):
+        """
+        Starts sampling.
+
+        """
+        if self._running:
+            return
+        self._running = True
+        if self._timer == 'signal':
+            self._start_signal()
+        else:
+            self._start_thread()
+
+    def stop(self):
+        """
+        Stops sampling. Recorded samples are kept.
+
+        """
+        if not self._running:
+            return
+        self._running = False
+        if self._timer == 'signal':
+            self._stop_signal()
+        else:
+            self._stop_thread()
+
+    def _record(self, frame, seconds):
+        """
+        Records one sample of the stack ending at frame.
+
+        @param frame - Frame object
+        @param seconds - Float weight of the sample
+
+        """
+        codes = []
+        append = codes.append
+        depth = self._max_depth
+        keep = self._module_filter
+        while frame is not None and depth:
+            code = frame.f_code
+            if keep is None or keep(code.co_filename):
+                append(code)
+            frame = frame.f_back
+            depth -= 1
+        if not codes:
+            return
+        stack = tuple(codes)
+        counters = self._stacks.get(stack)
+        if counters is None:
+            self._stacks[stack] = [1, seconds]
+        else:
+            counters[0] += 1
+            counters[1] += seconds
+
+    def _clock(self):
+        """
+        Returns the current time of the configured clock.
+
+        """
+        if self._clock_type == 'cpu':
+            return cpu_time()
+        return time.time()
+
+    def _start_thread(self):
+        """
+        Starts the native sampling thread.
+
+        """
+        threading = utils.original_module('threading')
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='os_code_profiler_sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _stop_thread(self):
+        """
+        Stops the native sampling thread.
+
+        """
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        """
+        Sampling thread loop.
+
+        """
+        thread = utils.original_module('thread')
+        own_ident = thread.get_ident()
+        last = self._clock()
+        while not self._wakeup.wait(self._period) and self._running:
+            now = self._clock()
+            seconds = now - last
+            last = now
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    self._record(frame, seconds)
+
+    def _signal_settings(self):
+        """
+        Returns the signal number and interval timer for the clock type.
+
+        """
+        if self._clock_type == 'cpu':
+            return signal.SIGPROF, signal.ITIMER_PROF
+        return signal.SIGALRM, signal.ITIMER_REAL
+
+    def _start_signal(self):
+        """
+        Installs the signal handler and starts the interval timer.
+        Must be called from the main thread.
+
+        """
+        signum, which = self._signal_settings()
+        self._previous_handler = signal.signal(signum, self._on_signal)
+        signal.setitimer(which, self._period, self._period)
+
+    def _stop_signal(self):
+        """
+        Stops the interval timer and restores the previous handler.
+
+        """
+        signum, which = self._signal_settings()
+        signal.setitimer(which, 0, 0)
+        signal.signal(signum, self._previous_handler)
+        self._previous_handler = None
+
+    def _on_signal(self, signum, frame):
+        """
+        Signal handler. Records the interrupted stack.
+
+        """
+        self._record(frame, self._period)
+
+    def get_func_stats(self):
+        """
+        Converts the recorded samples to function stats.
+
+        @returns - Stats object
+
+        """
+        return stacks_to_stats(self._stacks.items())
+
+    def snapshot(self, reset=False):
+        """
+        Captures the recorded samples without stopping the sampler.
+        Resetting swaps in a new, empty dictionary so no sample is lost
+        or counted twice between consecutive snapshots.
+
+        @param reset - Boolean. Clear the samples after capturing them.
+        @returns - Snapshot object
+
+        """
+        if reset:
+            stacks = self._stacks
+            self._stacks = {}
+            items = stacks.items()
+        else:
+            items = [(k, list(v)) for k, v in self._stacks.items()]
+        return Snapshot(items, stacks_to_stats)
+
+
+def stacks_to_stats(items):
+    """
+    Converts recorded samples to function stats.
+
+    Call counts are sample counts. Own time is the weight of samples
+    where the function was the leaf and cumulative time is the weight
+    of samples where it appeared anywhere in the stack.
+
+    @param items - List of (stack, [hits, seconds])
+    @returns - Stats object
+
+    """
+    entries = {}
+    callers = {}
+
+    def key(code):
+        return (code.co_filename, code.co_firstlineno, code.co_name)
+
+    for stack, (hits, seconds) in items:
+        seen = set()
+        for depth, code in enumerate(stack):
+            func = key(code)
+            own = seconds if depth == 0 else 0.0
+            entry = entries.get(func)
+            if entry is None:
+                entry = entries[func] = [0, 0, 0.0, 0.0]
+            entry[2] += own
+            if func not in seen:
+                seen.add(func)
+                entry[0] += hits
+                entry[1] += hits
+                entry[3] += seconds
+
+            if depth + 1 < len(stack):
+                caller = key(stack[depth + 1])
+                func_callers = callers.setdefault(func, {})
+                edge = func_callers.get(caller, (0, 0, 0.0, 0.0))
+                func_callers[caller] = (
+                    edge[0] + hits, edge[1] + hits,
+                    edge[2] + own, edge[3] + seconds
+                )
+
+    stats = Stats()
+    for func, (cc, nc, tt, ct) in entries.iteritems():
+        stats.stats[func] = (cc, nc, tt, ct, callers.get(func, {}))
+    return stats
@@ -0,0 +1,45 @@
+def score(hostname, pid, topic, epoch):
+    """
+    Returns a number that is uniformly spread in [0, 1) across processes
+    and changes from one epoch to the next. Every host computes the same
+    score for the same process and epoch.
+
+    @param hostname - String
+    @param pid - Integer
+    @param topic - String
+    @param epoch - Integer. Index of the interval since the epoch.
+    @returns - Float
+
+    """
+    import hashlib
+    key = '%s/%s/%s/%s' % (hostname, pid, topic, epoch)
+    return int(hashlib.md5(key).hexdigest()[:13], 16) / float(16 ** 13)
+
+
+def selected(score, pct):
+    """
+    Returns whether a process with score is among the pct percent of
+    processes selected.
+
+    @param score - Float returned by score
+    @param pct - Float percentage of processes to select
+    @returns - Boolean
+
+    """
+    return score * 100 < pct
+
+
+def is_selected(hostname, pid, topic, epoch, pct):
+    """
+    Returns whether a process is profiled during an epoch when pct
+    percent of processes are.
+
+    @param hostname - String
+    @param pid - Integer
+    @param topic - String
+    @param epoch - Integer
+    @param pct - Float percentage of processes to select
+    @returns - Boolean
+
+    """
+    return selected(score(hostname, pid, topic, epoch), pct)
@@ -0,0 +1,271 @@
+import marshal
+
+# First byte of a pickle written with protocol 2, as yappi's ystat
+# files are
+_pickle_marker = '\x80'
+
+# Marshal type codes that open and close a dictionary
+_marshal_dict = '{'
+_marshal_null = '0'
+
+# Functions encoded at a time when dumping to a file like object
+_chunk_entries = 1024
+
+
+def add_callers(target, source):
+    """
+    Combines two callers dictionaries into a new one.
+
+    @param target - Dict. {caller_key: (cc, nc, tt, ct)}
+    @param source - Dict. {caller_key: (cc, nc, tt, ct)}
+    @returns - Dict
+
+    """
+    new_callers = dict(target)
+    for func, caller in source.iteritems():
+        if func in new_callers:
+            new_callers[func] = tuple(
+                [i[0] + i[1] for i in zip(caller, new_callers[func])]
+            )
+        else:
+            new_callers[func] = caller
+    return new_callers
+
+
+class Stats(object):
+    """
+    Function stats using the dictionary layout of the standard library
+    pstats module:
+
+        {(filename, lineno, funcname): (cc, nc, tt, ct, callers)}
+
+    where callers maps the key of each caller to (cc, nc, tt, ct).
+    Saved files can be opened with pstats.Stats.
+
+    Stats loaded from a file that was written together with its context
+    keep that context as a dictionary.
+
+    Stats that a module filter shrank keep the number of calls the
+    profiler recorded before filtering in traced_calls, since tracing
+    paid for all of them. It is None for stats that were not filtered.
+
+    """
+    def __init__(self, stats=None, context=None):
+        """
+        @param stats - Optional pstats style dictionary
+        @param context - Optional dictionary from Context.to_dict
+
+        """
+        if stats is None:
+            stats = {}
+        self.stats = stats
+        self.context = context
+        self.traced_calls = None
+
+    def __len__(self):
+        return len(self.stats)
+
+    def add_entry(self, func, entry):
+        """
+        Adds a single function's counters to these stats.
+
+        @param func - Tuple. (filename, lineno, funcname)
+        @param entry - Tuple. (cc, nc, tt, ct, callers)
+
+        """
+        old = self.stats.get(func)
+        if old is None:
+            self.stats[func] = entry
+            return
+        cc, nc, tt, ct, callers = entry
+        old_cc, old_nc, old_tt, old_ct, old_callers = old
+        self.stats[func] = (
+            old_cc + cc, old_nc + nc, old_tt + tt, old_ct + ct,
+            add_callers(old_callers, callers)
+        )
+
+    def add(self, other):
+        """
+        Adds another Stats object into this one.
+
+        @param other - Stats object
+        @returns - self
+
+        """
+        for func, entry in other.stats.iteritems():
+            self.add_entry(func, entry)
+        return self
+
+    def scale(self, factor):
+        """
+        Returns new stats with every counter multiplied by factor.
+        Call counts are rounded to whole calls.
+
+        @param factor - Float
+        @returns - Stats object
+
+        """
+        def scaled(counters):
+            cc, nc, tt, ct = counters[:4]
+            return (int(round(cc * factor)), int(round(nc * factor)),
+                    tt * factor, ct * factor)
+
+        result = {}
+        for func, entry in self.stats.iteritems():
+            callers = dict((caller, scaled(counters))
+                           for caller, counters in entry[4].iteritems())
+            result[func] = scaled(entry) + (callers,)
+        return Stats(result, self.context)
+
+    def total_time(self):
+        """
+        Returns the sum of the own time of every function.
+
+        @returns - Float
+
+        """
+        return sum(entry[2] for entry in self.stats.itervalues())
+
+    def dump(self, f):
+        """
+        Writes the stats to an open file object.
+
+        Real files are written by marshal directly. File like objects,
+        such as compressed writers, are given the dictionary a chunk of
+        functions at a time so the whole encoding is never held in
+        memory. Chunks use marshal version 0, which does not refer back
+        to strings of earlier chunks, so they can be concatenated and
+        read back by compression.load_marshal.
+
+        @param f - File object or file like object opened for
+            binary writing
+
+        """
+        if isinstance(f, file):
+            marshal.dump(self.stats, f)
+            return
+        f.write(_marshal_dict)
+        chunk = []
+        for func, entry in self.stats.iteritems():
+            chunk.append(marshal.dumps(func, 0))
+            chunk.append(marshal.dumps(entry, 0))
+            if len(chunk) >= 2 * _chunk_entries:
+                f.write(''.join(chunk))
+                chunk = []
+        chunk.append(_marshal_null)
+        f.write(''.join(chunk))
+
+    def save(self, path):
+        """
+        Writes the stats to path.
+
+        @param path - String
+
+        """
+        with open(path, 'wb') as f:
+            self.dump(f)
+
+
+def yappi_func_stats_to_stats(func_stats):
+    """
+    Converts a list of yappi YFuncStat objects to Stats.
+
+    @param func_stats - List of YFuncStat objects
+    @returns - Stats object
+
+    """
+    def key(stat):
+        return (stat.module, stat.lineno, stat.name)
+
+    result = {}
+    for stat in func_stats:
+        result[key(stat)] = (
+            stat.nactualcall, stat.ncall, stat.tsub, stat.ttot, {}
+        )
+    for stat in func_stats:
+        for child in stat.children:
+            entry = result.get(key(child))
+            if entry is not None:
+                entry[4][key(stat)] = (
+                    child.nactualcall, child.ncall, child.tsub, child.ttot
+                )
+    return Stats(result)
+
+
+def load(path):
+    """
+    Loads a Stats object from a file written by Stats.save.
+    A context written after the stats is loaded as well.
+
+    Files saved by yappi or GreenletProfiler in their own ystat format are
+    converted, which requires the profiler to be importable. Compressed
+    files are decompressed transparently.
+
+    @param path - String
+    @returns - Stats object
+
+    """
+    # Only needed when reading, which profiled services never do
+    import pickle
+    import compression
+
+    if compression.read_head(path, 1) == _pickle_marker:
+        func_stats, clock_type = pickle.loads(compression.read(path))
+        return yappi_func_stats_to_stats(func_stats)
+    objects = compression.load_marshal(path, 2)
+    stats = Stats(objects[0])
+    if len(objects) > 1:
+        stats.context = objects[1]
+    return stats
+
+
+class Snapshot(object):
+    """
+    Raw counters captured from a profiler.
+
+    Capturing is kept as cheap as possible so that it can happen while
+    the profiler keeps running. Converting the raw counters to a Stats
+    object is deferred until the snapshot is first used, which happens
+    on the writer thread.
+
+    """
+    def __init__(self, raw, convert):
+        """
+        @param raw - Raw counters in whatever form the profiler provides
+        @param convert - Callable that takes raw and returns a Stats object
+
+        """
+        self._raw = raw
+        self._convert = convert
+        self._stats = None
+
+    def stats(self):
+        """
+        Returns the converted Stats object, converting on first use.
+
+        @returns - Stats object
+
+        """
+        if self._stats is None:
+            self._stats = self._convert(self._raw)
+            self._raw = None
+        return self._stats
+
+    def dump(self, f):
+        """
+        Writes the converted stats to an open file object.
+
+        @param f - File object or file like object opened for
+            binary writing
+
+        """
+        self.stats().dump(f)
+
+    def save(self, path):
+        """
+        Writes the converted stats to path.
+
+        @param path - String
+
+        """
+        self.stats().save(path)
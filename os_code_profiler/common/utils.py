@@ -3,11 +3,48 @@ import importlib
 
 epoch = datetime.datetime.utcfromtimestamp(0)
 
+# Looked up on first use
+_hostname = None
+
 
 def utc_seconds():
     return (datetime.datetime.now() - epoch).total_seconds()
 
 
+def hostname():
+    """
+    Returns the hostname of the node. It is looked up once per process,
+    and children forked later inherit it.
+
+    @returns - String
+
+    """
+    global _hostname
+    if _hostname is None:
+        import socket
+        _hostname = socket.gethostname()
+    return _hostname
+
+
+def original_module(name):
+    """
+    Returns the unpatched version of a standard library module.
+
+    Services running under eventlet have threading, Queue, etc.
+    monkeypatched into green versions. Work that must run on a native
+    OS thread needs the originals.
+
+    @param name - String module name. ex: 'threading'
+    @returns - Module
+
+    """
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return importlib.import_module(name)
+    return patcher.original(name)
+
+
 class PluginLoader(object):
     """
     Simple object loader that returns instances of a named class
@@ -26,7 +63,17 @@ class PluginLoader(object):
         """
         if config is None:
             config = {}
-        modulename, classname = fullname.rsplit('.', 1)
-        module = importlib.import_module(modulename)
-        klass = getattr(module, classname)
+        klass = self.find(fullname)
         return klass(config)
+
+    def find(self, fullname):
+        """
+        Returns a named object from a module without instantiating it.
+
+        @param fullname - String. ex: "package_name.module_name.name"
+        @returns - Object
+
+        """
+        modulename, name = fullname.rsplit('.', 1)
+        module = importlib.import_module(modulename)
+        return getattr(module, name)
@@ -0,0 +1,335 @@
+"""
+Profiles the workers forked by a multi process service.
+
+Each profiled worker arms its own dumper after the fork. With
+aggregation the workers send their dumps to the parent over a pipe each,
+instead of writing them, and the parent merges the stats dumps of each
+interval into a single dump.
+
+"""
+import marshal
+import struct
+import time
+
+try:
+    # eventlet replaces read and write in os with green versions that
+    # must not be used from native threads. posix keeps the originals.
+    import posix as _os
+except ImportError:
+    import os as _os
+
+import utils
+from profiling import Context
+from stats import Stats
+
+# Bytes of the length prefix of each message
+_header = struct.Struct('!I')
+
+
+def _payload(ctx, stats):
+    """
+    Returns the marshallable data of a dump.
+
+    """
+    if getattr(ctx, 'kind', 'stats') != 'stats':
+        return stats.data
+    if not isinstance(stats, Stats):
+        stats = stats.stats()
+    return stats.stats
+
+
+def encode(ctx, stats):
+    """
+    Returns a dump as a length prefixed message.
+
+    @param ctx - Context object
+    @param stats - Stats object, Snapshot object or collector document
+    @returns - String
+
+    """
+    body = marshal.dumps((ctx.to_dict(), _payload(ctx, stats)))
+    return _header.pack(len(body)) + body
+
+
+class PipeOutput(object):
+    """
+    Output that sends each dump to the parent process through a pipe.
+    Writes come from the writer's native thread and block while the
+    pipe is full.
+
+    """
+    def __init__(self, fd):
+        """
+        @param fd - Integer write end of the pipe
+
+        """
+        self._fd = fd
+
+    def write(self, ctx, stats):
+        """
+        Sends the context and stats as one message.
+
+        @param ctx - Context object
+        @param stats - Stats object, Snapshot object or collector document
+
+        """
+        data = encode(ctx, stats)
+        while data:
+            written = _os.write(self._fd, data)
+            data = data[written:]
+
+
+class _Interval(object):
+    """
+    Stats dumps of one interval received so far.
+
+    """
+    def __init__(self, ctx, arrived):
+        self.ctx = ctx
+        self.arrived = arrived
+        self.stats = Stats()
+        self.pids = []
+
+
+class Aggregator(object):
+    """
+    Receives dumps from workers on a native thread and merges the stats
+    dumps of each interval.
+
+    Dumps of the same topic that end at the same time belong to the
+    same interval, as they do when intervals are aligned. An interval is
+    written once every connected worker sent it, or timeout seconds
+    after its first dump. Collector documents are written as received.
+
+    """
+    # Seconds between checks for late intervals
+    poll_interval = 1.0
+
+    def __init__(self, writer, timeout):
+        """
+        @param writer - Writer object for the merged dumps
+        @param timeout - Float seconds to wait for every worker
+
+        """
+        self._writer = writer
+        self._timeout = timeout
+        self._select = utils.original_module('select')
+        self._buffers = {}
+        self._intervals = {}
+        self._thread = None
+        self._running = False
+        self.errors = 0
+
+    def fds(self):
+        """
+        Returns the read ends of the connected workers' pipes.
+
+        """
+        return list(self._buffers)
+
+    def add(self, fd):
+        """
+        Starts receiving from a worker. Starts the thread on first use.
+
+        @param fd - Integer read end of the worker's pipe
+
+        """
+        self._buffers[fd] = ''
+        if self._thread is None:
+            self.start()
+
+    def start(self):
+        """
+        Starts the writer and the receiving thread.
+
+        """
+        self._writer.start()
+        threading = utils.original_module('threading')
+        self._running = True
+        self._thread = threading.Thread(target=self._run,
+                                        name='os_code_profiler_workers')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _receive(self, fd, now):
+        """
+        Reads what a worker sent and handles each complete message.
+        Closes the pipe once the worker exits.
+
+        """
+        data = _os.read(fd, 65536)
+        if not data:
+            self._close(fd)
+            return
+        buf = self._buffers[fd] + data
+        while len(buf) >= _header.size:
+            size, = _header.unpack(buf[:_header.size])
+            end = _header.size + size
+            if len(buf) < end:
+                break
+            ctx, payload = marshal.loads(buf[_header.size:end])
+            buf = buf[end:]
+            self.handle(Context.from_dict(ctx), payload, now)
+        self._buffers[fd] = buf
+
+    def _close(self, fd):
+        """
+        Stops receiving from a worker.
+
+        """
+        if fd in self._buffers:
+            del self._buffers[fd]
+            _os.close(fd)
+
+    def handle(self, ctx, payload, now):
+        """
+        Merges a stats dump into its interval or writes a document.
+
+        @param ctx - Context object
+        @param payload - Stats dictionary or document data
+        @param now - Float seconds
+
+        """
+        if ctx.kind != 'stats':
+            from os_code_profiler.collectors.base import Document
+            self._writer.submit(ctx, Document(payload))
+            return
+        key = (ctx.topic, ctx.ended)
+        interval = self._intervals.get(key)
+        if interval is None:
+            interval = self._intervals[key] = _Interval(ctx, now)
+        interval.stats.add(Stats(payload))
+        interval.pids.append(ctx.pid)
+        interval.ctx.started = min(interval.ctx.started, ctx.started)
+        self.flush(now)
+
+    def _complete(self, interval):
+        """
+        Returns whether every connected worker sent the interval.
+
+        """
+        return len(interval.pids) >= len(self._buffers)
+
+    def flush(self, now, force=False):
+        """
+        Writes the intervals every worker sent or that timed out.
+
+        @param now - Float seconds
+        @param force - Boolean. Write every interval.
+
+        """
+        for key, interval in sorted(self._intervals.items()):
+            if force or self._complete(interval) or \
+                    now - interval.arrived >= self._timeout:
+                del self._intervals[key]
+                ctx = Context(
+                    started=interval.ctx.started, ended=interval.ctx.ended,
+                    topic=interval.ctx.topic,
+                    metadata={'workers': {'pids': sorted(interval.pids),
+                                          'count': len(interval.pids)}}
+                )
+                self._writer.submit(ctx, interval.stats)
+
+    def _run(self):
+        """
+        Aggregator thread loop.
+
+        """
+        while self._running:
+            fds = self.fds()
+            if fds:
+                readable = self._select.select(fds, [], [],
+                                               self.poll_interval)[0]
+            else:
+                readable = []
+                time.sleep(self.poll_interval)
+            now = time.time()
+            for fd in readable:
+                try:
+                    self._receive(fd, now)
+                except Exception:
+                    # A worker sending garbage must not stop the others
+                    self.errors += 1
+                    self._close(fd)
+            self.flush(now)
+
+    def stop(self):
+        """
+        Stops the thread, writes what was received and stops the writer.
+
+        """
+        if self._thread is None:
+            return
+        self._running = False
+        self._thread.join()
+        self._thread = None
+        self.flush(time.time(), force=True)
+        self._writer.stop()
+
+
+class Workers(object):
+    """
+    Parent side bookkeeping of forked workers.
+
+    Decides before each fork whether the worker will be profiled, at
+    most max_workers at a time, and with aggregation gives it a pipe to
+    the parent's aggregator.
+
+    """
+    def __init__(self, max_workers=None, aggregator=None):
+        """
+        @param max_workers - Optional number of workers profiled at
+            a time
+        @param aggregator - Optional Aggregator object
+
+        """
+        self._max_workers = max_workers
+        self._aggregator = aggregator
+        self._profiled = set()
+        self._pending = None
+
+    def before_fork(self, live_pids):
+        """
+        Prepares the next fork.
+
+        @param live_pids - Collection of the pids of running workers
+        @returns - Dict for the child. selected is whether it is
+            profiled, fd the write end of its pipe or None and inherited
+            the descriptors the child should close.
+
+        """
+        self._profiled &= set(live_pids)
+        selected = self._max_workers is None or \
+            len(self._profiled) < self._max_workers
+        child = {'selected': selected, 'fd': None, 'inherited': []}
+        self._pending = None
+        if selected and self._aggregator is not None:
+            read_fd, write_fd = _os.pipe()
+            self._pending = (read_fd, write_fd)
+            child['fd'] = write_fd
+            child['inherited'] = self._aggregator.fds() + [read_fd]
+        return child
+
+    def after_fork(self, pid, child):
+        """
+        Records a forked worker in the parent.
+
+        @param pid - Integer pid of the worker
+        @param child - Dict returned by before_fork
+
+        """
+        if child['selected']:
+            self._profiled.add(pid)
+        if self._pending is not None:
+            read_fd, write_fd = self._pending
+            self._pending = None
+            _os.close(write_fd)
+            self._aggregator.add(read_fd)
+
+    def stop(self):
+        """
+        Stops the aggregator.
+
+        """
+        if self._aggregator is not None:
+            self._aggregator.stop()
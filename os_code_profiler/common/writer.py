@@ -0,0 +1,195 @@
+import time
+
+import utils
+
+
+class Writer(object):
+    """
+    Bounded, ordered writer stage.
+
+    Snapshots are handed off by the dumper and written to every output
+    on a native OS thread, so slow serialization or disk writes never
+    stall the service's eventlet hub. Snapshots are written in the order
+    they were submitted. When the queue is full, new snapshots are
+    dropped rather than blocking the caller.
+
+    Outputs that hold on to dumps may have a close method, which is
+    called on the writer thread once the queued snapshots are written.
+
+    Transforms are callables taking (ctx, stats) and returning the stats
+    to pass on. They are applied in order to each stats snapshot before
+    it is written and may update the context. Collector documents are
+    written as they are.
+
+    """
+
+    # Seconds to wait for queued snapshots to be written on stop
+    stop_timeout = 10
+
+    # Seconds between checks while waiting on the writer thread
+    poll_interval = 0.05
+
+    def __init__(self, outputs, queue_size=4, transforms=None):
+        """
+        @param outputs - List of output objects
+        @param queue_size - Maximum number of snapshots waiting to
+            be written.
+        @param transforms - Optional list of transform callables
+
+        """
+        Queue = utils.original_module('Queue')
+        self._full = Queue.Full
+        self._empty = Queue.Empty
+        self._queue = Queue.Queue(maxsize=queue_size)
+        self._outputs = outputs
+        if transforms is None:
+            transforms = []
+        self._transforms = transforms
+        self._thread = None
+        self._stopping = False
+
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def start(self):
+        """
+        Starts the native writer thread.
+
+        """
+        threading = utils.original_module('threading')
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='os_code_profiler_writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Signals the writer thread to finish the queued snapshots and exit.
+        Waits up to stop_timeout seconds for it to do so.
+
+        Services call this from a green thread, so signalling never
+        blocks and waiting polls with time.sleep, which eventlet makes
+        green, instead of blocking the hub in a native join.
+
+        """
+        if self._thread is None:
+            return
+        self._stopping = True
+        try:
+            self._queue.put_nowait(None)
+        except self._full:
+            # The thread exits once it finds the queue empty
+            pass
+        for i in xrange(int(self.stop_timeout / self.poll_interval)):
+            if not self._thread.is_alive():
+                break
+            time.sleep(self.poll_interval)
+        self._thread = None
+
+    def submit(self, ctx, stats):
+        """
+        Queues a snapshot for writing without blocking.
+
+        @param ctx - Context object
+        @param stats - Stats object to pass to each output
+        @returns - Boolean. False if the snapshot was dropped.
+
+        """
+        self.submitted += 1
+        try:
+            self._queue.put_nowait((ctx, stats))
+        except self._full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _write(self, ctx, stats):
+        """
+        Transforms one snapshot, writes it to every output and records
+        the latency. Exceptions from one output do not prevent writes to
+        the others. A snapshot whose transform fails is not written.
+
+        @param ctx - Context object
+        @param stats - Stats object
+
+        """
+        began = time.time()
+        transforms = self._transforms
+        if getattr(ctx, 'kind', 'stats') != 'stats':
+            transforms = []
+        try:
+            for transform in transforms:
+                stats = transform(ctx, stats)
+        except Exception:
+            self.errors += 1
+            return
+        for o in self._outputs:
+            try:
+                o.write(ctx, stats)
+            except Exception:
+                # @TODO - Possibly do something with logging
+                self.errors += 1
+        latency = time.time() - began
+
+        self.written += 1
+        self.last_latency = latency
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def _run(self):
+        """
+        Writer thread loop. Exits when it receives None, or when it is
+        stopping and the queue is empty.
+
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout=self.poll_interval)
+            except self._empty:
+                if self._stopping:
+                    break
+                continue
+            if item is None:
+                break
+            self._write(*item)
+        self._close()
+
+    def _close(self):
+        """
+        Lets outputs with a close method write what they hold.
+
+        """
+        for o in self._outputs:
+            try:
+                if hasattr(o, 'close'):
+                    o.close()
+            except Exception:
+                self.errors += 1
+
+    def metrics(self):
+        """
+        Returns a dictionary describing the state of the writer.
+
+        @returns - Dict
+
+        """
+        mean_latency = None
+        if self.written:
+            mean_latency = self.total_latency / self.written
+        return {
+            'queue_depth': self._queue.qsize(),
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'written': self.written,
+            'errors': self.errors,
+            'last_latency': self.last_latency,
+            'max_latency': self.max_latency,
+            'mean_latency': mean_latency
+        }
@@ -1,13 +1,23 @@
-import GreenletProfiler as profiler
+import os
 import time
 
-from eventlet import sleep
-
 from os_code_profiler.common.decorators import Base as BaseDecorator
 from os_code_profiler.common.profiling import \
     Config as ProfilingConfig,\
     Context as ProfilingContext
+from os_code_profiler.common import overhead
+from os_code_profiler.common import selection
 from os_code_profiler.common import utils
+from os_code_profiler.common.delta import DeltaEncoder
+from os_code_profiler.common.filtering import ModuleFilter
+from os_code_profiler.common.pruning import Pruner
+from os_code_profiler.common.sampling import cpu_time
+from os_code_profiler.common.workers import Aggregator, PipeOutput, Workers
+from os_code_profiler.common.writer import Writer
+
+# Set by the parent before forking a worker, so that the worker finds it
+# once forked. See Workers.before_fork.
+_fork_child = None
 
 
 class NovaServiceProfilingException(Exception):
@@ -18,6 +28,21 @@ class NovaServiceProfilingException(Exception):
     pass
 
 
+def _load_outputs(config):
+    """
+    Creates the output instances named in config.
+
+    @param config - Dictionary
+    @returns - List of output objects
+
+    """
+    loader = utils.PluginLoader()
+    outputs = []
+    for p_name, p_config in config.get('outputs', {}).iteritems():
+        outputs.append(loader.load(p_name, config=p_config))
+    return outputs
+
+
 class _Dumper():
     """
     Class for periodically dumping profiling stats for long running
@@ -34,88 +59,363 @@ class _Dumper():
         @param outputs - List of output objects
 
         """
+        # Imported here so that decorating costs nothing until a
+        # service is created
+        import random
+        from eventlet.event import Event
+
         self._config = config
         self._stop = False
-        self._sub_interval = 1
+        self._wakeup = Event()
+        self.pid = os.getpid()
         self._outputs = outputs
+        loader = utils.PluginLoader()
+        self._backend = loader.load(
+            config.backend, config=config.backend_config
+        )
+        self._collectors = [
+            loader.load(name, config=collector_config)
+            for name, collector_config in sorted(config.collectors.iteritems())
+        ]
+        self._collectors_started = None
+
+        transforms = []
+        if config.include_modules or config.exclude_modules:
+            module_filter = ModuleFilter(config.include_modules,
+                                         config.exclude_modules)
+            if hasattr(self._backend, 'set_module_filter'):
+                self._backend.set_module_filter(module_filter)
+            else:
+                # Filter on the writer for backends that cannot
+                transforms.append(
+                    lambda ctx, stats: module_filter.filter_stats(stats)
+                )
+        # The budget counts every traced call, so it measures the stats
+        # as captured, before deltas or pruning rebuild them
+        self._budget = None
+        if config.max_overhead_pct is not None:
+            self._budget = overhead.OverheadBudget(
+                config.max_overhead_pct,
+                cumulative=not config.clear_each_interval
+            )
+            transforms.append(self._budget)
+        if config.delta_each_interval:
+            transforms.append(DeltaEncoder())
+        # Pruning follows delta encoding, which needs every function
+        if config.prune_top_n is not None or \
+                config.prune_threshold_pct is not None:
+            transforms.append(Pruner(config.prune_top_n,
+                                     config.prune_threshold_pct,
+                                     config.prune_sort))
+        # Each interval submits its stats and a document per collector
+        self._writer = Writer(
+            outputs,
+            queue_size=config.writer_queue_size * (1 + len(self._collectors)),
+            transforms=transforms
+        )
 
         self._started = None
         self._ended = None
+        self._profiling = False
+        self._cpu_started = None
+        self._selection = None
         self._topic = getattr(service, 'topic', 'nova-unknown')
 
+        # Offset of this process's profiling window within each period
+        self._duty_cycle_offset = None
+        if config.duty_cycle_on is not None:
+            self._duty_cycle_offset = \
+                random.uniform(0, config.duty_cycle_jitter)
+
+    def discard(self):
+        """
+        Drops the profiler state a forked worker inherited from its
+        parent. The parent's threads do not exist in the worker, so only
+        the profiler itself is stopped and cleared.
+
+        """
+        try:
+            self._backend.stop()
+            self._backend.clear_stats()
+        except Exception:
+            pass
+
     def should_stop(self):
         """
         Returns whether or not profiler should stop
         """
         return self._stop
 
+    def stop(self):
+        """
+        Stops the worker. A worker waiting for its next dump wakes up
+        immediately. Must be called from a green thread.
+
+        """
+        self._stop = True
+        if not self._wakeup.ready():
+            self._wakeup.send()
+
+    def _next_deadline(self, previous, now, interval=None):
+        """
+        Returns when the next dump is due.
+
+        Aligned intervals end on multiples of the interval since the
+        epoch, so the first one may be short. Otherwise intervals follow
+        each other from the start without drifting.
+
+        @param previous - Float seconds the previous dump was due
+        @param now - Float seconds
+        @param interval - Optional seconds. Defaults to the interval
+            from config.
+        @returns - Float seconds
+
+        """
+        if interval is None:
+            interval = self._config.interval
+        if self._config.align_intervals:
+            return now - now % interval + interval
+        deadline = previous + interval
+        if deadline <= now:
+            # Dumps fell behind. Skip the missed deadlines.
+            deadline += (now - deadline) // interval * interval + interval
+        return deadline
+
+    def _context_time(self, seconds):
+        """
+        Converts seconds from time.time, which dumps are scheduled with,
+        to the clock of context timestamps. The offset between the two
+        is rounded to whole seconds so that aligned windows keep the
+        same labels across processes.
+
+        Scheduling with time.time keeps deadlines regular when the local
+        clock moves for a DST or timezone change. Only the labels of the
+        following intervals move with it.
+
+        @param seconds - Float seconds from time.time
+        @returns - Float seconds comparable to utils.utc_seconds
+
+        """
+        return seconds + round(utils.utc_seconds() - time.time())
+
+    def _wait_until(self, deadline):
+        """
+        Sleeps until deadline or until stopped.
+
+        @param deadline - Float seconds from time.time
+
+        """
+        while not self.should_stop():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            self._wakeup.wait(remaining)
+
+    def _is_selected(self, epoch):
+        """
+        Returns whether this process is among the processes profiled
+        during epoch, and records why for the next dump.
+
+        @param epoch - Integer index of the interval or period
+        @returns - Boolean
+
+        """
+        pct = self._config.select_pct
+        if pct is None:
+            return True
+        score = selection.score(utils.hostname(), os.getpid(),
+                                self._topic, epoch)
+        self._selection = {'pct': pct, 'epoch': epoch, 'score': score}
+        return selection.selected(score, pct)
+
     def set_clock_type(self):
         """
         Sets the clock type according to config
 
         """
-        profiler.set_clock_type(self._config.clock_type)
+        self._backend.set_clock_type(self._config.clock_type)
 
-    def _dump(self):
+    def _dump(self, ended=None):
         """
         Dumps the profiling stats.
-        Also manages clearing stats if clearing each interval.
 
-        """
-        # If clearing each interval, stop profiler
-        if self._config.clear_each_interval:
-            profiler.stop()
-            self._ended = utils.utc_seconds()
+        The backend keeps running. It only captures its raw counters,
+        resetting them if clearing each interval, and the writer thread
+        converts and writes them afterward. With delta dumps the counters
+        stay cumulative and the writer only writes what changed.
+
+        @param ended - Optional float seconds the interval ended.
+            Defaults to now.
 
-        # Dump the stats
-        stats = profiler.get_func_stats()
+        """
+        if ended is None:
+            ended = utils.utc_seconds()
+        cpu_began = cpu_time()
+        snapshot = self._backend.snapshot(
+            reset=self._config.clear_each_interval
+        )
+        cpu_ended = cpu_time()
         ctx = ProfilingContext(
-            started=self._started, ended=utils.utc_seconds(),
+            pid=self.pid, started=self._started, ended=ended,
             topic=self._topic
         )
-        for o in self._outputs:
-            try:
-                o.write(ctx, stats)
-            except Exception:
-                # @TODO - Possibly do something with logging
-                pass
+        ctx.metadata['writer'] = self._writer.metrics()
+        if self._selection is not None:
+            ctx.metadata['selection'] = self._selection
+        if self._budget is not None:
+            ctx.metadata['overhead'] = {
+                'dump': cpu_ended - cpu_began,
+                'cpu': cpu_ended - self._cpu_started
+            }
+            self._cpu_started = cpu_ended
+        if self._duty_cycle_offset is not None:
+            ctx.metadata['duty_cycle'] = {
+                'on': self._config.duty_cycle_on,
+                'period': self._config.duty_cycle_period,
+                'offset': self._duty_cycle_offset
+            }
+        self._writer.submit(ctx, snapshot)
+
+        # If clearing or writing deltas, the next interval starts now
+        reset = self._config.clear_each_interval or \
+            self._config.delta_each_interval
+        if reset:
+            self._started = ended
+
+    def _dump_collectors(self, ended):
+        """
+        Submits what each collector gathered since the collectors were
+        last reset, in a file of the collector's kind. Collectors are
+        dumped every interval, whether or not it was profiled, and reset
+        whenever the stats would be.
+
+        @param ended - Float seconds
+
+        """
+        reset = self._config.clear_each_interval or \
+            self._config.delta_each_interval
+        for collector in self._collectors:
+            ctx = ProfilingContext(
+                pid=self.pid, started=self._collectors_started,
+                ended=ended, topic=self._topic, kind=collector.kind
+            )
+            self._writer.submit(ctx, collector.snapshot(reset=reset))
+        if reset:
+            self._collectors_started = ended
+
+    def _start_interval(self, started):
+        """
+        Starts or stops the profiler for the interval starting at
+        started. Every interval is profiled unless this process is not
+        selected for it or the overhead budget skips it.
+
+        @param started - Float seconds from time.time
+
+        """
+        epoch = int(started // self._config.interval)
+        profile = self._is_selected(epoch) and \
+            (self._budget is None or self._budget.should_profile())
+        if profile and not self._profiling:
+            self._backend.start()
+            if self._config.clear_each_interval:
+                self._started = self._context_time(started)
+        elif not profile and self._profiling:
+            self._backend.stop()
+        self._profiling = profile
+        self._cpu_started = cpu_time()
+
+    def _run_continuously(self):
+        """
+        Profiles all the time, dumping at the end of each interval.
+
+        """
+        deadline = time.time()
+        self._start_interval(deadline)
+        while not self.should_stop():
+            deadline = self._next_deadline(deadline, time.time())
+            self._wait_until(deadline)
+            if self.should_stop():
+                return
+            # Label the interval with its deadline so that aligned
+            # windows match across processes
+            ended = self._context_time(deadline)
+            if self._profiling:
+                self._dump(ended=ended)
+            self._dump_collectors(ended)
+            self._start_interval(deadline)
+
+    def _run_duty_cycle(self):
+        """
+        Profiles for duty_cycle_on seconds of every duty_cycle_period,
+        starting this process's offset into the period, and dumps each
+        window as it closes.
 
-        # If clearing each interval, clear stats and restart profiler
-        if self._config.clear_each_interval:
-            profiler.clear_stats()
-            profiler.start()
-            self.started = utils.utc_seconds()
+        """
+        on = self._config.duty_cycle_on
+        period = self._config.duty_cycle_period
+        boundary = time.time()
+        while not self.should_stop():
+            boundary = self._next_deadline(boundary, time.time(),
+                                           interval=period)
+            window = boundary + self._duty_cycle_offset
+            self._wait_until(window)
+            if self.should_stop():
+                return
+            if not self._is_selected(int(boundary // period)) or \
+                    (self._budget is not None and
+                     not self._budget.should_profile()):
+                self._wait_until(window + on)
+                if not self.should_stop():
+                    self._dump_collectors(self._context_time(window + on))
+                continue
+            self._backend.start()
+            self._started = self._context_time(window)
+            self._cpu_started = cpu_time()
+            self._wait_until(window + on)
+            if not self.should_stop():
+                ended = self._context_time(window + on)
+                self._dump(ended=ended)
+                # Collectors cover the whole period, not just the window
+                self._dump_collectors(ended)
+            self._backend.stop()
 
     def work(self):
         """
-        Long running loop that periodically dumps the stats.
+        Long running loop that dumps the stats at the end of each
+        interval, or of each window of the duty cycle.
 
         """
-        if profiler.is_running():
+        if self._backend.is_running():
             raise NovaServiceProfilingException("Profiling already enabled.")
 
         # Set clock type
         self.set_clock_type()
 
-        # Start profiler
-        profiler.start()
-        self._started = utils.utc_seconds()
-
-        last_dumped = time.time()
+        # Measure what each call costs to estimate the overhead
+        if self._budget is not None:
+            self._budget.per_call = overhead.calibrate(self._backend)
 
-        while not self.should_stop():
-            # Sleep for less than whole interval for faster interrupts
-            sleep(self._sub_interval)
-            checked = time.time()
-            # Only take action if we have exceeded the interval period
-            if (checked - last_dumped) > self._config.interval:
-                self._dump()
-                # Update last dumped
-                last_dumped = checked
+        # Start the writer. The profiler is started by each interval.
+        self._writer.start()
+        self._started = utils.utc_seconds()
 
-        # Finally stop the profiler
-        profiler.stop()
-        self._ended = utils.utc_seconds()
+        try:
+            # Collectors run for as long as the worker
+            self._collectors_started = self._started
+            for collector in self._collectors:
+                collector.start()
+            if self._duty_cycle_offset is None:
+                self._run_continuously()
+            else:
+                self._run_duty_cycle()
+        finally:
+            # Finally stop the profiler and flush the writer, even if
+            # the green thread was killed
+            self._backend.stop()
+            for collector in self._collectors:
+                collector.stop()
+            self._ended = utils.utc_seconds()
+            self._writer.stop()
 
 
 class _ServiceDecorator(BaseDecorator):
@@ -146,6 +446,9 @@ class _ServiceDecorator(BaseDecorator):
         if old_init is None:
             return module
 
+        old_stop = getattr(klass, 'stop', None)
+        old_start = getattr(klass, 'start', None)
+
         # Replace init method with new one
         def new_init(init_self, *args, **kwargs):
             """
@@ -161,18 +464,145 @@ class _ServiceDecorator(BaseDecorator):
             profile_config = ProfilingConfig(config)
 
             # Create output instances
-            loader = utils.PluginLoader()
-            outputs = []
-            for p_name, p_config in config.get('outputs', {}).iteritems():
-                outputs.append(loader.load(p_name, config=p_config))
+            outputs = _load_outputs(config)
 
             # Create the dumper
             dumper = _Dumper(init_self, profile_config, outputs)
 
             # Use the service's threadsgroup to add a thread
             init_self.tg.add_thread(dumper.work)
+            init_self._os_code_profiler_dumper = dumper
+
+        def new_stop(stop_self, *args, **kwargs):
+            """
+            Replacement for stop.
+            Wakes the dumper so it stops and flushes before the
+            thread group is stopped.
+
+            """
+            dumper = getattr(stop_self, '_os_code_profiler_dumper', None)
+            if dumper is not None:
+                dumper.stop()
+            return old_stop(stop_self, *args, **kwargs)
+
+        def new_start(start_self, *args, **kwargs):
+            """
+            Replacement for start.
+            Re-arms profiling with fresh state in a forked worker before
+            the service starts there.
+
+            """
+            dumper = getattr(start_self, '_os_code_profiler_dumper', None)
+            if dumper is not None and dumper.pid != os.getpid():
+                self._rearm(start_self, dumper, config)
+            return old_start(start_self, *args, **kwargs)
 
         setattr(klass, '__init__', new_init)
+        if old_stop is not None:
+            setattr(klass, 'stop', new_stop)
+        if old_start is not None:
+            setattr(klass, 'start', new_start)
+
+        launcher = getattr(module, 'ProcessLauncher', None)
+        if launcher is not None and hasattr(launcher, '_start_child'):
+            self._decorate_launcher(launcher, config)
         return module
 
+    def _rearm(self, service, dumper, config):
+        """
+        Replaces the dumper a forked worker inherited with a new one,
+        unless the parent did not select the worker for profiling.
+
+        @param service - Service object
+        @param dumper - Inherited _Dumper object
+        @param config - Dictionary
+
+        """
+        dumper.discard()
+        service._os_code_profiler_dumper = None
+
+        child = _fork_child
+        if child is None:
+            # Forked by something other than the ProcessLauncher
+            child = {'selected': True, 'fd': None, 'inherited': []}
+        for fd in child['inherited']:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if not child['selected']:
+            return
+
+        if child['fd'] is not None:
+            outputs = [PipeOutput(child['fd'])]
+        else:
+            outputs = _load_outputs(config)
+        dumper = _Dumper(service, ProfilingConfig(config), outputs)
+        service.tg.add_thread(dumper.work)
+        service._os_code_profiler_dumper = dumper
+
+    def _decorate_launcher(self, klass, config):
+        """
+        Alters the process launcher so that workers are profiled instead
+        of the parent, at most max_workers at a time, and optionally
+        send their dumps to the parent for aggregation.
+
+        @param klass - ProcessLauncher class
+        @param config - Dictionary
+
+        """
+        old_start_child = klass._start_child
+        old_stop = getattr(klass, 'stop', None)
+
+        def new_start_child(launcher_self, wrap, *args, **kwargs):
+            """
+            Replacement for _start_child.
+            Prepares the worker about to be forked.
+
+            """
+            global _fork_child
+            service = getattr(wrap, 'service', None)
+            dumper = getattr(service, '_os_code_profiler_dumper', None)
+            if dumper is None:
+                return old_start_child(launcher_self, wrap, *args, **kwargs)
+
+            workers = getattr(service, '_os_code_profiler_workers', None)
+            if workers is None:
+                profile_config = dumper._config
+                aggregator = None
+                if profile_config.aggregate_workers:
+                    aggregator = Aggregator(
+                        Writer(_load_outputs(config),
+                               queue_size=profile_config.writer_queue_size),
+                        profile_config.aggregate_timeout
+                    )
+                workers = Workers(profile_config.max_workers, aggregator)
+                service._os_code_profiler_workers = workers
+                if not hasattr(launcher_self, '_os_code_profiler_workers'):
+                    launcher_self._os_code_profiler_workers = []
+                launcher_self._os_code_profiler_workers.append(workers)
+                # The service runs in the workers, not in the parent
+                dumper.stop()
+
+            _fork_child = workers.before_fork(getattr(wrap, 'children', ()))
+            pid = old_start_child(launcher_self, wrap, *args, **kwargs)
+            workers.after_fork(pid, _fork_child)
+            return pid
+
+        def new_stop(stop_self, *args, **kwargs):
+            """
+            Replacement for stop.
+            Writes what the workers sent once they are stopped.
+
+            """
+            result = old_stop(stop_self, *args, **kwargs)
+            for workers in getattr(stop_self, '_os_code_profiler_workers',
+                                   []):
+                workers.stop()
+            return result
+
+        setattr(klass, '_start_child', new_start_child)
+        if old_stop is not None:
+            setattr(klass, 'stop', new_stop)
+
 Service = _ServiceDecorator()
@@ -1,17 +1,115 @@
 import datetime
+import marshal
 import os
+import re
+
+from os_code_profiler.common import compression
+from os_code_profiler.common import utils
+
+_filename_re = re.compile(
+    r'^(?P<started>[0-9T:.-]+)_to_(?P<ended>[0-9T:.-]+)_(?P<pid>\d+)'
+    r'\.(?P<kind>[a-z_]+)(\.[a-z0-9]+)?$'
+)
+
+
+def is_stats_file(name):
+    """
+    Returns whether name is a stats file, compressed or not.
+
+    @param name - String
+    @returns - Boolean
+
+    """
+    if name.endswith('.stats'):
+        return True
+    for method in compression.methods.itervalues():
+        if name.endswith('.stats' + method.extension):
+            return True
+    return False
+
+
+def parse_timestamp(value):
+    """
+    Parses a timestamp in the isoformat used by file names.
+
+    @param value - String. ex: '2015-11-18T17:07:43.491419'
+    @returns - Float seconds since the epoch
+
+    """
+    fmt = '%Y-%m-%dT%H:%M:%S'
+    if '.' in value:
+        fmt += '.%f'
+    parsed = datetime.datetime.strptime(value, fmt)
+    return (parsed - utils.epoch).total_seconds()
+
+
+def parse_filename(name):
+    """
+    Parses the fields encoded in a file name made by FileOutput.
+
+    @param name - String base name of the file
+    @returns - Dict with started, ended, pid and kind or None if the
+        name was not made by FileOutput. Kind is 'stats' for function
+        stats and the collector's kind for other files.
+
+    """
+    match = _filename_re.match(name)
+    if match is None:
+        return None
+    try:
+        return {
+            'started': parse_timestamp(match.group('started')),
+            'ended': parse_timestamp(match.group('ended')),
+            'pid': int(match.group('pid')),
+            'kind': match.group('kind')
+        }
+    except ValueError:
+        return None
 
 
 class FileOutput(object):
     """
     Class for outputting profiling results to a file.
 
+    Config keys:
+        results_dir - Directory to write under. Defaults to
+            /var/log/os_code_profiler
+        compression - Optional method. gzip|zlib|bz2, or lzma when the
+            lzma module is importable. Adds the method's extension to
+            file names.
+        compression_level - Optional integer level for the method
+        index - Boolean. Keep an index of written files.
+        max_age, max_bytes, max_files, rollup, rollup_after,
+        rescan_interval - Optional retention limits. See Retention.
+
+    Files are written to a hidden temporary name in the same directory
+    and renamed into place, so readers never see a partial file.
+
     """
     def __init__(self, config):
         """
+        @param config - Dictionary
+        @raises CompressionException for an unknown compression method
+            or level
+
         """
         self._results_dir = config.get('results_dir',
                                        '/var/log/os_code_profiler')
+        self._compression = None
+        self._compression_level = None
+        if config.get('compression'):
+            self._compression = compression.get_method(config['compression'])
+            self._compression_level = self._compression.level(
+                config.get('compression_level')
+            )
+        self._index = None
+        if config.get('index', False):
+            from os_code_profiler.outputs.index import Index
+            self._index = Index(self._results_dir)
+        self._retention = None
+        from os_code_profiler.outputs.retention import Retention
+        if Retention.configured(config):
+            self._retention = Retention(config, self)
 
     def _path(self, ctx):
         """
@@ -46,17 +144,121 @@ class FileOutput(object):
         """
         start = datetime.datetime.utcfromtimestamp(ctx.started)
         end = datetime.datetime.utcfromtimestamp(ctx.ended)
-        return '%s_to_%s_%s.stats' % (start.isoformat(), end.isoformat(), ctx.pid)
+        kind = getattr(ctx, 'kind', 'stats')
+        name = '%s_to_%s_%s.%s' % (start.isoformat(), end.isoformat(),
+                                   ctx.pid, kind)
+        if self._compression is not None:
+            name += self._compression.extension
+        return name
 
-    def write(self, ctx, stats):
+    def _dump(self, ctx, stats, tmpname):
         """
-        Writes the stats object to a file using the stats' save method.
+        Writes the stats object and context to tmpname, compressed when
+        configured.
 
         @param ctx - Context object
-        @param stats- yFuncStats object from yappi/GreenletProfiler
+        @param stats - Stats object, collector document or yFuncStats
+            object from yappi
+        @param tmpname - String
+
+        """
+        if not hasattr(stats, 'dump'):
+            if self._compression is None:
+                stats.save(tmpname)
+                return
+            rawname = tmpname + '.raw'
+            stats.save(rawname)
+            try:
+                compression.compress_file(rawname, tmpname,
+                                          self._compression,
+                                          self._compression_level)
+            finally:
+                os.remove(rawname)
+            return
+
+        with open(tmpname, 'wb') as f:
+            out = f
+            if self._compression is not None:
+                out = compression.CompressedWriter(
+                    f, self._compression, self._compression_level
+                )
+            stats.dump(out)
+            if out is f:
+                f.write(marshal.dumps(ctx.to_dict()))
+                return
+            out.write(marshal.dumps(ctx.to_dict(),
+                                    compression.marshal_version))
+            out.finish()
+
+    def _write(self, ctx, stats):
+        """
+        Writes the stats object to a temporary file and renames it into
+        place.
+
+        @param ctx - Context object
+        @param stats - Stats object or yFuncStats object from yappi
+        @returns - String full name of the file
 
         """
         path = self._path(ctx)
         self._mkdirs(path)
-        fullname = os.path.join(path, self._filename(ctx))
-        stats.save(fullname)
+        name = self._filename(ctx)
+        fullname = os.path.join(path, name)
+        tmpname = os.path.join(path, '.%s.%s.tmp' % (name, os.getpid()))
+        try:
+            self._dump(ctx, stats, tmpname)
+            os.rename(tmpname, fullname)
+        except Exception:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+        return fullname
+
+    def _record(self, ctx, fullname):
+        """
+        Adds a written stats file to the index when it is enabled.
+        Files of other kinds are not indexed.
+
+        @param ctx - Context object
+        @param fullname - String
+        @returns - Integer size of the file in bytes
+
+        """
+        size = os.path.getsize(fullname)
+        if self._index is not None and \
+                getattr(ctx, 'kind', 'stats') == 'stats':
+            self._index.add(ctx, fullname, size)
+        return size
+
+    def _forget(self, paths):
+        """
+        Removes deleted files from the index when it is enabled.
+
+        @param paths - List of file names
+
+        """
+        if self._index is not None:
+            self._index.remove(paths)
+
+    def write(self, ctx, stats):
+        """
+        Writes the stats object to a file.
+
+        Stats that can dump to an open file are followed by the context,
+        so each file describes itself. Uncompressed files can be opened
+        with pstats, which ignores the trailing data.
+        Other stats objects are written using their save method.
+        When the index is enabled the file is added to it once written,
+        and then retention limits are enforced.
+
+        @param ctx - Context object
+        @param stats- Stats object or yFuncStats object from yappi
+
+        """
+        fullname = self._write(ctx, stats)
+        if self._index is None and self._retention is None:
+            return
+        size = self._record(ctx, fullname)
+        if self._retention is not None:
+            path, name = os.path.split(fullname)
+            self._retention.added(path, name, size)
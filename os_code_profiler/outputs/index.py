@@ -0,0 +1,270 @@
+import os
+import sqlite3
+import time
+
+from os_code_profiler.outputs.file import parse_filename
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    hostname TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    started REAL NOT NULL,
+    ended REAL NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    written REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_topic_started ON files (topic, started);
+CREATE INDEX IF NOT EXISTS files_host_topic_started
+    ON files (hostname, topic, started);
+CREATE INDEX IF NOT EXISTS files_started ON files (started);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+_columns = ['hostname', 'topic', 'pid', 'started', 'ended', 'path', 'size']
+
+
+class Index(object):
+    """
+    SQLite index of the stats files in a FileOutput results directory.
+
+    One row is added for every file written, holding its context
+    fields and size, so time range lookups by host and topic do not need
+    to walk the tree. Paths are stored relative to the results directory.
+
+    The longest window indexed is kept in the meta table. A file ending
+    after a time must start less than that long before it, which bounds
+    time range lookups on both sides of started however long the
+    history is.
+
+    A connection is opened for each call. Calls happen once per written
+    file and it keeps the index safe to use from the writer thread and
+    from many processes sharing a results directory. The schema is
+    created on the first connection of each Index object only.
+
+    """
+
+    filename = 'index.sqlite'
+
+    # Seconds to wait for another process holding the database lock
+    timeout = 30
+
+    def __init__(self, results_dir):
+        """
+        @param results_dir - String
+
+        """
+        self._results_dir = results_dir
+        self._path = os.path.join(results_dir, self.filename)
+        self._created = False
+
+    def _create(self, connection):
+        """
+        Creates the schema if needed. Indexes made before the meta table
+        learn their longest window, which scans every file, so it is
+        only done when the window is missing.
+
+        """
+        connection.executescript(_schema)
+        with connection:
+            row = connection.execute(
+                "SELECT value FROM meta WHERE key = 'max_window'"
+            ).fetchone()
+            if row is None:
+                connection.execute(
+                    "INSERT OR IGNORE INTO meta (key, value) "
+                    "SELECT 'max_window', "
+                    "COALESCE(MAX(ended - started), 0) FROM files"
+                )
+
+    def _connect(self):
+        """
+        Returns a new connection, creating the schema on the first one.
+
+        """
+        connection = sqlite3.connect(self._path, timeout=self.timeout)
+        if not self._created:
+            try:
+                self._create(connection)
+            except Exception:
+                connection.close()
+                raise
+            self._created = True
+        return connection
+
+    def _insert(self, connection, rows):
+        """
+        Inserts rows and widens the longest window to fit them.
+        Must be called within a transaction.
+
+        """
+        now = time.time()
+        values = []
+        max_window = 0
+        for hostname, topic, pid, started, ended, path, size in rows:
+            values.append((
+                hostname, topic, pid, started, ended,
+                os.path.relpath(path, self._results_dir), size, now
+            ))
+            max_window = max(max_window, ended - started)
+        connection.executemany(
+            'INSERT INTO files (hostname, topic, pid, started, '
+            'ended, path, size, written) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', values
+        )
+        connection.execute(
+            "UPDATE meta SET value = MAX(value, ?) WHERE key = 'max_window'",
+            (max_window,)
+        )
+
+    def add_many(self, rows):
+        """
+        Appends rows to the index in one transaction.
+
+        @param rows - Iterable of tuples. (hostname, topic, pid, started,
+            ended, path, size)
+
+        """
+        connection = self._connect()
+        try:
+            with connection:
+                self._insert(connection, rows)
+        finally:
+            connection.close()
+
+    def add(self, ctx, path, size):
+        """
+        Appends a written file to the index.
+
+        @param ctx - Context object
+        @param path - String full name of the file
+        @param size - Integer bytes
+
+        """
+        self.add_many([(ctx.hostname, ctx.topic, ctx.pid,
+                        ctx.started, ctx.ended, path, size)])
+
+    def remove(self, paths):
+        """
+        Removes deleted files from the index.
+
+        @param paths - List of full file names
+
+        """
+        if not os.path.exists(self._path):
+            return
+        values = [(os.path.relpath(path, self._results_dir),)
+                  for path in paths]
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany('DELETE FROM files WHERE path = ?',
+                                       values)
+        finally:
+            connection.close()
+
+    def query(self, hosts=None, topics=None, pids=None,
+              start=None, end=None):
+        """
+        Finds files by host, topic, pid and time range.
+
+        @param hosts - Optional list of hostname glob patterns
+        @param topics - Optional list of topic glob patterns
+        @param pids - Optional collection of integer pids
+        @param start - Optional float seconds. Files ending before are
+            skipped.
+        @param end - Optional float seconds. Files starting at or after
+            are skipped.
+        @returns - List of dictionaries with hostname, topic, pid,
+            started, ended, path and size, ordered by started.
+
+        """
+        clauses = []
+        params = []
+        for column, patterns in [('hostname', hosts), ('topic', topics)]:
+            if patterns:
+                clauses.append('(%s)' % ' OR '.join(
+                    ['%s GLOB ?' % column] * len(patterns)
+                ))
+                params.extend(patterns)
+        if pids:
+            pids = list(pids)
+            clauses.append('pid IN (%s)' % ', '.join(['?'] * len(pids)))
+            params.extend(pids)
+        if end is not None:
+            clauses.append('started < ?')
+            params.append(end)
+
+        if not os.path.exists(self._path):
+            return []
+        connection = self._connect()
+        try:
+            if start is not None:
+                max_window, = connection.execute(
+                    "SELECT value FROM meta WHERE key = 'max_window'"
+                ).fetchone()
+                clauses.append('started > ?')
+                params.append(start - max_window)
+                clauses.append('ended > ?')
+                params.append(start)
+
+            sql = 'SELECT %s FROM files' % ', '.join(_columns)
+            if clauses:
+                sql += ' WHERE ' + ' AND '.join(clauses)
+            sql += ' ORDER BY started, id'
+            rows = connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+        results = []
+        for row in rows:
+            result = dict(zip(_columns, row))
+            result['path'] = os.path.join(self._results_dir, result['path'])
+            results.append(result)
+        return results
+
+    def rebuild(self):
+        """
+        Replaces the index with the files currently in the results
+        directory in one transaction, so readers never see it empty.
+        Used to adopt a tree written without an index.
+
+        @returns - Integer number of files indexed
+
+        """
+        rows = []
+        for hostname in sorted(os.listdir(self._results_dir)):
+            host_dir = os.path.join(self._results_dir, hostname)
+            if not os.path.isdir(host_dir):
+                continue
+            for topic in sorted(os.listdir(host_dir)):
+                topic_dir = os.path.join(host_dir, topic)
+                if not os.path.isdir(topic_dir):
+                    continue
+                for name in sorted(os.listdir(topic_dir)):
+                    fields = parse_filename(name)
+                    if fields is None or fields['kind'] != 'stats':
+                        continue
+                    path = os.path.join(topic_dir, name)
+                    rows.append((
+                        hostname, topic, fields['pid'], fields['started'],
+                        fields['ended'], path, os.path.getsize(path)
+                    ))
+
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('DELETE FROM files')
+                connection.execute(
+                    "UPDATE meta SET value = 0 WHERE key = 'max_window'"
+                )
+                self._insert(connection, rows)
+        finally:
+            connection.close()
+        return len(rows)
@@ -0,0 +1,327 @@
+import bisect
+import errno
+import fcntl
+import os
+
+from os_code_profiler.common import stats as stats_module
+from os_code_profiler.common import utils
+from os_code_profiler.common.profiling import ConfigException, Context
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.outputs.file import parse_filename
+
+
+class _Directory(object):
+    """
+    Files known to be in one hostname/topic directory, oldest first.
+
+    Entries are tuples of (started, name, ended, pid, size) so that
+    they sort by start time and can be searched with bisect.
+
+    """
+    def __init__(self, entries, scanned):
+        """
+        @param entries - Sorted list of entry tuples
+        @param scanned - Float seconds when the directory was listed
+
+        """
+        self.entries = entries
+        self.size = sum(entry[4] for entry in entries)
+        self.scanned = scanned
+        self.rolled_until = None
+
+    def insert(self, entry):
+        """
+        Adds an entry, keeping the entries sorted.
+
+        @param entry - Entry tuple
+
+        """
+        bisect.insort(self.entries, entry)
+        self.size += entry[4]
+
+
+class Retention(object):
+    """
+    Limits what FileOutput keeps in each hostname/topic directory.
+
+    Config keys, read from the output's config:
+        max_age - Seconds. Files that ended longer ago are deleted.
+        max_bytes - Total bytes kept per hostname/topic.
+        max_files - Number of files kept per hostname/topic.
+        rollup - hour|day. Merge old files of each pid into one file
+            per hour or day instead of keeping every interval.
+        rollup_after - Seconds a period must have ended before it is
+            rolled up. Defaults to a day.
+        rescan_interval - Seconds between listings of a directory.
+            Defaults to an hour.
+
+    A directory is listed the first time it is written to and then
+    tracked in memory as files are written, so enforcing the limits on
+    each write only looks at the oldest files. Other processes writing
+    to the same directory are picked up when it is listed again every
+    rescan_interval. The newest file is never deleted.
+
+    At most one period is rolled up per write. Rolling up takes a lock
+    file in the directory and lists it, so processes sharing a directory
+    never merge the same files twice. Rollups sum the counters of the
+    files they replace, which suits files cleared each interval. Delta
+    files should not be rolled up or expired while they are still needed
+    to rebuild cumulative stats.
+
+    """
+
+    periods = {'hour': 3600, 'day': 86400}
+
+    lock_name = '.retention.lock'
+
+    def __init__(self, config, output):
+        """
+        @param config - Dictionary
+        @param output - FileOutput object that owns the files
+        @raises ConfigException for invalid limits or an unknown rollup
+            period
+
+        """
+        self._max_age = config.get('max_age')
+        if self._max_age is not None:
+            self._max_age = float(self._max_age)
+            if self._max_age <= 0:
+                raise ConfigException("max_age must be positive")
+        self._max_bytes = config.get('max_bytes')
+        if self._max_bytes is not None:
+            self._max_bytes = int(self._max_bytes)
+            if self._max_bytes < 1:
+                raise ConfigException("max_bytes must be at least 1")
+        self._max_files = config.get('max_files')
+        if self._max_files is not None:
+            self._max_files = int(self._max_files)
+            if self._max_files < 1:
+                raise ConfigException("max_files must be at least 1")
+        self._rollup = config.get('rollup')
+        self._period = None
+        if self._rollup is not None:
+            self._rollup = str(self._rollup).lower()
+            if self._rollup not in self.periods:
+                raise ConfigException("rollup must be hour|day")
+            self._period = self.periods[self._rollup]
+        self._rollup_after = float(config.get('rollup_after', 86400))
+        if self._rollup_after < 0:
+            raise ConfigException("rollup_after must not be negative")
+        self._rescan_interval = float(config.get('rescan_interval', 3600))
+        if self._rescan_interval < 0:
+            raise ConfigException("rescan_interval must not be negative")
+        self._output = output
+        self._directories = {}
+
+    @staticmethod
+    def configured(config):
+        """
+        Returns whether config asks for any retention.
+
+        @param config - Dictionary
+        @returns - Boolean
+
+        """
+        for key in ['max_age', 'max_bytes', 'max_files', 'rollup']:
+            if config.get(key) is not None:
+                return True
+        return False
+
+    def _scan(self, path, now):
+        """
+        Lists the stats files in path.
+
+        @param path - String
+        @param now - Float seconds
+        @returns - _Directory object
+
+        """
+        entries = []
+        try:
+            names = os.listdir(path)
+        except OSError:
+            names = []
+        for name in names:
+            fields = parse_filename(name)
+            if fields is None:
+                continue
+            try:
+                size = os.path.getsize(os.path.join(path, name))
+            except OSError:
+                # Removed by another process since the listing
+                continue
+            entries.append((fields['started'], name, fields['ended'],
+                            fields['pid'], size))
+        entries.sort()
+        return _Directory(entries, now)
+
+    def added(self, path, name, size, now=None):
+        """
+        Records a file written to path and enforces the limits there.
+
+        @param path - String hostname/topic directory
+        @param name - String base name of the file
+        @param size - Integer bytes
+        @param now - Optional float seconds. Defaults to the current time.
+
+        """
+        if now is None:
+            now = utils.utc_seconds()
+        directory = self._directories.get(path)
+        if directory is None or \
+                now - directory.scanned >= self._rescan_interval:
+            rolled_until = None
+            if directory is not None:
+                rolled_until = directory.rolled_until
+            directory = self._directories[path] = self._scan(path, now)
+            directory.rolled_until = rolled_until
+        else:
+            fields = parse_filename(name)
+            directory.insert((fields['started'], name, fields['ended'],
+                              fields['pid'], size))
+
+        if self._period is not None and self._roll_up(path, directory, now):
+            rolled_until = directory.rolled_until
+            directory = self._directories[path] = self._scan(path, now)
+            directory.rolled_until = rolled_until
+        self._expire(path, directory, now)
+
+    def _expire(self, path, directory, now):
+        """
+        Deletes the oldest files until the limits are met.
+
+        @param path - String
+        @param directory - _Directory object
+        @param now - Float seconds
+
+        """
+        entries = directory.entries
+        count = len(entries)
+        size = directory.size
+        expired = 0
+        while expired < count - 1:
+            started, name, ended, pid, file_size = entries[expired]
+            if self._max_age is not None and ended <= now - self._max_age:
+                pass
+            elif self._max_files is not None and \
+                    count - expired > self._max_files:
+                pass
+            elif self._max_bytes is not None and size > self._max_bytes:
+                pass
+            else:
+                break
+            size -= file_size
+            expired += 1
+
+        if not expired:
+            return
+        paths = [os.path.join(path, entry[1]) for entry in entries[:expired]]
+        del entries[:expired]
+        directory.size = size
+        self._remove(paths)
+
+    def _remove(self, paths):
+        """
+        Deletes files, ignoring files that are already gone.
+
+        @param paths - List of file names
+
+        """
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        self._output._forget(paths)
+
+    def _roll_up(self, path, directory, now):
+        """
+        Rolls up the oldest period not yet rolled up if it ended more
+        than rollup_after seconds ago.
+
+        @param path - String
+        @param directory - _Directory object
+        @param now - Float seconds
+        @returns - Boolean. True if files were replaced.
+
+        """
+        entries = directory.entries
+        first = 0
+        if directory.rolled_until is not None:
+            first = bisect.bisect_left(entries, (directory.rolled_until,))
+        if first >= len(entries):
+            return False
+        started = entries[first][0]
+        start = started - started % self._period
+        end = start + self._period
+        if end > now - self._rollup_after:
+            return False
+        replaced = self._roll_up_period(path, start, end)
+        directory.rolled_until = end
+        return replaced
+
+    def _roll_up_period(self, path, start, end):
+        """
+        Merges the files of each pid that started within [start, end)
+        into one file.
+
+        @param path - String
+        @param start - Float seconds
+        @param end - Float seconds
+        @returns - Boolean. True if files were replaced.
+
+        """
+        with open(os.path.join(path, self.lock_name), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                # Another process is rolling up this directory
+                return False
+
+            by_pid = {}
+            for name in os.listdir(path):
+                fields = parse_filename(name)
+                if fields is not None and fields['kind'] == 'stats' and \
+                        start <= fields['started'] < end:
+                    by_pid.setdefault(fields['pid'], []).append(
+                        (fields['started'], name, fields)
+                    )
+
+            path = path.rstrip(os.sep)
+            topic = os.path.basename(path)
+            hostname = os.path.basename(os.path.dirname(path))
+            replaced = False
+            for pid, files in sorted(by_pid.iteritems()):
+                if len(files) < 2:
+                    continue
+                merged = Stats()
+                merged_paths = []
+                started = None
+                ended = None
+                for file_started, name, fields in sorted(files):
+                    fullname = os.path.join(path, name)
+                    try:
+                        merged.add(stats_module.load(fullname))
+                    except Exception:
+                        # Unreadable files are left for expiry
+                        continue
+                    merged_paths.append(fullname)
+                    if started is None or fields['started'] < started:
+                        started = fields['started']
+                    if ended is None or fields['ended'] > ended:
+                        ended = fields['ended']
+                if len(merged_paths) < 2:
+                    continue
+
+                ctx = Context(
+                    hostname=hostname, pid=pid, started=started,
+                    ended=ended, topic=topic,
+                    metadata={'rollup': {'period': self._rollup,
+                                         'files': len(merged_paths)}}
+                )
+                fullname = self._output._write(ctx, merged)
+                self._output._record(ctx, fullname)
+                self._remove([p for p in merged_paths if p != fullname])
+                replaced = True
+            return replaced
@@ -0,0 +1,411 @@
+import errno
+import fcntl
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+
+from os_code_profiler.common import utils
+from os_code_profiler.common.profiling import ConfigException, Context
+from os_code_profiler.common.pruning import OTHER
+from os_code_profiler.common.stats import Stats
+
+# magic, version, slots, closed, publishers, dropped, started, ended
+_header = struct.Struct('=4sIIIIIdd')
+
+# function id, cc, nc, tt, ct
+_slot = struct.Struct('=Qqqdd')
+
+_magic = 'OSCP'
+_version = 1
+
+
+class SharedMemoryException(Exception):
+    """Simple shared memory exception"""
+    pass
+
+
+def function_id(func):
+    """
+    Returns the id of a function, the same in every process.
+
+    @param func - Tuple. (filename, lineno, funcname)
+    @returns - Non zero integer
+
+    """
+    digest = hashlib.md5('%s\0%s\0%s' % func).digest()
+    return struct.unpack('=Q', digest[:8])[0] or 1
+
+
+def _owner(ctx):
+    """
+    Returns what names the segments of ctx's host and topic.
+
+    """
+    return '%s_%s' % (ctx.hostname, ctx.topic)
+
+
+class _Segment(object):
+    """
+    One interval of one topic, shared by the processes on a host.
+
+    The segment file holds a header and a fixed table of function
+    counters addressed by function id with linear probing, followed by
+    one more entry for the functions that did not fit. Names of the
+    functions are appended to a sidecar file when they are first added.
+    Every access happens under an exclusive lock on the segment file.
+
+    """
+    def __init__(self, path, slots):
+        """
+        Opens the segment, creating it if needed, and locks it.
+
+        @param path - String
+        @param slots - Integer size of the table for new segments
+
+        """
+        self.path = path
+        self.names_path = path + '.names'
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            size = os.fstat(self._fd).st_size
+            if size == 0:
+                size = _header.size + (slots + 1) * _slot.size
+                os.ftruncate(self._fd, size)
+                self._map = mmap.mmap(self._fd, size)
+                self._write_header(_magic, _version, slots, 0, 0, 0,
+                                   0.0, 0.0)
+            else:
+                self._map = mmap.mmap(self._fd, size)
+            header = _header.unpack_from(self._map, 0)
+            if header[0] != _magic or header[1] != _version:
+                raise SharedMemoryException("%s is not a segment" % path)
+        except Exception:
+            os.close(self._fd)
+            raise
+        self.slots = header[2]
+
+    def _write_header(self, *fields):
+        _header.pack_into(self._map, 0, *fields)
+
+    def header(self):
+        """
+        Returns the header as a dictionary.
+
+        """
+        magic, version, slots, closed, publishers, dropped, \
+            started, ended = _header.unpack_from(self._map, 0)
+        return {'slots': slots, 'closed': bool(closed),
+                'publishers': publishers, 'dropped': dropped,
+                'started': started, 'ended': ended}
+
+    def _update_header(self, **changes):
+        header = self.header()
+        header.update(changes)
+        self._write_header(_magic, _version, header['slots'],
+                           int(header['closed']), header['publishers'],
+                           header['dropped'], header['started'],
+                           header['ended'])
+
+    def _find(self, key):
+        """
+        Returns the offset of the slot for key, or of the empty slot
+        where it goes, or None if the table is full.
+
+        """
+        for probe in xrange(self.slots):
+            offset = _header.size + \
+                (key + probe) % self.slots * _slot.size
+            found = _slot.unpack_from(self._map, offset)[0]
+            if found == key or found == 0:
+                return offset
+        return None
+
+    def publish(self, ctx, stats):
+        """
+        Adds a process's stats to the counters.
+
+        @param ctx - Context object
+        @param stats - Pstats style dictionary
+
+        """
+        header = self.header()
+        started = ctx.started
+        if header['publishers']:
+            started = min(started, header['started'])
+        names = []
+        if not header['publishers']:
+            # Function ids are never 0, so it names the segment's owner
+            names.append((0, (ctx.hostname, ctx.topic)))
+        dropped = header['dropped']
+        for func, (cc, nc, tt, ct, callers) in stats.iteritems():
+            key = function_id(func)
+            offset = self._find(key)
+            if offset is None:
+                # The table is full. Count the function as OTHER.
+                dropped += 1
+                key = function_id(OTHER)
+                offset = _header.size + self.slots * _slot.size
+                func = OTHER
+            old = _slot.unpack_from(self._map, offset)
+            if old[0] == 0:
+                names.append((key, func))
+            _slot.pack_into(self._map, offset, key, old[1] + cc,
+                            old[2] + nc, old[3] + tt, old[4] + ct)
+        if names:
+            with open(self.names_path, 'ab') as f:
+                for record in names:
+                    f.write(marshal.dumps(record))
+        self._update_header(publishers=header['publishers'] + 1,
+                            dropped=dropped, started=started,
+                            ended=ctx.ended)
+
+    def read(self):
+        """
+        Returns the merged counters. Callers are not kept.
+
+        @returns - Tuple. (hostname, topic, Stats object)
+
+        """
+        names = {}
+        try:
+            with open(self.names_path, 'rb') as f:
+                while True:
+                    try:
+                        key, func = marshal.load(f)
+                    except EOFError:
+                        break
+                    names[key] = tuple(func)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        result = Stats()
+        for index in xrange(self.slots + 1):
+            key, cc, nc, tt, ct = _slot.unpack_from(
+                self._map, _header.size + index * _slot.size
+            )
+            if key and key in names:
+                result.add_entry(names[key], (cc, nc, tt, ct, {}))
+        hostname, topic = names.get(0, (None, None))
+        return hostname, topic, result
+
+    def close(self, remove=False):
+        """
+        Marks the segment closed and removes it when asked, then
+        releases it.
+
+        @param remove - Boolean
+
+        """
+        try:
+            if remove:
+                self._update_header(closed=1)
+                for path in [self.path, self.names_path]:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        if e.errno != errno.ENOENT:
+                            raise
+            self._map.close()
+        finally:
+            os.close(self._fd)
+
+
+class SharedMemoryOutput(object):
+    """
+    Merges the stats of every process of a topic on a host into one
+    dump per interval, in memory mapped segments shared by the processes.
+
+    Each process adds its counters to the segment of the interval
+    instead of writing a file. When a process writes a later interval,
+    it first emits the earlier segments of its topic through the
+    downstream outputs, one dump each, and removes them. Merged dumps
+    have the pid of the process that emitted them and the number of
+    publishers in their metadata.
+    Intervals are matched by their end, so intervals should be aligned,
+    and the stats should be cleared or delta encoded each interval.
+    When the writer stops, each process emits the segments of the
+    topics it wrote that have ended. The current interval's segment is
+    left to the processes still publishing to it. Segments of any topic
+    that ended more than stale_after seconds before a write are emitted
+    by that write, so topics that stopped do not leave segments behind.
+
+    Only function counters are shared. Callers are dropped, so the
+    merged dumps have no call graph. Other kinds of dumps, like
+    collector documents, are passed to the downstream outputs as they
+    are.
+
+    Config keys:
+        directory - Where segments are kept. Defaults to
+            /dev/shm/os_code_profiler
+        slots - Functions each segment can hold. Functions past a full
+            table are counted as one OTHER function. Defaults to 8192.
+        outputs - Dictionary of downstream output class names to their
+            config, like the decorator's outputs.
+        stale_after - Seconds. Should be more than one interval.
+            Defaults to 600.
+
+    """
+    def __init__(self, config):
+        """
+        @param config - Dictionary
+        @raises ConfigException for invalid slots or stale_after
+
+        """
+        self._directory = config.get('directory',
+                                     '/dev/shm/os_code_profiler')
+        self._slots = int(config.get('slots', 8192))
+        if self._slots < 1:
+            raise ConfigException("slots must be at least 1")
+        self._stale_after = float(config.get('stale_after', 600))
+        if self._stale_after <= 0:
+            raise ConfigException("stale_after must be positive")
+        # (hostname, topic) of the segments this process published to
+        self._topics = set()
+        loader = utils.PluginLoader()
+        self._outputs = [
+            loader.load(name, config=output_config)
+            for name, output_config in config.get('outputs', {}).iteritems()
+        ]
+
+    def _segment_path(self, ctx, ended):
+        return os.path.join(self._directory, '%s_%r.segment' % (
+            _owner(ctx), float(ended)
+        ))
+
+    def _mkdirs(self):
+        try:
+            os.makedirs(self._directory)
+        except OSError:
+            if not os.path.isdir(self._directory):
+                raise
+
+    def _emit(self, segment):
+        """
+        Writes a segment to the downstream outputs.
+
+        """
+        header = segment.header()
+        hostname, topic, stats = segment.read()
+        merged = Context(
+            hostname=hostname, started=header['started'],
+            ended=header['ended'], topic=topic,
+            metadata={'shared': {'publishers': header['publishers'],
+                                 'dropped': header['dropped']}}
+        )
+        for o in self._outputs:
+            o.write(merged, stats)
+
+    def _segments(self):
+        """
+        Returns the name of every segment in the directory, with the
+        host and topic it names and its end.
+
+        @returns - Generator of tuples. (name, owner, ended) where owner
+            is '<hostname>_<topic>'
+
+        """
+        try:
+            names = os.listdir(self._directory)
+        except OSError:
+            return
+        for name in sorted(names):
+            if not name.endswith('.segment'):
+                continue
+            try:
+                owner, ended = name[:-len('.segment')].rsplit('_', 1)
+                ended = float(ended)
+            except ValueError:
+                continue
+            yield name, owner, ended
+
+    def _emit_where(self, should_emit):
+        """
+        Emits and removes the segments chosen by should_emit.
+
+        @param should_emit - Callable taking a segment's owner and end
+            and returning a Boolean
+
+        """
+        for name, owner, ended in self._segments():
+            if not should_emit(owner, ended):
+                continue
+            try:
+                segment = _Segment(os.path.join(self._directory, name),
+                                   self._slots)
+            except OSError:
+                continue
+            header = segment.header()
+            if header['closed']:
+                # Emitted by another process while we waited
+                segment.close()
+                continue
+            try:
+                if header['publishers']:
+                    self._emit(segment)
+            finally:
+                segment.close(remove=True)
+
+    def flush(self, ctx):
+        """
+        Emits every segment of ctx's topic, including the current one.
+
+        @param ctx - Context object
+
+        """
+        owner = _owner(ctx)
+        self._emit_where(lambda found, ended: found == owner)
+
+    def close(self):
+        """
+        Emits the ended segments of every topic this process wrote.
+        Called when the writer stops. Segments that have not ended may
+        still be published to by other processes, so they are left to
+        be emitted by a later write.
+
+        """
+        owners = set(_owner(Context(hostname=hostname, topic=topic))
+                     for hostname, topic in self._topics)
+        now = utils.utc_seconds()
+        self._emit_where(
+            lambda found, ended: found in owners and ended <= now
+        )
+        for o in self._outputs:
+            if hasattr(o, 'close'):
+                o.close()
+
+    def write(self, ctx, stats):
+        """
+        Adds stats to the shared segment of their interval.
+
+        @param ctx - Context object
+        @param stats - Stats or Snapshot object, or a collector document
+
+        """
+        if getattr(ctx, 'kind', 'stats') != 'stats':
+            for o in self._outputs:
+                o.write(ctx, stats)
+            return
+        if not isinstance(stats, Stats):
+            stats = stats.stats()
+        self._mkdirs()
+        owner = _owner(ctx)
+        stale = ctx.ended - self._stale_after
+        self._emit_where(
+            lambda found, ended: ended < stale or
+            (ended < ctx.ended and found == owner)
+        )
+        self._topics.add((ctx.hostname, ctx.topic))
+        path = self._segment_path(ctx, ctx.ended)
+        while True:
+            segment = _Segment(path, self._slots)
+            try:
+                if segment.header()['closed']:
+                    # Emitted while we waited. Start a new segment.
+                    continue
+                segment.publish(ctx, stats.stats)
+                return
+            finally:
+                segment.close()
@@ -0,0 +1,198 @@
+"""
+Streams dumps to a collector daemon over a Unix domain socket.
+
+"""
+import collections
+import errno
+import time
+
+from os_code_profiler.common import utils
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.workers import encode
+
+
+class UnixSocketOutput(object):
+    """
+    Output that sends dumps to os-code-profiler-collector over a Unix
+    domain socket, with the length prefixed framing workers use to send
+    dumps to their parent.
+
+    Dumps are queued and sent in batches from the writer's thread,
+    waiting at most send_timeout seconds for the collector to take them.
+    What a slow collector does not take in time stays queued for the
+    next write, and when the queue holds more than max_queued_bytes the
+    oldest dumps are dropped. Once any are,
+    the number dropped so far is added to the metadata of each dump
+    sent. When the collector is not running, dumps are queued and
+    dropped the same way and connecting is retried every
+    reconnect_interval seconds. Connecting counts against send_timeout.
+    When the writer stops, what is queued, including a partial batch,
+    is sent within send_timeout and the connection is closed.
+
+    Writes come from the writer's native thread, so the socket is made
+    from the original socket module even under eventlet.
+
+    Config keys:
+        path - Socket the collector listens on. Defaults to
+            /var/run/os_code_profiler/collector.sock
+        batch_size - Dumps queued before they are sent. Defaults to 1.
+        max_queued_bytes - Defaults to 4 MiB.
+        reconnect_interval - Seconds. Defaults to 10.
+        send_timeout - Seconds each write may wait on the collector.
+            Defaults to 5.
+
+    """
+    def __init__(self, config):
+        """
+        @param config - Dictionary
+
+        """
+        self._path = config.get('path',
+                                '/var/run/os_code_profiler/collector.sock')
+        self._batch_size = int(config.get('batch_size', 1))
+        self._max_queued_bytes = int(config.get('max_queued_bytes',
+                                                4 * 1024 * 1024))
+        self._reconnect_interval = float(config.get('reconnect_interval',
+                                                    10))
+        self._send_timeout = float(config.get('send_timeout', 5))
+        self._select = None
+        self._socket = None
+        self._last_connect = None
+        self._queue = collections.deque()
+        self._queued_bytes = 0
+        # Batch being sent and how much of it the socket took
+        self._pending = ''
+        self._offset = 0
+        self._in_flight = 0
+
+        self.sent = 0
+        self.dropped = 0
+
+    def _connect(self, now, deadline):
+        """
+        Connects to the collector unless a recent attempt failed.
+
+        @param now - Float seconds
+        @param deadline - Float seconds to give up connecting at
+        @returns - Boolean. Whether there is a connection.
+
+        """
+        if self._socket is not None:
+            return True
+        if self._last_connect is not None and \
+                now - self._last_connect < self._reconnect_interval:
+            return False
+        self._last_connect = now
+        socket = utils.original_module('socket')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(max(deadline - now, 0.001))
+            sock.connect(self._path)
+        except socket.error:
+            sock.close()
+            return False
+        sock.setblocking(False)
+        self._socket = sock
+        self._select = utils.original_module('select')
+        return True
+
+    def _disconnect(self):
+        """
+        Closes the connection. Dumps the collector got part of cannot
+        be completed and are dropped.
+
+        """
+        self._socket.close()
+        self._socket = None
+        if self._pending:
+            self._pending = ''
+            self._offset = 0
+            self.dropped += self._in_flight
+        self._in_flight = 0
+
+    def _enqueue(self, ctx, stats):
+        """
+        Queues a dump, dropping the oldest dumps past the byte limit.
+
+        """
+        if self.dropped:
+            # Other outputs share the context, so report on a copy
+            ctx = Context.from_dict(ctx.to_dict())
+            ctx.metadata = dict(ctx.metadata,
+                                stream={'dropped': self.dropped})
+        message = encode(ctx, stats)
+        self._queue.append(message)
+        self._queued_bytes += len(message)
+        while self._queued_bytes > self._max_queued_bytes:
+            self._queued_bytes -= len(self._queue.popleft())
+            self.dropped += 1
+
+    def _send(self, deadline, partial=False):
+        """
+        Sends queued batches, waiting for the socket to take more until
+        deadline.
+
+        @param deadline - Float seconds
+        @param partial - Boolean. Whether to send a batch smaller than
+            batch_size.
+
+        """
+        while True:
+            if not self._pending:
+                if not self._queue or (not partial and
+                                       len(self._queue) < self._batch_size):
+                    return
+                self._pending = ''.join(self._queue)
+                self._offset = 0
+                self._in_flight = len(self._queue)
+                self._queue.clear()
+                self._queued_bytes = 0
+            try:
+                sent = self._socket.send(buffer(self._pending, self._offset))
+            except EnvironmentError as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self._disconnect()
+                    return
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                self._select.select([], [self._socket], [], remaining)
+                continue
+            self._offset += sent
+            if self._offset < len(self._pending):
+                continue
+            self._pending = ''
+            self._offset = 0
+            self.sent += self._in_flight
+            self._in_flight = 0
+
+    def write(self, ctx, stats):
+        """
+        Queues a dump and sends what the socket takes.
+
+        @param ctx - Context object
+        @param stats - Stats object, Snapshot object or collector document
+
+        """
+        self._enqueue(ctx, stats)
+        now = time.time()
+        deadline = now + self._send_timeout
+        if self._connect(now, deadline):
+            self._send(deadline)
+
+    def close(self):
+        """
+        Sends what is queued, waiting at most send_timeout, then closes
+        the connection. Dumps still queued are dropped. Called when the
+        writer stops.
+
+        """
+        now = time.time()
+        deadline = now + self._send_timeout
+        if self._connect(now, deadline):
+            self._send(deadline, partial=True)
+            if self._socket is not None:
+                self._disconnect()
+        self.dropped += len(self._queue)
+        self._queue.clear()
+        self._queued_bytes = 0
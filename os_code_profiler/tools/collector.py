@@ -0,0 +1,156 @@
+"""
+Collects the dumps streamed by the processes of a host and writes them
+to a results directory.
+
+usage: python -m os_code_profiler.tools.collector [-h] [--socket PATH]
+                                                   [--timeout SECONDS]
+                                                   [--queue-size N]
+                                                   [--compression METHOD]
+                                                   [--index]
+                                                   RESULTS_DIR
+
+Listens on a Unix domain socket for processes using UnixSocketOutput.
+The stats dumps of each topic that end at the same time are merged in
+memory, as the parent of forked workers merges theirs, and written once
+timeout seconds have passed since the first of them arrived. Collector
+documents are written as they arrive. Files use the FileOutput layout of
+RESULTS_DIR with the collector's pid. Runs until interrupted or
+terminated, then writes what it holds.
+
+"""
+import argparse
+import os
+import signal
+import socket
+import time
+
+from os_code_profiler.common.workers import Aggregator
+from os_code_profiler.common.writer import Writer
+from os_code_profiler.outputs.file import FileOutput
+
+
+class Collector(Aggregator):
+    """
+    Aggregator of the processes connected to a Unix domain socket.
+
+    Connected processes may belong to any topic, so an interval is
+    written when it times out rather than when every connection sent it.
+
+    """
+    def __init__(self, path, writer, timeout):
+        """
+        @param path - String name of the socket
+        @param writer - Writer object for the merged dumps
+        @param timeout - Float seconds to wait for the processes of
+            a topic
+
+        """
+        super(Collector, self).__init__(writer, timeout)
+        self._path = path
+        self._listener = None
+
+    def listen(self):
+        """
+        Binds the socket, replacing one left by a previous collector,
+        and starts receiving.
+
+        """
+        try:
+            os.remove(self._path)
+        except OSError:
+            if os.path.exists(self._path):
+                raise
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self._path)
+        self._listener.listen(128)
+        self._listener.setblocking(False)
+        self.start()
+
+    def fds(self):
+        """
+        Returns the listening socket and the connections.
+
+        """
+        fds = super(Collector, self).fds()
+        if self._listener is not None:
+            fds.append(self._listener.fileno())
+        return fds
+
+    def _receive(self, fd, now):
+        """
+        Accepts a new process or reads what a process sent.
+
+        """
+        if fd != self._listener.fileno():
+            super(Collector, self)._receive(fd, now)
+            return
+        try:
+            connection, address = self._listener.accept()
+        except socket.error:
+            return
+        # Keep only the descriptor, which is closed when the process
+        # disconnects
+        self._buffers[os.dup(connection.fileno())] = ''
+        connection.close()
+
+    def _complete(self, interval):
+        return False
+
+    def stop(self):
+        """
+        Stops receiving, writes what was received and removes the
+        socket.
+
+        """
+        super(Collector, self).stop()
+        for fd in super(Collector, self).fds():
+            os.close(fd)
+        self._buffers.clear()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            os.remove(self._path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Collect streamed dumps into a results directory.'
+    )
+    parser.add_argument('results_dir', metavar='RESULTS_DIR',
+                        help='Results directory to write files to.')
+    parser.add_argument('--socket', dest='path',
+                        default='/var/run/os_code_profiler/collector.sock',
+                        help='Unix domain socket to listen on.')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='Seconds to wait for the processes of a topic.')
+    parser.add_argument('--queue-size', type=int, default=64,
+                        help='Dumps waiting to be written.')
+    parser.add_argument('--compression',
+                        help='Compression method of written files.')
+    parser.add_argument('--index', action='store_true',
+                        help='Index written files.')
+    args = parser.parse_args(argv)
+
+    output = FileOutput({'results_dir': args.results_dir,
+                         'compression': args.compression,
+                         'index': args.index})
+    collector = Collector(args.path,
+                          Writer([output], queue_size=args.queue_size),
+                          args.timeout)
+
+    def terminate(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    collector.listen()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.stop()
+
+
+if __name__ == '__main__':
+    main()
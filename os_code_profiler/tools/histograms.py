@@ -0,0 +1,66 @@
+"""
+Merges latency histogram files and prints their quantiles.
+
+usage: python -m os_code_profiler.tools.histograms [-h] [--host GLOB]
+                                                    [--topic GLOB]
+                                                    [--pid PID]
+                                                    [--start TIME]
+                                                    [--end TIME]
+                                                    RESULTS_DIR
+
+Files are selected from the FileOutput layout of RESULTS_DIR like
+os-code-profiler-merge selects stats files. The histograms of each
+function are added across every selected process and host, and a line
+is printed per function with its call count and p50, p99, p999 and max
+latencies in milliseconds.
+
+"""
+import argparse
+
+from os_code_profiler.collectors.histogram import QUANTILES, merge_files
+from os_code_profiler.outputs.file import parse_timestamp
+from os_code_profiler.tools.merge import select_files
+
+
+def _ms(seconds):
+    return '%.3f' % (seconds * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Merge latency histograms and print quantiles.'
+    )
+    parser.add_argument('results_dir', metavar='RESULTS_DIR',
+                        help='Results directory written by FileOutput.')
+    parser.add_argument('--host', action='append', dest='hosts',
+                        help='Hostname glob. May be repeated.')
+    parser.add_argument('--topic', action='append', dest='topics',
+                        help='Topic glob. May be repeated.')
+    parser.add_argument('--pid', action='append', dest='pids', type=int,
+                        help='Process id. May be repeated.')
+    parser.add_argument('--start', type=parse_timestamp,
+                        help='Start of the time range.')
+    parser.add_argument('--end', type=parse_timestamp,
+                        help='End of the time range.')
+    args = parser.parse_args(argv)
+
+    paths = select_files(
+        args.results_dir, hosts=args.hosts, topics=args.topics,
+        pids=set(args.pids or []), start=args.start, end=args.end,
+        kind='histograms'
+    )
+    totals, merged, errors = merge_files(paths)
+    print '\t'.join(['function', 'count'] +
+                    [name for name, q in QUANTILES] + ['max'])
+    for function, histogram in sorted(totals.iteritems()):
+        if not histogram.count:
+            continue
+        row = [function, str(histogram.count)]
+        row.extend(_ms(histogram.quantile(q)) for name, q in QUANTILES)
+        row.append(_ms(histogram.max / 1000000.0))
+        print '\t'.join(row)
+    print 'merged %s files (%s unreadable)' % (merged, errors)
+
+
+if __name__ == '__main__':
+    main()
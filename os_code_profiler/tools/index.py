@@ -0,0 +1,52 @@
+"""
+Queries or rebuilds the index of a FileOutput results directory.
+
+usage: python -m os_code_profiler.tools.index [-h] [--rebuild]
+                                               [--host GLOB] [--topic GLOB]
+                                               [--pid PID] [--start TIME]
+                                               [--end TIME]
+                                               RESULTS_DIR
+
+Prints the indexed files matching the filters, one per line, ordered by
+start time. Times use the file name format, ex: 2015-11-18T02:00:00.
+--rebuild first replaces the index with the files found in the tree,
+which adopts a results directory written without the index option.
+
+"""
+import argparse
+
+from os_code_profiler.outputs.file import parse_timestamp
+from os_code_profiler.outputs.index import Index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Query the index of a results directory.'
+    )
+    parser.add_argument('results_dir', metavar='RESULTS_DIR',
+                        help='Results directory written by FileOutput.')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Rebuild the index from the tree first.')
+    parser.add_argument('--host', action='append', dest='hosts',
+                        help='Hostname glob. May be repeated.')
+    parser.add_argument('--topic', action='append', dest='topics',
+                        help='Topic glob. May be repeated.')
+    parser.add_argument('--pid', action='append', dest='pids', type=int,
+                        help='Process id. May be repeated.')
+    parser.add_argument('--start', type=parse_timestamp,
+                        help='Start of the time range.')
+    parser.add_argument('--end', type=parse_timestamp,
+                        help='End of the time range.')
+    args = parser.parse_args(argv)
+
+    index = Index(args.results_dir)
+    if args.rebuild:
+        index.rebuild()
+    for entry in index.query(hosts=args.hosts, topics=args.topics,
+                             pids=args.pids, start=args.start,
+                             end=args.end):
+        print entry['path']
+
+
+if __name__ == '__main__':
+    main()
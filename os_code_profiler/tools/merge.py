@@ -0,0 +1,293 @@
+"""
+Merges many stats files into one aggregated profile.
+
+usage: python -m os_code_profiler.tools.merge [-h] [--host GLOB]
+                                               [--topic GLOB] [--pid PID]
+                                               [--start TIME] [--end TIME]
+                                               [--processes N] [--index]
+                                               [--extrapolate]
+                                               -o OUTPUT RESULTS_DIR
+
+Files are selected from the FileOutput layout of RESULTS_DIR,
+<hostname>/<topic>/<started>_to_<ended>_<pid>.stats, using only their
+names. Times use the file name format, ex: 2015-11-18T02:00:00. A file
+is selected when its window overlaps [start, end). With --index the
+selection is read from the results directory's index instead of walking
+the tree.
+
+The selected files are split into chunks that are merged by a pool of
+processes. Each file is folded into its chunk's aggregate as soon as it
+is read, so memory across files grows with the number of distinct
+functions rather than the number of files. Files are marshal dumps that
+can only be read whole, so each worker's peak memory is its aggregate
+plus the largest single file. The output can be opened with pstats.
+
+Merging is meaningful for files that were cleared each interval or
+written as deltas. Cumulative files of one process overlap each other.
+
+Files profiled on a duty cycle only cover part of each period. With
+--extrapolate their counters are scaled by period / on so they estimate
+the whole period.
+
+"""
+import argparse
+import fnmatch
+import functools
+import multiprocessing
+import os
+
+from os_code_profiler.common import stats as stats_module
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.outputs.file import parse_filename, parse_timestamp
+from os_code_profiler.outputs.index import Index
+
+
+def _matching_dirs(path, patterns):
+    """
+    Returns the sorted subdirectories of path matching any pattern.
+
+    """
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return []
+    matches = []
+    for name in sorted(names):
+        full = os.path.join(path, name)
+        if not os.path.isdir(full):
+            continue
+        for pattern in patterns:
+            if fnmatch.fnmatchcase(name, pattern):
+                matches.append(full)
+                break
+    return matches
+
+
+def select_files(results_dir, hosts=None, topics=None, pids=None,
+                 start=None, end=None, kind='stats'):
+    """
+    Selects files of one kind from a FileOutput results directory
+    by name.
+
+    @param results_dir - String
+    @param hosts - Optional list of hostname glob patterns
+    @param topics - Optional list of topic glob patterns
+    @param pids - Optional collection of integer pids
+    @param start - Optional float seconds. Files ending before are skipped.
+    @param end - Optional float seconds. Files starting at or after
+        are skipped.
+    @param kind - String. 'stats' or the kind of a collector.
+    @returns - Generator of file names
+
+    """
+    hosts = hosts or ['*']
+    topics = topics or ['*']
+    for host_dir in _matching_dirs(results_dir, hosts):
+        for topic_dir in _matching_dirs(host_dir, topics):
+            for name in sorted(os.listdir(topic_dir)):
+                fields = parse_filename(name)
+                if fields is None or fields['kind'] != kind:
+                    continue
+                if pids and fields['pid'] not in pids:
+                    continue
+                if start is not None and fields['ended'] <= start:
+                    continue
+                if end is not None and fields['started'] >= end:
+                    continue
+                yield os.path.join(topic_dir, name)
+
+
+def _accumulate(totals, stats):
+    """
+    Adds a pstats style dictionary into totals in place.
+    Entries of totals are lists so that they can be updated without
+    copying the callers of every function for every file.
+
+    @param totals - Dict. {func: [cc, nc, tt, ct, callers]}
+    @param stats - Dict. {func: (cc, nc, tt, ct, callers)}
+
+    """
+    for func, (cc, nc, tt, ct, callers) in stats.iteritems():
+        entry = totals.get(func)
+        if entry is None:
+            totals[func] = [cc, nc, tt, ct, dict(callers)]
+            continue
+        entry[0] += cc
+        entry[1] += nc
+        entry[2] += tt
+        entry[3] += ct
+        total_callers = entry[4]
+        for caller, counts in callers.iteritems():
+            old = total_callers.get(caller)
+            if old is None:
+                total_callers[caller] = counts
+            else:
+                total_callers[caller] = (
+                    old[0] + counts[0], old[1] + counts[1],
+                    old[2] + counts[2], old[3] + counts[3]
+                )
+
+
+def _freeze(totals):
+    """
+    Converts accumulated totals back to a pstats style dictionary.
+
+    """
+    return dict((func, tuple(entry)) for func, entry in totals.iteritems())
+
+
+def duty_cycle_factor(context):
+    """
+    Returns the factor that extrapolates stats profiled on a duty cycle
+    to the whole period.
+
+    @param context - Dictionary from Context.to_dict or None
+    @returns - Float. 1.0 for stats profiled all the time.
+
+    """
+    if not context:
+        return 1.0
+    duty_cycle = context.get('metadata', {}).get('duty_cycle')
+    if not duty_cycle:
+        return 1.0
+    return float(duty_cycle['period']) / duty_cycle['on']
+
+
+def merge_files(paths, extrapolate=False):
+    """
+    Merges files one at a time into a single aggregate.
+    Files that cannot be read are counted and skipped.
+
+    Each file is loaded whole and released once it has been added, so
+    only one file is held in memory at a time besides the aggregate.
+
+    @param paths - Iterable of file names
+    @param extrapolate - Boolean. Scale files profiled on a duty cycle
+        to their whole period.
+    @returns - Tuple. (pstats style dictionary, files merged, errors)
+
+    """
+    totals = {}
+    merged = 0
+    errors = 0
+    for path in paths:
+        try:
+            stats = stats_module.load(path)
+        except Exception:
+            errors += 1
+            continue
+        if extrapolate:
+            factor = duty_cycle_factor(stats.context)
+            if factor != 1.0:
+                stats = stats.scale(factor)
+        _accumulate(totals, stats.stats)
+        merged += 1
+    return _freeze(totals), merged, errors
+
+
+def _chunks(items, size):
+    """
+    Splits a list into lists of at most size items.
+
+    """
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _fold(results):
+    """
+    Adds partial results from merge_files together.
+
+    """
+    totals = {}
+    merged = 0
+    errors = 0
+    for stats, chunk_merged, chunk_errors in results:
+        _accumulate(totals, stats)
+        merged += chunk_merged
+        errors += chunk_errors
+    return Stats(_freeze(totals)), merged, errors
+
+
+def merge(paths, processes=None, chunk_size=256, extrapolate=False):
+    """
+    Merges stats files across a pool of processes.
+
+    @param paths - Iterable of file names
+    @param processes - Number of worker processes. Defaults to the cpu
+        count. 1 merges in the calling process.
+    @param chunk_size - Maximum files merged by a worker per task
+    @param extrapolate - Boolean. Scale files profiled on a duty cycle
+        to their whole period.
+    @returns - Stats object. Its context holds the number of files
+        merged and the number that could not be read.
+
+    """
+    paths = list(paths)
+    merge_chunk = functools.partial(merge_files, extrapolate=extrapolate)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes > 1 and paths:
+        # Spread small selections over every worker
+        size = min(chunk_size, max(1, len(paths) // (processes * 4)))
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.imap_unordered(merge_chunk,
+                                          _chunks(paths, size))
+            total, merged, errors = _fold(results)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        total, merged, errors = _fold([merge_chunk(paths)])
+    total.context = {'merged': merged, 'errors': errors}
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Merge stats files into one aggregated profile.'
+    )
+    parser.add_argument('results_dir', metavar='RESULTS_DIR',
+                        help='Results directory written by FileOutput.')
+    parser.add_argument('-o', '--output', required=True,
+                        help='File to write the merged stats to.')
+    parser.add_argument('--host', action='append', dest='hosts',
+                        help='Hostname glob. May be repeated.')
+    parser.add_argument('--topic', action='append', dest='topics',
+                        help='Topic glob. May be repeated.')
+    parser.add_argument('--pid', action='append', dest='pids', type=int,
+                        help='Process id. May be repeated.')
+    parser.add_argument('--start', type=parse_timestamp,
+                        help='Start of the time range.')
+    parser.add_argument('--end', type=parse_timestamp,
+                        help='End of the time range.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Worker processes. Defaults to cpu count.')
+    parser.add_argument('--index', action='store_true',
+                        help='Select files using the results index.')
+    parser.add_argument('--extrapolate', action='store_true',
+                        help='Scale duty cycle files to their period.')
+    args = parser.parse_args(argv)
+
+    if args.index:
+        entries = Index(args.results_dir).query(
+            hosts=args.hosts, topics=args.topics, pids=args.pids,
+            start=args.start, end=args.end
+        )
+        paths = [entry['path'] for entry in entries]
+    else:
+        paths = select_files(
+            args.results_dir, hosts=args.hosts, topics=args.topics,
+            pids=set(args.pids or []), start=args.start, end=args.end
+        )
+    merged = merge(paths, processes=args.processes,
+                   extrapolate=args.extrapolate)
+    merged.save(args.output)
+    print 'merged %s files (%s unreadable) into %s functions' % (
+        merged.context['merged'], merged.context['errors'], len(merged)
+    )
+
+
+if __name__ == '__main__':
+    main()
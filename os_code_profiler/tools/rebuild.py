@@ -0,0 +1,127 @@
+"""
+Rebuilds cumulative stats files from delta dumps.
+
+usage: python -m os_code_profiler.tools.rebuild [-h] -o OUTPUT_DIR
+                                                 PATH [PATH ...]
+
+Every stats file found under each PATH is grouped by host, topic and
+pid. The deltas of each process are replayed in order and a cumulative
+file is written for each one under OUTPUT_DIR using the same layout as
+FileOutput.
+
+"""
+import argparse
+import os
+
+from os_code_profiler.common import delta
+from os_code_profiler.common import stats as stats_module
+from os_code_profiler.common.profiling import Context as ProfilingContext
+from os_code_profiler.outputs.file import FileOutput, is_stats_file, \
+    parse_filename
+
+
+def find_files(paths):
+    """
+    Returns every stats file in paths, descending into directories.
+
+    @param paths - List of file or directory names
+    @returns - Generator of file names
+
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if is_stats_file(filename):
+                    yield os.path.join(dirpath, filename)
+
+
+def _process_key(path):
+    """
+    Returns the process that wrote a file and when the file ended.
+
+    Files named by FileOutput are placed by their name and their host
+    and topic directories without being read. Other files are loaded
+    for their context.
+
+    @param path - String
+    @returns - Tuple. ((hostname, topic, pid), ended) or None for a file
+        without a context.
+
+    """
+    fields = parse_filename(os.path.basename(path))
+    if fields is not None:
+        topic_dir = os.path.dirname(os.path.abspath(path))
+        hostname = os.path.basename(os.path.dirname(topic_dir))
+        topic = os.path.basename(topic_dir)
+        return (hostname, topic, fields['pid']), fields['ended']
+    context = stats_module.load(path).context
+    if context is None:
+        return None
+    key = (context['hostname'], context['topic'], context['pid'])
+    return key, context['ended']
+
+
+def group_by_process(paths):
+    """
+    Groups files by the host, topic and pid that wrote them.
+    Files written without a context are skipped.
+
+    @param paths - Iterable of file names
+    @returns - Dict. {(hostname, topic, pid): [(ended, path), ...]} with
+        each list sorted by ended.
+
+    """
+    groups = {}
+    for path in paths:
+        found = _process_key(path)
+        if found is None:
+            continue
+        key, ended = found
+        groups.setdefault(key, []).append((ended, path))
+    for files in groups.itervalues():
+        files.sort()
+    return groups
+
+
+def rebuild(paths):
+    """
+    Rebuilds the cumulative views of every process.
+
+    Files are grouped by name, then each is loaded once while its
+    process is replayed. Only the files of one process are held in
+    memory at a time.
+
+    @param paths - List of file or directory names
+    @returns - Generator of Stats objects with contexts
+    @raises DeltaSequenceException if a process is missing a delta
+
+    """
+    groups = group_by_process(find_files(paths))
+    for key in sorted(groups):
+        files = (stats_module.load(path) for ended, path in groups[key])
+        for cumulative in delta.accumulate(files):
+            yield cumulative
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Rebuild cumulative stats files from delta dumps.'
+    )
+    parser.add_argument('-o', '--output-dir', required=True,
+                        help='Directory to write cumulative files to.')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='Delta files or directories containing them.')
+    args = parser.parse_args(argv)
+
+    output = FileOutput({'results_dir': args.output_dir})
+    for cumulative in rebuild(args.paths):
+        ctx = ProfilingContext.from_dict(cumulative.context)
+        output.write(ctx, cumulative)
+
+
+if __name__ == '__main__':
+    main()
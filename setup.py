@@ -1,4 +1,4 @@
-from setuptools import setup
+from setuptools import find_packages, setup
 
 long_description = (
     "Collection of tools for collecting code profiling data from various"
@@ -10,7 +10,18 @@ setup(
     version="0.0.0",
     author="james absalon",
     author_email="james.absalon@rackspace.com",
-    packages=['os_code_profiler'],
+    packages=find_packages(exclude=['tests', 'tests.*', 'benchmarks']),
     package_data={'os_code_profiler': ['os_code_profiler/*']},
-    long_description=long_description
+    long_description=long_description,
+    entry_points={
+        'console_scripts': [
+            'os-code-profiler-collector = '
+            'os_code_profiler.tools.collector:main',
+            'os-code-profiler-histograms = '
+            'os_code_profiler.tools.histograms:main',
+            'os-code-profiler-index = os_code_profiler.tools.index:main',
+            'os-code-profiler-merge = os_code_profiler.tools.merge:main',
+            'os-code-profiler-rebuild = os_code_profiler.tools.rebuild:main'
+        ]
+    }
 )
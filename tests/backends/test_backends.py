@@ -0,0 +1,254 @@
+import os
+import unittest
+
+from os_code_profiler.backends.base import Base
+from os_code_profiler.backends.noop import NoopBackend
+from os_code_profiler.backends.sampling import SamplingBackend
+from os_code_profiler.backends.tracing import \
+    CProfileBackend, \
+    GreenletProfilerBackend, \
+    YappiBackend
+from os_code_profiler.common.filtering import ModuleFilter
+from os_code_profiler.common.profiling import ConfigException
+
+
+def work(n):
+    total = 0
+    for i in range(n):
+        total += square(i)
+    return total
+
+
+def square(i):
+    return i * i
+
+
+def key(func):
+    code = func.__code__
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+class BackendTests(object):
+    """
+    Behavior shared by every tracing backend.
+
+    """
+    def create_backend(self):
+        raise NotImplementedError()
+
+    def profile(self, backend, n=100):
+        backend.set_clock_type('cpu')
+        backend.start()
+        try:
+            work(n)
+        finally:
+            backend.stop()
+
+    def test_start_stop(self):
+        """
+        is_running follows start and stop.
+
+        """
+        backend = self.create_backend()
+        self.assertFalse(backend.is_running())
+        backend.start()
+        self.assertTrue(backend.is_running())
+        backend.stop()
+        self.assertFalse(backend.is_running())
+
+    def test_clear_stats(self):
+        """
+        Clearing discards collected stats.
+
+        """
+        backend = self.create_backend()
+        self.profile(backend)
+        backend.clear_stats()
+        self.assertEquals(self.calls(backend.get_func_stats(), square), 0)
+
+    def test_snapshot_reset(self):
+        """
+        Snapshots with reset keep the profiler running and consecutive
+        snapshots account for every call exactly once.
+
+        """
+        backend = self.create_backend()
+        backend.set_clock_type('cpu')
+        backend.start()
+        try:
+            work(10)
+            first = backend.snapshot(reset=True)
+            self.assertTrue(backend.is_running())
+            work(5)
+            second = backend.snapshot(reset=True)
+            work(3)
+            third = backend.snapshot(reset=False)
+            fourth = backend.snapshot(reset=False)
+        finally:
+            backend.stop()
+        self.assertEquals(self.snapshot_calls(first, square), 10)
+        self.assertEquals(self.snapshot_calls(second, square), 5)
+        self.assertEquals(self.snapshot_calls(third, square), 3)
+        self.assertEquals(self.snapshot_calls(fourth, square), 3)
+
+    def test_module_filter(self):
+        """
+        Snapshots only hold functions from the kept modules.
+
+        """
+        backend = self.create_backend()
+        backend.set_module_filter(ModuleFilter(
+            include=['test_backends'], paths=[os.path.dirname(__file__)]
+        ))
+        self.profile(backend, 10)
+        stats = backend.snapshot(reset=True).stats()
+        self.assertEquals(self.snapshot_calls(stats, square), 10)
+        for func in stats.stats:
+            self.assertEquals(func[0], key(square)[0])
+
+    def test_traced_calls(self):
+        """
+        Filtered snapshots still count the calls that were traced.
+
+        """
+        backend = self.create_backend()
+        backend.set_module_filter(ModuleFilter(include=['nothing']))
+        self.profile(backend, 10)
+        stats = backend.snapshot(reset=True).stats()
+        self.assertEquals(len(stats), 0)
+        self.assertTrue(stats.traced_calls >= 10)
+
+    def snapshot_calls(self, snapshot, func):
+        if hasattr(snapshot, 'stats') and callable(snapshot.stats):
+            snapshot = snapshot.stats()
+        return snapshot.stats.get(key(func), (0, 0))[1]
+
+    def test_counts_calls(self):
+        """
+        Every call of a traced function is counted.
+
+        """
+        backend = self.create_backend()
+        self.profile(backend, 100)
+        self.assertEquals(self.calls(backend.get_func_stats(), square), 100)
+
+
+class TestCProfileBackend(BackendTests, unittest.TestCase):
+    """
+    Tests the cProfile backend.
+
+    """
+    def create_backend(self):
+        return CProfileBackend({})
+
+    def calls(self, stats, func):
+        return stats.stats.get(key(func), (0,))[0]
+
+    def test_snapshot_while_running(self):
+        """
+        Getting stats does not stop the profiler.
+
+        """
+        backend = self.create_backend()
+        backend.start()
+        work(10)
+        backend.get_func_stats()
+        self.assertTrue(backend.is_running())
+        work(10)
+        backend.stop()
+        self.assertEquals(self.calls(backend.get_func_stats(), square), 20)
+
+
+class TestGreenletProfilerBackend(BackendTests, unittest.TestCase):
+    """
+    Tests the GreenletProfiler backend.
+
+    """
+    def create_backend(self):
+        backend = GreenletProfilerBackend({})
+        backend.clear_stats()
+        return backend
+
+    def calls(self, stats, func):
+        for stat in stats:
+            if stat.name == func.__name__ and \
+                    stat.module == func.__code__.co_filename:
+                return stat.ncall
+        return 0
+
+
+class TestYappiBackend(unittest.TestCase):
+    """
+    Tests the yappi backend.
+
+    """
+    def test_module(self):
+        """
+        The yappi backend imports yappi when created.
+
+        """
+        try:
+            import yappi  # noqa
+        except ImportError:
+            with self.assertRaises(ImportError):
+                YappiBackend({})
+            return
+        self.assertTrue(YappiBackend({})._profiler is yappi)
+
+
+class TestSamplingBackend(unittest.TestCase):
+    """
+    Tests the sampling backend.
+
+    """
+    def test_defaults(self):
+        """
+        Defaults to 100hz with a thread timer.
+
+        """
+        backend = SamplingBackend({})
+        self.assertTrue(isinstance(backend, Base))
+        self.assertEquals(backend._sampler._period, 0.01)
+        self.assertEquals(backend._sampler._max_depth, 64)
+        self.assertEquals(backend._sampler._timer, 'thread')
+
+    def test_module_filter(self):
+        """
+        The module filter is kept by the backend and applied by the
+        sampler while sampling.
+
+        """
+        backend = SamplingBackend({})
+        module_filter = object()
+        backend.set_module_filter(module_filter)
+        self.assertTrue(backend._module_filter is module_filter)
+        self.assertTrue(backend._sampler._module_filter is module_filter)
+
+    def test_invalid_config(self):
+        """
+        Invalid options raise ConfigException.
+
+        """
+        for config in [{'hz': 0}, {'max_depth': 0}, {'timer': 'x'}]:
+            with self.assertRaises(ConfigException):
+                SamplingBackend(config)
+
+
+class TestNoopBackend(unittest.TestCase):
+    """
+    Tests the noop backend.
+
+    """
+    def test_noop(self):
+        """
+        The noop backend runs but never collects anything.
+
+        """
+        backend = NoopBackend({})
+        backend.set_clock_type('cpu')
+        backend.start()
+        self.assertTrue(backend.is_running())
+        work(10)
+        backend.stop()
+        backend.clear_stats()
+        self.assertEquals(len(backend.get_func_stats()), 0)
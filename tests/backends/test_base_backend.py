@@ -0,0 +1,32 @@
+import unittest
+
+from os_code_profiler.backends.base import \
+    Base as BaseBackend, \
+    BackendNotImplemented
+
+
+class TestBaseBackend(unittest.TestCase):
+    """
+    Tests the base backend.
+
+    """
+    def test_config(self):
+        """
+        The config dictionary is kept.
+
+        """
+        backend = BaseBackend({'a': 1})
+        self.assertEquals(backend._config, {'a': 1})
+
+    def test_not_implemented(self):
+        """
+        Every backend method must be implemented by subclasses.
+
+        """
+        backend = BaseBackend({})
+        for name in ['start', 'stop', 'is_running',
+                     'clear_stats', 'get_func_stats']:
+            with self.assertRaises(BackendNotImplemented):
+                getattr(backend, name)()
+        with self.assertRaises(BackendNotImplemented):
+            backend.set_clock_type('wall')
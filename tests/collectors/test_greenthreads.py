@@ -0,0 +1,88 @@
+import eventlet
+import functools
+import time
+import unittest
+
+from os_code_profiler.collectors.greenthreads import \
+    GREENTHREAD_FIELDS, \
+    SITE_FIELDS, \
+    GreenthreadCollector, \
+    spawn_site
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    eventlet.sleep(0)
+
+
+def waiting(event):
+    event.wait()
+
+
+class Task(object):
+    def run(self):
+        pass
+
+
+class TestGreenthreads(unittest.TestCase):
+    """
+    Tests green thread accounting.
+
+    """
+    module = 'tests.collectors.test_greenthreads'
+
+    def test_spawn_site(self):
+        """
+        Sites name functions, methods and partials.
+
+        """
+        self.assertEquals(spawn_site(busy), self.module + ':busy')
+        self.assertEquals(spawn_site(functools.partial(busy, 1)),
+                          self.module + ':busy')
+        self.assertEquals(spawn_site(Task().run), self.module + ':Task.run')
+
+    def test_accounting(self):
+        """
+        Finished green threads roll up into their site and live ones are
+        listed.
+
+        """
+        collector = GreenthreadCollector({})
+        event = eventlet.event.Event()
+        collector.start()
+        try:
+            threads = [eventlet.spawn(busy, 0.01) for i in range(5)]
+            waiter = eventlet.spawn(waiting, event)
+            for thread in threads:
+                thread.wait()
+            eventlet.sleep(0)
+            data = collector.snapshot().data
+            event.send()
+            waiter.wait()
+        finally:
+            collector.stop()
+
+        self.assertEquals(data['site_fields'], SITE_FIELDS)
+        self.assertEquals(data['greenthread_fields'], GREENTHREAD_FIELDS)
+        cpu, wall, switches, finished, live = \
+            data['sites'][self.module + ':busy']
+        self.assertEquals((finished, live), (5, 0))
+        self.assertEquals(switches, 10)
+        self.assertTrue(wall >= 0.05)
+        self.assertTrue(cpu > 0)
+        self.assertEquals(data['sites'][self.module + ':waiting'][3:],
+                          (0, 1))
+        self.assertTrue('<main>' in data['sites'])
+        sites = [greenthread[1] for greenthread in data['greenthreads']]
+        self.assertTrue(self.module + ':waiting' in sites)
+        self.assertFalse(self.module + ':busy' in sites)
+
+        # Counters restart after a reset and tracing stops
+        sites = collector.snapshot().data['sites']
+        self.assertEquals(sites.keys(), [self.module + ':waiting'])
+        self.assertEquals(sites[self.module + ':waiting'][3:], (1, 0))
+        eventlet.spawn(busy, 0).wait()
+        self.assertFalse(self.module + ':busy' in
+                         collector.snapshot().data['sites'])
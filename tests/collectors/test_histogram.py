@@ -0,0 +1,153 @@
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from os_code_profiler.collectors import base
+from os_code_profiler.collectors.histogram import \
+    BUCKETS, \
+    MAX_VALUE, \
+    Histogram, \
+    HistogramCollector, \
+    bucket_index, \
+    bucket_lower, \
+    bucket_upper, \
+    merge_files
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.outputs.file import FileOutput, parse_filename
+
+
+def handle(x):
+    return x
+
+
+class TestBuckets(unittest.TestCase):
+    """
+    Tests the log-linear bucket layout.
+
+    """
+    def test_contiguous(self):
+        """
+        Buckets cover every value once, in order.
+
+        """
+        self.assertEquals(bucket_lower(0), 0)
+        for index in xrange(BUCKETS - 1):
+            self.assertEquals(bucket_upper(index) + 1,
+                              bucket_lower(index + 1))
+        self.assertEquals(bucket_index(MAX_VALUE), BUCKETS - 1)
+        self.assertEquals(bucket_index(MAX_VALUE * 4), BUCKETS - 1)
+
+    def test_index(self):
+        """
+        Values land in the bucket that covers them and buckets stay
+        within about 3% of their values.
+
+        """
+        for value in [0, 1, 63, 64, 65, 127, 128, 1000, 123456789]:
+            index = bucket_index(value)
+            self.assertTrue(bucket_lower(index) <= value)
+            self.assertTrue(value <= bucket_upper(index))
+            width = bucket_upper(index) - bucket_lower(index)
+            self.assertTrue(width <= value / 32)
+
+
+class TestHistogram(unittest.TestCase):
+    """
+    Tests recording, quantiles and merging.
+
+    """
+    def test_quantiles(self):
+        """
+        Quantiles come from the bucket reaching their rank.
+
+        """
+        histogram = Histogram()
+        self.assertEquals(histogram.quantile(0.5), None)
+        for i in xrange(1, 1001):
+            histogram.record(i / 1000.0)
+        self.assertEquals(histogram.count, 1000)
+        self.assertEquals(histogram.max, 1000000)
+        self.assertAlmostEquals(histogram.quantile(0.5), 0.5, delta=0.02)
+        self.assertAlmostEquals(histogram.quantile(0.99), 0.99, delta=0.04)
+        self.assertEquals(histogram.quantile(1.0), 1.0)
+
+    def test_round_trip_and_merge(self):
+        """
+        Histograms survive to_dict and merge by adding counts.
+
+        """
+        a = Histogram()
+        b = Histogram()
+        for i in xrange(100):
+            a.record(0.001)
+            b.record(0.1)
+        d = a.to_dict()
+        self.assertEquals(d['buckets'], {bucket_index(1000): 100})
+        self.assertEquals(d['sum'], 100000)
+        self.assertTrue('p999' in d)
+        loaded = Histogram.from_dict(d)
+        self.assertEquals(loaded.counts, a.counts)
+        loaded.merge(b)
+        self.assertEquals(loaded.count, 200)
+        self.assertEquals(loaded.max, 100000)
+        self.assertAlmostEquals(loaded.quantile(0.25), 0.001, delta=0.0001)
+        self.assertAlmostEquals(loaded.quantile(0.75), 0.1, delta=0.004)
+
+
+class TestHistogramCollector(unittest.TestCase):
+    """
+    Tests timing functions and writing histograms.
+
+    """
+    function = 'tests.collectors.test_histogram:handle'
+
+    def test_collect(self):
+        """
+        Calls to allowlisted functions are timed until stopped.
+
+        """
+        import tests.collectors.test_histogram as module
+        collector = HistogramCollector({'functions': self.function + ', '})
+        collector.start()
+        try:
+            with mock.patch('time.time', side_effect=[1.0, 1.25]):
+                self.assertEquals(module.handle(3), 3)
+        finally:
+            collector.stop()
+        module.handle(3)
+
+        data = collector.snapshot().data['functions']
+        self.assertEquals(data[self.function]['count'], 1)
+        self.assertEquals(data[self.function]['max'], 250000)
+        data = collector.snapshot().data['functions']
+        self.assertEquals(data[self.function]['count'], 0)
+
+    def test_write_and_merge(self):
+        """
+        Histograms written by separate processes merge.
+
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            o = FileOutput({'results_dir': tmpdir, 'compression': 'gzip'})
+            paths = []
+            for pid in [1, 2]:
+                collector = HistogramCollector({'functions': [self.function]})
+                collector._histograms[self.function].record(pid / 1000.0)
+                ctx = Context(pid=pid, topic='t', kind=collector.kind)
+                o.write(ctx, collector.snapshot())
+                paths.append(os.path.join(o._path(ctx), o._filename(ctx)))
+            self.assertEquals(parse_filename(os.path.basename(paths[0]))
+                              ['kind'], 'histograms')
+            data, context = base.load(paths[0])
+            self.assertEquals(context['kind'], 'histograms')
+
+            totals, merged, errors = merge_files(paths + ['missing'])
+            self.assertEquals((merged, errors), (2, 1))
+            histogram = totals[self.function]
+            self.assertEquals(histogram.count, 2)
+            self.assertEquals(histogram.max, 2000)
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,75 @@
+import eventlet
+import thread
+import time
+import unittest
+
+from os_code_profiler.collectors.hub_lag import HubLagCollector
+from os_code_profiler.common.profiling import ConfigException
+
+
+def block(seconds):
+    # Sleeps without yielding to the hub
+    time.sleep(seconds)
+
+
+class TestHubLag(unittest.TestCase):
+    """
+    Tests the hub lag detector.
+
+    """
+    def test_config(self):
+        """
+        Periods must be positive.
+
+        """
+        with self.assertRaises(ConfigException):
+            HubLagCollector({'threshold': 0})
+
+    def test_check(self):
+        """
+        Stacks are captured once per stall and filed by the ticker.
+
+        """
+        collector = HubLagCollector({'threshold': 0.5})
+        collector._hub_ident = -1
+        self.assertFalse(collector._check(10.0))
+        collector._due = 10.0
+        self.assertFalse(collector._check(10.5))
+        self.assertFalse(collector._check(11.0))
+        collector._hub_ident = thread.get_ident()
+        self.assertTrue(collector._check(11.0))
+        self.assertFalse(collector._check(12.0))
+        names = [entry[2] for entry in collector._pending['stack']]
+        self.assertTrue('test_check' in names)
+
+        collector._tick(2.0)
+        collector._tick(0.001)
+        data = collector.snapshot().data
+        self.assertEquals(data['lag']['count'], 2)
+        self.assertEquals(data['lag']['max'], 2000000)
+        self.assertEquals(len(data['stalls']), 1)
+        self.assertEquals(data['stalls'][0]['lag'], 2.0)
+        self.assertFalse('due' in data['stalls'][0])
+        self.assertEquals(collector.snapshot().data['lag']['count'], 0)
+
+    def test_blocking_stack(self):
+        """
+        Code blocking the hub is caught by the watchdog.
+
+        """
+        collector = HubLagCollector({'period': 0.01, 'threshold': 0.05,
+                                     'check_interval': 0.01})
+        collector.start()
+        try:
+            eventlet.sleep(0.05)
+            block(0.3)
+            eventlet.sleep(0.05)
+        finally:
+            collector.stop()
+        data = collector.snapshot().data
+        self.assertTrue(data['lag']['count'] > 0)
+        self.assertTrue(data['lag']['max'] >= 200000)
+        self.assertEquals(len(data['stalls']), 1)
+        stall = data['stalls'][0]
+        self.assertTrue(stall['lag'] >= 0.2)
+        self.assertEquals(stall['stack'][-1][2], 'block')
@@ -0,0 +1,94 @@
+import unittest
+
+from os_code_profiler.collectors.instrument import \
+    InstrumentException, \
+    Patch, \
+    resolve
+
+
+def target(x):
+    return x + 1
+
+
+class Parent(object):
+    def method(self, x):
+        return x * 2
+
+    @staticmethod
+    def static(x):
+        return x * 3
+
+    @classmethod
+    def klass(cls, x):
+        return cls.__name__
+
+
+class Child(Parent):
+    pass
+
+
+def counting(calls):
+    def make_wrapper(original):
+        def wrapper(*args, **kwargs):
+            calls.append(original.__name__)
+            return original(*args, **kwargs)
+        return wrapper
+    return make_wrapper
+
+
+class TestInstrument(unittest.TestCase):
+    """
+    Tests wrapping targets by name.
+
+    """
+    module = 'tests.collectors.test_instrument'
+
+    def test_resolve(self):
+        """
+        Targets resolve to their owner and raw attribute.
+
+        """
+        owner, name, value = resolve(self.module + ':Parent.static')
+        self.assertTrue(owner is Parent)
+        self.assertEquals(name, 'static')
+        self.assertTrue(isinstance(value, staticmethod))
+        for bad in ['nomodule', self.module + ':missing',
+                    'no.such.module:f', self.module + ':Parent.missing']:
+            with self.assertRaises(InstrumentException):
+                resolve(bad)
+
+    def test_patch_function(self):
+        """
+        Module functions are wrapped and restored.
+
+        """
+        import tests.collectors.test_instrument as module
+        calls = []
+        patch = Patch()
+        patch.add(self.module + ':target', counting(calls))
+        self.assertEquals(module.target(1), 2)
+        self.assertEquals(module.target.__name__, 'target')
+        patch.remove()
+        self.assertEquals(module.target(1), 2)
+        self.assertEquals(calls, ['target'])
+
+    def test_patch_methods(self):
+        """
+        Methods keep their kind while wrapped and inherited methods are
+        uncovered again on removal.
+
+        """
+        calls = []
+        patch = Patch()
+        for name in ['method', 'static', 'klass']:
+            patch.add(self.module + ':Child.' + name, counting(calls))
+        self.assertEquals(Child().method(2), 4)
+        self.assertEquals(Child.static(2), 6)
+        self.assertEquals(Child.klass(2), 'Child')
+        self.assertEquals(Parent().method(2), 4)
+        self.assertEquals(calls, ['method', 'static', 'klass'])
+        patch.remove()
+        for name in ['method', 'static', 'klass']:
+            self.assertFalse(name in Child.__dict__)
+        Child().method(2)
+        self.assertEquals(len(calls), 3)
@@ -0,0 +1,125 @@
+import mock
+import unittest
+
+from os_code_profiler.collectors import memory
+from os_code_profiler.collectors.memory import MemoryCollector
+from os_code_profiler.common.profiling import ConfigException
+
+
+class Leak(object):
+    pass
+
+
+class TestMemory(unittest.TestCase):
+    """
+    Tests the memory collector.
+
+    """
+    name = 'tests.collectors.test_memory.Leak'
+
+    def test_config(self):
+        """
+        Modes and sizes are validated.
+
+        """
+        with self.assertRaises(ConfigException):
+            MemoryCollector({'mode': 'heap'})
+        with self.assertRaises(ConfigException):
+            MemoryCollector({'mode': 'types', 'sample_every': 0})
+        if memory.tracemalloc is None:
+            self.assertEquals(MemoryCollector({})._mode, 'types')
+            with self.assertRaises(ConfigException):
+                MemoryCollector({'mode': 'tracemalloc'})
+
+    def test_types_growth(self):
+        """
+        Growth is measured from the previous dump.
+
+        """
+        collector = MemoryCollector({'mode': 'types', 'top_n': 1000})
+        collector.start()
+        leaks = [Leak() for i in range(100)]
+        data = collector.snapshot().data
+        self.assertEquals(data['growth'], [])
+        top = dict((site, count) for site, size, count in data['top'])
+        self.assertEquals(top[self.name], 100)
+        self.assertTrue(data['count'] >= 100)
+
+        leaks.extend(Leak() for i in range(50))
+        data = collector.snapshot().data
+        growth = dict((site, count) for site, size, count in data['growth'])
+        self.assertEquals(growth[self.name], 50)
+        collector.stop()
+
+    def test_types_sampling(self):
+        """
+        Sampled counts are scaled back up.
+
+        """
+        collector = MemoryCollector({'mode': 'types', 'top_n': 1000,
+                                     'sample_every': 4})
+        leaks = [Leak() for i in range(10000)]
+        data = collector.snapshot().data
+        top = dict((site, count) for site, size, count in data['top'])
+        self.assertTrue(9000 < top[self.name] < 11000)
+        self.assertEquals(top[self.name] % 4, 0)
+        del leaks
+
+    def test_types_sampling_stable(self):
+        """
+        The same objects are sampled each dump, so nothing grows when
+        nothing is allocated.
+
+        """
+        collector = MemoryCollector({'mode': 'types', 'top_n': 1000,
+                                     'sample_every': 10})
+        leaks = [Leak() for i in range(1000)]
+        collector.snapshot()
+        data = collector.snapshot().data
+        growth = dict((site, count) for site, size, count in data['growth'])
+        self.assertFalse(self.name in growth)
+        del leaks
+
+    def test_types_deferred(self):
+        """
+        The census is taken when the document is written, not when it
+        is captured, and yields the interpreter lock as it goes.
+
+        """
+        collector = MemoryCollector({'mode': 'types', 'top_n': 1000})
+        with mock.patch.object(memory.gc, 'get_objects',
+                               wraps=memory.gc.get_objects) as mocked:
+            document = collector.snapshot()
+            self.assertFalse(mocked.called)
+            leaks = [Leak() for i in range(100)]
+            with mock.patch.object(memory, '_slice', 100), \
+                    mock.patch.object(memory.utils,
+                                      'original_module') as original:
+                data = document.data
+        self.assertEquals(mocked.call_count, 1)
+        self.assertTrue(original.return_value.sleep.call_count >= 2)
+        original.return_value.sleep.assert_called_with(0)
+        top = dict((site, count) for site, size, count in data['top'])
+        self.assertEquals(top[self.name], 100)
+        self.assertTrue(document.data is data)
+        del leaks
+
+    @unittest.skipIf(memory.tracemalloc is None, 'tracemalloc unavailable')
+    def test_tracemalloc(self):
+        """
+        Allocations are grouped by their stack.
+
+        """
+        collector = MemoryCollector({'mode': 'tracemalloc', 'depth': 2})
+        collector.start()
+        try:
+            collector.snapshot()
+            leaks = [Leak() for i in range(1000)]
+            data = collector.snapshot().data
+        finally:
+            collector.stop()
+        self.assertTrue(data['growth'])
+        site, size, count = data['growth'][0]
+        self.assertTrue(len(site) <= 2)
+        self.assertTrue(count >= 1000)
+        del leaks
@@ -0,0 +1,91 @@
+import mock
+import unittest
+
+from os_code_profiler.collectors.slow_calls import \
+    SlowCallCollector, \
+    summarize
+
+
+def handle(x, flag=None):
+    if flag == 'fail':
+        raise ValueError(x)
+    return x
+
+
+def caller():
+    import tests.collectors.test_slow_calls as module
+    return module.handle('a' * 100, flag=True)
+
+
+class TestSlowCalls(unittest.TestCase):
+    """
+    Tests capturing slow calls.
+
+    """
+    function = 'tests.collectors.test_slow_calls:handle'
+
+    def test_summarize(self):
+        """
+        Long reprs are cut.
+
+        """
+        self.assertEquals(summarize(1, 10), '1')
+        self.assertEquals(summarize('a' * 20, 10), "'aaaaaa...")
+
+    def test_thresholds(self):
+        """
+        Thresholds are per function or the default.
+
+        """
+        collector = SlowCallCollector({'functions': 'a:b, c:d',
+                                       'threshold': '2'})
+        self.assertEquals(collector._thresholds, {'a:b': 2.0, 'c:d': 2.0})
+        collector = SlowCallCollector({'functions': {'a:b': 0.5}})
+        self.assertEquals(collector._thresholds, {'a:b': 0.5})
+
+    @mock.patch('time.time')
+    def test_capture(self, mocked_time):
+        """
+        Only calls over the threshold are recorded, with their stack.
+
+        """
+        import tests.collectors.test_slow_calls as module
+        collector = SlowCallCollector({'functions': {self.function: 1.0},
+                                       'max_arg_length': 10})
+        collector.start()
+        try:
+            mocked_time.side_effect = [0.0, 0.5]
+            self.assertEquals(module.handle(1), 1)
+            mocked_time.side_effect = [0.0, 2.0]
+            self.assertEquals(caller(), 'a' * 100)
+            mocked_time.side_effect = [0.0, 3.0]
+            with self.assertRaises(ValueError):
+                module.handle(2, flag='fail')
+        finally:
+            collector.stop()
+
+        data = collector.snapshot().data
+        self.assertEquals(data['dropped'], 0)
+        self.assertEquals(len(data['calls']), 2)
+        call = data['calls'][0]
+        self.assertEquals(call['function'], self.function)
+        self.assertEquals(call['duration'], 2.0)
+        self.assertEquals(call['args'], ["'aaaaaa...", 'flag=True'])
+        self.assertEquals(call['error'], None)
+        self.assertEquals(call['stack'][-1][2], 'caller')
+        self.assertEquals(data['calls'][1]['error'], 'ValueError')
+        self.assertEquals(collector.snapshot().data['calls'], [])
+
+    def test_ring_buffer(self):
+        """
+        The oldest calls are dropped when the buffer is full.
+
+        """
+        collector = SlowCallCollector({'functions': [self.function],
+                                       'buffer_size': 2})
+        for i in range(3):
+            collector._record(self.function, i, (i,), {}, None, None)
+        data = collector.snapshot().data
+        self.assertEquals([call['args'] for call in data['calls']],
+                          [['1'], ['2']])
+        self.assertEquals(data['dropped'], 1)
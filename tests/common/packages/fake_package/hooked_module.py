@@ -0,0 +1,5 @@
+"""
+Fake module for testing the import hook
+
+"""
+value = 1
@@ -0,0 +1,152 @@
+import unittest
+
+from os_code_profiler.common.delta import \
+    DeltaEncoder, \
+    DeltaSequenceException, \
+    accumulate, \
+    diff
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.stats import Stats
+
+A = ('a.py', 1, 'a')
+B = ('b.py', 2, 'b')
+C = ('c.py', 3, 'c')
+
+
+class TestDiff(unittest.TestCase):
+    """
+    Tests diffing cumulative stats.
+
+    """
+    def test_unchanged_left_out(self):
+        """
+        Only changed or new functions are returned.
+
+        """
+        previous = {
+            A: (1, 1, 1.0, 1.0, {}),
+            B: (2, 2, 2.0, 2.0, {A: (2, 2, 2.0, 2.0)})
+        }
+        current = {
+            A: (1, 1, 1.0, 1.0, {}),
+            B: (5, 5, 3.0, 4.0, {A: (3, 3, 2.5, 3.0), C: (2, 2, 0.5, 1.0)}),
+            C: (1, 1, 1.0, 1.0, {})
+        }
+        result = diff(current, previous)
+        self.assertEquals(sorted(result), [B, C])
+        self.assertEquals(result[B][:4], (3, 3, 1.0, 2.0))
+        self.assertEquals(result[B][4], {
+            A: (1, 1, 0.5, 1.0),
+            C: (2, 2, 0.5, 1.0)
+        })
+        self.assertEquals(result[C], current[C])
+
+
+class TestDeltaEncoder(unittest.TestCase):
+    """
+    Tests the delta writer transform.
+
+    """
+    def test_sequence(self):
+        """
+        The first snapshot is a base. Later ones are deltas starting
+        where the previous one ended.
+
+        """
+        encoder = DeltaEncoder()
+        first = Context(started=0, ended=10)
+        stats = encoder(first, Stats({A: (1, 1, 1.0, 1.0, {})}))
+        self.assertEquals(len(stats), 1)
+        self.assertEquals(first.metadata['delta'],
+                          {'sequence': 0, 'base_started': 0})
+
+        second = Context(started=0, ended=25)
+        stats = encoder(second, Stats({
+            A: (1, 1, 1.0, 1.0, {}),
+            B: (1, 1, 1.0, 1.0, {})
+        }))
+        self.assertEquals(stats.stats.keys(), [B])
+        self.assertEquals(second.started, 10)
+        self.assertEquals(second.metadata['delta'],
+                          {'sequence': 1, 'base_started': 0})
+
+    def test_reset_starts_new_base(self):
+        """
+        Fewer functions than before means the counters were reset.
+
+        """
+        encoder = DeltaEncoder()
+        encoder(Context(started=0, ended=10), Stats({
+            A: (1, 1, 1.0, 1.0, {}),
+            B: (1, 1, 1.0, 1.0, {})
+        }))
+        ctx = Context(started=10, ended=20)
+        stats = encoder(ctx, Stats({C: (1, 1, 1.0, 1.0, {})}))
+        self.assertEquals(ctx.metadata['delta']['sequence'], 0)
+        self.assertEquals(stats.stats.keys(), [C])
+
+    def test_reset_same_functions(self):
+        """
+        Counters going back mean a reset even when as many functions
+        were reached again.
+
+        """
+        encoder = DeltaEncoder()
+        encoder(Context(started=0, ended=10), Stats({
+            A: (5, 5, 5.0, 5.0, {}),
+            B: (1, 1, 1.0, 1.0, {})
+        }))
+        ctx = Context(started=10, ended=20)
+        stats = encoder(ctx, Stats({
+            A: (2, 2, 2.0, 2.0, {}),
+            C: (1, 1, 1.0, 1.0, {}),
+            B: (3, 3, 3.0, 3.0, {})
+        }))
+        self.assertEquals(ctx.metadata['delta']['sequence'], 0)
+        self.assertEquals(stats.stats[A], (2, 2, 2.0, 2.0, {}))
+
+
+class TestAccumulate(unittest.TestCase):
+    """
+    Tests rebuilding cumulative views from deltas.
+
+    """
+    def encode(self, snapshots):
+        encoder = DeltaEncoder()
+        files = []
+        for i, snapshot in enumerate(snapshots):
+            ctx = Context(hostname='h', pid=1, topic='t',
+                          started=0, ended=(i + 1) * 10)
+            stats = encoder(ctx, Stats(dict(snapshot)))
+            files.append(Stats(stats.stats, ctx.to_dict()))
+        return files
+
+    def test_round_trip(self):
+        """
+        Accumulating the deltas reproduces each cumulative snapshot.
+
+        """
+        snapshots = [
+            {A: (1, 1, 1.0, 1.0, {})},
+            {A: (2, 2, 2.0, 2.0, {}), B: (1, 1, 1.0, 1.0, {A: (1, 1, 1, 1)})},
+            {A: (2, 2, 2.0, 2.0, {}), B: (4, 4, 3.0, 3.0, {A: (4, 4, 3, 3)})}
+        ]
+        rebuilt = list(accumulate(self.encode(snapshots)))
+        self.assertEquals([r.stats for r in rebuilt], snapshots)
+        for r in rebuilt:
+            self.assertEquals(r.context['started'], 0)
+            self.assertFalse('delta' in r.context['metadata'])
+
+    def test_missing_delta(self):
+        """
+        A gap in the sequence is an error.
+
+        """
+        files = self.encode([
+            {A: (1, 1, 1.0, 1.0, {})},
+            {A: (2, 2, 2.0, 2.0, {})},
+            {A: (3, 3, 3.0, 3.0, {})}
+        ])
+        del files[1]
+        with self.assertRaises(DeltaSequenceException):
+            list(accumulate(files))
@@ -0,0 +1,67 @@
+import os
+import unittest
+
+from os_code_profiler.common.filtering import ModuleFilter
+from os_code_profiler.common.stats import Stats
+
+ROOT = os.path.abspath('/site-packages')
+
+
+def path(*parts):
+    return os.path.join(ROOT, *parts)
+
+
+class TestModuleFilter(unittest.TestCase):
+    """
+    Tests filtering functions by module.
+
+    """
+    def test_module_name(self):
+        """
+        File names are converted to module names relative to the
+        longest matching import path.
+
+        """
+        module_filter = ModuleFilter(paths=[ROOT, path('nested')])
+        self.assertEquals(
+            module_filter.module_name(path('nova', 'compute', 'api.py')),
+            'nova.compute.api'
+        )
+        self.assertEquals(
+            module_filter.module_name(path('nova', '__init__.pyc')), 'nova'
+        )
+        self.assertEquals(
+            module_filter.module_name(path('nested', 'x', 'y.py')), 'x.y'
+        )
+        self.assertEquals(module_filter.module_name('/elsewhere/z.py'), 'z')
+        self.assertEquals(module_filter.module_name('~'), '~')
+
+    def test_include_exclude(self):
+        """
+        Include patterns select modules and packages, and exclude
+        patterns remove modules from them.
+
+        """
+        module_filter = ModuleFilter(include=['nova.*', 'oslo'],
+                                     exclude=['nova.db*'], paths=[ROOT])
+        self.assertTrue(module_filter(path('nova', 'compute', 'api.py')))
+        self.assertTrue(module_filter(path('oslo', 'log.py')))
+        self.assertFalse(module_filter(path('nova', 'db', 'api.py')))
+        self.assertFalse(module_filter(path('eventlet', 'hubs', 'hub.py')))
+        self.assertFalse(module_filter('~'))
+        self.assertTrue(ModuleFilter()('~'))
+
+    def test_filter_stats(self):
+        """
+        Only kept functions and callers among them remain.
+
+        """
+        nova = (path('nova', 'a.py'), 1, 'a')
+        hub = (path('eventlet', 'hub.py'), 2, 'switch')
+        stats = Stats({
+            nova: (1, 1, 1.0, 2.0, {hub: (1, 1, 1.0, 2.0)}),
+            hub: (1, 1, 1.0, 3.0, {nova: (1, 1, 1.0, 3.0)})
+        })
+        module_filter = ModuleFilter(include=['nova'], paths=[ROOT])
+        filtered = module_filter.filter_stats(stats)
+        self.assertEquals(filtered.stats, {nova: (1, 1, 1.0, 2.0, {})})
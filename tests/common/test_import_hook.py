@@ -0,0 +1,140 @@
+import json
+import mock
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from os_code_profiler.common import import_hook
+from os_code_profiler.common.import_hook import \
+    ImportHook, \
+    ImportHookException
+
+
+class FakeDecorator(object):
+    """
+    Records the modules it decorates.
+
+    """
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, module, config):
+        self.calls.append((module.__name__, config))
+        module.decorated = True
+        return module
+
+
+def failing(module, config):
+    raise Exception("cannot decorate")
+
+
+decorator = FakeDecorator()
+
+
+class TestImportHook(unittest.TestCase):
+    """
+    Tests decorating modules on import.
+
+    """
+    test_module_path = os.path.join(os.path.dirname(__file__),
+                                    'packages')
+    target = 'fake_package.hooked_module'
+
+    def setUp(self):
+        sys.path.append(self.test_module_path)
+        sys.modules.pop(self.target, None)
+        del decorator.calls[:]
+        self.hook = None
+
+    def tearDown(self):
+        if self.hook is not None:
+            self.hook.uninstall()
+        sys.modules.pop(self.target, None)
+        if self.test_module_path in sys.path:
+            sys.path.remove(self.test_module_path)
+
+    def create_hook(self, decorator_name=None):
+        if decorator_name is None:
+            decorator_name = 'tests.common.test_import_hook.decorator'
+        return ImportHook({self.target: {'decorator': decorator_name,
+                                         'config': {'interval': 5}}})
+
+    def test_missing_decorator(self):
+        """
+        Every module needs a decorator.
+
+        """
+        with self.assertRaises(ImportHookException):
+            ImportHook({self.target: {}})
+
+    def test_aliases(self):
+        """
+        Short decorator names are expanded.
+
+        """
+        hook = ImportHook({'a': {'decorator': 'nova_service'}})
+        self.assertEquals(hook._targets['a'],
+                          ('os_code_profiler.decorators.nova.Service', {}))
+
+    def test_decorates_on_import(self):
+        """
+        Target modules are decorated once when imported and other
+        imports are left alone.
+
+        """
+        self.hook = self.create_hook()
+        self.hook.install()
+        self.assertEquals(self.hook.find_module('json'), None)
+        import fake_package.hooked_module as module
+        self.assertTrue(module.decorated)
+        self.assertEquals(decorator.calls, [(self.target, {'interval': 5})])
+        import fake_package.hooked_module
+        self.assertEquals(len(decorator.calls), 1)
+
+    def test_decorates_imported(self):
+        """
+        Targets imported before the hook are decorated on install.
+
+        """
+        import fake_package.hooked_module as module
+        self.hook = self.create_hook()
+        self.hook.install()
+        self.assertTrue(module.decorated)
+
+    def test_failing_decorator(self):
+        """
+        A failing decorator does not break the import.
+
+        """
+        self.hook = self.create_hook('tests.common.test_import_hook.failing')
+        self.hook.install()
+        with mock.patch('logging.getLogger') as mocked_logger:
+            import fake_package.hooked_module as module
+        self.assertEquals(module.value, 1)
+        self.assertTrue(self.target in self.hook.errors)
+        mocked_logger.assert_called_with(import_hook.__name__)
+        self.assertTrue(mocked_logger.return_value.exception.called)
+
+    def test_install_from_env(self):
+        """
+        The hook is configured from the file named in the environment.
+
+        """
+        self.assertEquals(import_hook.install_from_env({}), None)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'config.json')
+            with open(path, 'w') as f:
+                json.dump({'modules': {self.target: {
+                    'decorator': 'tests.common.test_import_hook.decorator'
+                }}}, f)
+            self.hook = import_hook.install_from_env(
+                {import_hook.ENV_VAR: path}
+            )
+            self.assertTrue(self.hook in sys.meta_path)
+            import fake_package.hooked_module as module
+            self.assertTrue(module.decorated)
+        finally:
+            shutil.rmtree(tmpdir)
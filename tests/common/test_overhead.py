@@ -0,0 +1,77 @@
+import unittest
+
+from os_code_profiler.backends.tracing import CProfileBackend
+from os_code_profiler.common.overhead import OverheadBudget, calibrate
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.stats import Snapshot, Stats
+
+A = ('a.py', 1, 'a')
+
+
+def create_ctx(dump=0.0, cpu=1.0, last_latency=None):
+    ctx = Context(hostname='h', pid=1, started=0, ended=1, topic='t')
+    ctx.metadata['writer'] = {'last_latency': last_latency}
+    ctx.metadata['overhead'] = {'dump': dump, 'cpu': cpu}
+    return ctx
+
+
+class TestOverhead(unittest.TestCase):
+    """
+    Tests overhead calibration and the budget.
+
+    """
+    def test_calibrate(self):
+        """
+        Calibration measures a positive cost per call and leaves no
+        stats behind.
+
+        """
+        backend = CProfileBackend({})
+        per_call = calibrate(backend, calls=20000)
+        self.assertTrue(0 < per_call < 0.001)
+        self.assertFalse(backend.is_running())
+        self.assertEquals(len(backend.get_func_stats()), 0)
+
+    def test_measure(self):
+        """
+        The overhead of an interval is recorded in the context.
+
+        """
+        budget = OverheadBudget(5.0, per_call=0.0001)
+        ctx = create_ctx(dump=0.01, cpu=2.0, last_latency=0.04)
+        stats = Stats({A: (100, 100, 1.0, 1.0, {})})
+        self.assertTrue(budget(ctx, Snapshot(stats, lambda s: s)) is stats)
+        measured = ctx.metadata['overhead']
+        self.assertEquals(measured['calls'], 100)
+        self.assertAlmostEquals(measured['tracing'], 0.01)
+        self.assertAlmostEquals(measured['seconds'], 0.06)
+        self.assertAlmostEquals(measured['pct'], 3.0)
+        self.assertEquals(measured['fraction'], 1.0)
+        self.assertEquals(budget.fraction, 1.0)
+
+    def test_over_budget(self):
+        """
+        Intervals are skipped in proportion to the overhead above the
+        budget.
+
+        """
+        budget = OverheadBudget(5.0, per_call=0.001)
+        stats = Stats({A: (200, 200, 1.0, 1.0, {})})
+        budget(create_ctx(cpu=1.0), stats)
+        self.assertAlmostEquals(budget.fraction, 0.25)
+        profiled = [budget.should_profile() for i in range(8)]
+        self.assertEquals(profiled.count(True), 2)
+        self.assertNotEquals(profiled[:2], [True, True])
+
+    def test_cumulative(self):
+        """
+        Only calls made since the previous interval count for
+        cumulative stats.
+
+        """
+        budget = OverheadBudget(5.0, cumulative=True)
+        ctx = create_ctx()
+        budget(ctx, Stats({A: (100, 100, 1.0, 1.0, {})}))
+        ctx = create_ctx()
+        budget(ctx, Stats({A: (150, 150, 1.0, 1.0, {})}))
+        self.assertEquals(ctx.metadata['overhead']['calls'], 50)
@@ -53,3 +53,14 @@ class TestPluginLoader(unittest.TestCase):
         obj = loader.load(class_name, config)
         for key, value in config.iteritems():
             self.assertEquals(value, getattr(obj, key))
+
+    def test_find(self):
+        """
+        Tests that find returns the named object itself.
+
+        """
+        from fake_package.fake_module import FakePlugin
+        loader = PluginLoader()
+        self.assertTrue(
+            loader.find('fake_package.fake_module.FakePlugin') is FakePlugin
+        )
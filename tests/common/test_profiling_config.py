@@ -20,6 +20,13 @@ class TestProfilingConfig(unittest.TestCase):
         self.assertEquals(config_obj.clock_type, 'wall')
         self.assertEquals(config_obj.interval, 60 * 5)
         self.assertEquals(config_obj.clear_each_interval, True)
+        self.assertEquals(config_obj.delta_each_interval, False)
+        self.assertEquals(config_obj.writer_queue_size, 4)
+        self.assertEquals(
+            config_obj.backend,
+            'os_code_profiler.backends.tracing.GreenletProfilerBackend'
+        )
+        self.assertEquals(config_obj.backend_config, {})
 
     def test_clock_type(self):
         """
@@ -58,6 +65,19 @@ class TestProfilingConfig(unittest.TestCase):
         with self.assertRaises(Exception):
             config_obj = ProfilingConfig(config_dict)
 
+        config_dict = {"interval": 0}
+        with self.assertRaises(ProfilingConfigException):
+            config_obj = ProfilingConfig(config_dict)
+
+    def test_align_intervals(self):
+        """
+        Tests align_intervals. Intervals are aligned by default.
+
+        """
+        self.assertTrue(ProfilingConfig({}).align_intervals is True)
+        config_obj = ProfilingConfig({"align_intervals": False})
+        self.assertTrue(config_obj.align_intervals is False)
+
     def test_clear_each_interval(self):
         """
         Tests the clear_each_interval
@@ -74,3 +94,154 @@ class TestProfilingConfig(unittest.TestCase):
         config_dict = {"clear_each_interval": 0}
         config_obj = ProfilingConfig(config_dict)
         self.assertTrue(config_obj.clear_each_interval is False)
+
+    def test_delta_each_interval(self):
+        """
+        Tests the delta_each_interval. Deltas need cumulative counters
+        so stats are no longer cleared.
+
+        """
+        config_dict = {"delta_each_interval": True}
+        config_obj = ProfilingConfig(config_dict)
+        self.assertTrue(config_obj.delta_each_interval is True)
+        self.assertTrue(config_obj.clear_each_interval is False)
+
+    def test_duty_cycle(self):
+        """
+        Tests the duty cycle. Each window is cleared and the period
+        defaults to the interval.
+
+        """
+        config_obj = ProfilingConfig({})
+        self.assertEquals(config_obj.duty_cycle_on, None)
+
+        config_dict = {"duty_cycle_on": "30", "interval": 600,
+                       "clear_each_interval": False}
+        config_obj = ProfilingConfig(config_dict)
+        self.assertEquals(config_obj.duty_cycle_on, 30)
+        self.assertEquals(config_obj.duty_cycle_period, 600)
+        self.assertEquals(config_obj.duty_cycle_jitter, 0)
+        self.assertTrue(config_obj.clear_each_interval is True)
+
+        for config_dict in [
+            {"duty_cycle_on": 0},
+            {"duty_cycle_on": 30, "duty_cycle_period": 20},
+            {"duty_cycle_on": 30, "duty_cycle_period": 60,
+             "duty_cycle_jitter": 31},
+            {"duty_cycle_on": 30, "delta_each_interval": True}
+        ]:
+            with self.assertRaises(ProfilingConfigException):
+                ProfilingConfig(config_dict)
+
+    def test_pruning(self):
+        """
+        Tests prune_top_n, prune_threshold_pct and prune_sort
+
+        """
+        config_obj = ProfilingConfig({})
+        self.assertEquals(config_obj.prune_top_n, None)
+        self.assertEquals(config_obj.prune_threshold_pct, None)
+        self.assertEquals(config_obj.prune_sort, 'tottime')
+
+        config_obj = ProfilingConfig({"prune_top_n": "50",
+                                      "prune_threshold_pct": "0.5",
+                                      "prune_sort": "cumtime"})
+        self.assertEquals(config_obj.prune_top_n, 50)
+        self.assertEquals(config_obj.prune_threshold_pct, 0.5)
+        self.assertEquals(config_obj.prune_sort, 'cumtime')
+
+        for config_dict in [{"prune_top_n": 0}, {"prune_sort": "calls"}]:
+            with self.assertRaises(ProfilingConfigException):
+                ProfilingConfig(config_dict)
+
+    def test_select_pct(self):
+        """
+        Tests select_pct
+
+        """
+        self.assertEquals(ProfilingConfig({}).select_pct, None)
+        self.assertEquals(ProfilingConfig({"select_pct": "5"}).select_pct, 5)
+        for pct in [0, 101]:
+            with self.assertRaises(ProfilingConfigException):
+                ProfilingConfig({"select_pct": pct})
+
+    def test_max_overhead_pct(self):
+        """
+        Tests max_overhead_pct
+
+        """
+        self.assertEquals(ProfilingConfig({}).max_overhead_pct, None)
+        config_obj = ProfilingConfig({"max_overhead_pct": "2.5"})
+        self.assertEquals(config_obj.max_overhead_pct, 2.5)
+        with self.assertRaises(ProfilingConfigException):
+            ProfilingConfig({"max_overhead_pct": 0})
+
+    def test_writer_queue_size(self):
+        """
+        Tests the writer_queue_size
+
+        """
+        config_dict = {"writer_queue_size": "2"}
+        config_obj = ProfilingConfig(config_dict)
+        self.assertEquals(config_obj.writer_queue_size, 2)
+
+        config_dict = {"writer_queue_size": 0}
+        with self.assertRaises(ProfilingConfigException):
+            config_obj = ProfilingConfig(config_dict)
+
+    def test_backend(self):
+        """
+        Tests the backend. Short names are expanded, other names are
+        used as is.
+
+        """
+        config_dict = {"backend": "Sampling", "backend_config": {"hz": 10}}
+        config_obj = ProfilingConfig(config_dict)
+        self.assertEquals(
+            config_obj.backend,
+            'os_code_profiler.backends.sampling.SamplingBackend'
+        )
+        self.assertEquals(config_obj.backend_config, {"hz": 10})
+
+        config_dict = {"backend": "some_package.some_module.SomeBackend"}
+        config_obj = ProfilingConfig(config_dict)
+        self.assertEquals(
+            config_obj.backend,
+            'some_package.some_module.SomeBackend'
+        )
+
+    def test_collectors(self):
+        """
+        Tests the collectors. Short names are expanded, other names are
+        used as is.
+
+        """
+        self.assertEquals(ProfilingConfig({}).collectors, {})
+        config_dict = {"collectors": {
+            "Histogram": {"functions": ["a:b"]},
+            "some_package.some_module.SomeCollector": None
+        }}
+        config_obj = ProfilingConfig(config_dict)
+        self.assertEquals(config_obj.collectors, {
+            'os_code_profiler.collectors.histogram.HistogramCollector':
+                {"functions": ["a:b"]},
+            'some_package.some_module.SomeCollector': {}
+        })
+
+    def test_workers(self):
+        """
+        Tests the forked worker options.
+
+        """
+        config_obj = ProfilingConfig({"interval": 60})
+        self.assertEquals(config_obj.max_workers, None)
+        self.assertFalse(config_obj.aggregate_workers)
+        self.assertEquals(config_obj.aggregate_timeout, 60)
+        config_obj = ProfilingConfig({"max_workers": "4",
+                                      "aggregate_workers": True,
+                                      "aggregate_timeout": 5})
+        self.assertEquals(config_obj.max_workers, 4)
+        self.assertTrue(config_obj.aggregate_workers)
+        self.assertEquals(config_obj.aggregate_timeout, 5)
+        with self.assertRaises(ProfilingConfigException):
+            ProfilingConfig({"max_workers": 0})
@@ -10,7 +10,7 @@ class TestContext(unittest.TestCase):
 
     """
     @mock.patch(
-        'os_code_profiler.common.profiling.socket.gethostname',
+        'os_code_profiler.common.profiling.utils.hostname',
         return_value='mocked_hostname'
     )
     def test_hostname(self, mocked_gethostname):
@@ -83,3 +83,39 @@ class TestContext(unittest.TestCase):
 
         ctx = Context()
         self.assertEquals(ctx.topic, "unknown")
+
+    def test_metadata(self):
+        """
+        Tests the metadata. A provided dictionary should be used. If not
+        provided, each context should get its own empty dictionary.
+
+        """
+        ctx = Context(metadata={'a': 1})
+        self.assertEquals(ctx.metadata, {'a': 1})
+
+        ctx = Context()
+        other = Context()
+        self.assertEquals(ctx.metadata, {})
+        self.assertFalse(ctx.metadata is other.metadata)
+
+    def test_kind(self):
+        """
+        Contexts describe function stats unless given another kind.
+
+        """
+        self.assertEquals(Context().kind, 'stats')
+        self.assertEquals(Context(kind='histograms').kind, 'histograms')
+
+    def test_dict_round_trip(self):
+        """
+        A context can be converted to a dictionary and back.
+
+        """
+        ctx = Context(hostname='h', pid=2, started=3, ended=4,
+                      topic='t', metadata={'a': 1})
+        d = ctx.to_dict()
+        self.assertEquals(d, {
+            'hostname': 'h', 'pid': 2, 'started': 3, 'ended': 4,
+            'topic': 't', 'metadata': {'a': 1}, 'kind': 'stats'
+        })
+        self.assertEquals(Context.from_dict(d).to_dict(), d)
@@ -0,0 +1,98 @@
+import unittest
+
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.pruning import OTHER, Pruner
+from os_code_profiler.common.stats import Stats
+
+MAIN = ('app.py', 1, 'main')
+HOT = ('app.py', 2, 'hot')
+WARM = ('app.py', 3, 'warm')
+COLD = ('lib.py', 4, 'cold')
+TINY = ('lib.py', 5, 'tiny')
+
+
+def create_stats():
+    """
+    main calls hot, warm and cold. cold calls tiny.
+
+    """
+    return Stats({
+        MAIN: (1, 1, 1.0, 20.0, {}),
+        HOT: (10, 10, 10.0, 10.0, {MAIN: (10, 10, 10.0, 10.0)}),
+        WARM: (5, 5, 5.0, 5.0, {MAIN: (5, 5, 5.0, 5.0)}),
+        COLD: (3, 3, 3.0, 4.0, {MAIN: (3, 3, 3.0, 4.0)}),
+        TINY: (2, 2, 1.0, 1.0, {COLD: (2, 2, 1.0, 1.0)})
+    })
+
+
+def create_ctx():
+    return Context(hostname='h', pid=1, started=0, ended=1, topic='t')
+
+
+class TestPruner(unittest.TestCase):
+    """
+    Tests pruning of stats.
+
+    """
+    def assertTotals(self, pruned, original):
+        for i in [0, 1, 2]:
+            self.assertAlmostEquals(
+                sum(entry[i] for entry in pruned.stats.itervalues()),
+                sum(entry[i] for entry in original.stats.itervalues())
+            )
+
+    def test_top_n(self):
+        """
+        The top functions by own time are kept and the rest are summed
+        into OTHER.
+
+        """
+        ctx = create_ctx()
+        pruned = Pruner(top_n=2)(ctx, create_stats())
+        self.assertEquals(sorted(pruned.stats), sorted([HOT, WARM, OTHER]))
+        self.assertEquals(pruned.stats[OTHER][:4], (6, 6, 5.0, 5.0))
+        self.assertEquals(pruned.stats[HOT][4], {OTHER: (10, 10, 10.0, 10.0)})
+        self.assertTotals(pruned, create_stats())
+        self.assertEquals(ctx.metadata['pruned']['kept'], 2)
+        self.assertEquals(ctx.metadata['pruned']['removed'], 3)
+
+    def test_cumtime(self):
+        """
+        Functions can be ranked by cumulative time.
+
+        """
+        pruned = Pruner(top_n=2, sort='cumtime')(create_ctx(), create_stats())
+        self.assertEquals(sorted(pruned.stats), sorted([MAIN, HOT, OTHER]))
+        # Calls from main into pruned functions become calls into OTHER
+        self.assertEquals(pruned.stats[OTHER][4], {MAIN: (8, 8, 8.0, 9.0)})
+
+    def test_threshold(self):
+        """
+        Functions above the threshold are kept along with the top N.
+
+        """
+        pruned = Pruner(top_n=1, threshold_pct=25)(create_ctx(),
+                                                   create_stats())
+        self.assertEquals(sorted(pruned.stats), sorted([HOT, WARM, OTHER]))
+        self.assertTotals(pruned, create_stats())
+
+    def test_threshold_cumtime(self):
+        """
+        Ranked by cumulative time, the threshold is a share of the
+        largest cumulative time rather than of the total own time.
+
+        """
+        stats = create_stats()
+        stats.stats[MAIN] = (1, 1, 1.0, 40.0, {})
+        pruned = Pruner(top_n=1, threshold_pct=25, sort='cumtime')(
+            create_ctx(), stats
+        )
+        self.assertEquals(sorted(pruned.stats), sorted([MAIN, HOT, OTHER]))
+
+    def test_nothing_removed(self):
+        """
+        Stats are returned unchanged when every function is kept.
+
+        """
+        stats = create_stats()
+        self.assertTrue(Pruner(top_n=10)(create_ctx(), stats) is stats)
@@ -0,0 +1,173 @@
+import sys
+import time
+import unittest
+
+from os_code_profiler.common.sampling import \
+    Sampler, \
+    SamplingException
+
+
+def leaf():
+    return sys._getframe()
+
+
+def middle():
+    return leaf()
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class TestSampler(unittest.TestCase):
+    """
+    Tests the statistical sampler.
+
+    """
+    def key(self, func):
+        code = func.__code__
+        return (code.co_filename, code.co_firstlineno, code.co_name)
+
+    def test_invalid_timer(self):
+        """
+        Unknown timers are rejected.
+
+        """
+        with self.assertRaises(SamplingException):
+            Sampler(timer='invalid')
+
+    def test_record_aggregates_stacks(self):
+        """
+        Identical stacks share one entry.
+
+        """
+        sampler = Sampler()
+        frame = middle()
+        sampler._record(frame, 0.01)
+        sampler._record(frame, 0.02)
+        self.assertEquals(len(sampler._stacks), 1)
+        hits, seconds = sampler._stacks.values()[0]
+        self.assertEquals(hits, 2)
+        self.assertAlmostEquals(seconds, 0.03)
+
+    def test_module_filter(self):
+        """
+        Frames from modules that are not kept are skipped, and samples
+        without any kept frame are dropped.
+
+        """
+        filename = leaf.__code__.co_filename
+        sampler = Sampler()
+        sampler.set_module_filter(lambda f: f == filename)
+        sampler._record(middle(), 0.01)
+        stack = sampler._stacks.keys()[0]
+        self.assertTrue(all(code.co_filename == filename for code in stack))
+        self.assertEquals(stack[0].co_name, 'leaf')
+
+        sampler = Sampler()
+        sampler.set_module_filter(lambda filename: False)
+        sampler._record(middle(), 0.01)
+        self.assertEquals(sampler._stacks, {})
+
+    def test_max_depth(self):
+        """
+        Stacks are truncated to max_depth frames.
+
+        """
+        sampler = Sampler(max_depth=2)
+        sampler._record(middle(), 0.01)
+        stack = sampler._stacks.keys()[0]
+        self.assertEquals(len(stack), 2)
+        self.assertEquals(stack[0].co_name, 'leaf')
+        self.assertEquals(stack[1].co_name, 'middle')
+
+    def test_get_func_stats(self):
+        """
+        Leaf frames get own time. Every frame gets cumulative time and
+        an edge from its caller.
+
+        """
+        sampler = Sampler()
+        sampler._record(middle(), 0.5)
+        stats = sampler.get_func_stats().stats
+        cc, nc, tt, ct, callers = stats[self.key(leaf)]
+        self.assertEquals((cc, nc, tt, ct), (1, 1, 0.5, 0.5))
+        self.assertEquals(callers[self.key(middle)], (1, 1, 0.5, 0.5))
+        cc, nc, tt, ct, callers = stats[self.key(middle)]
+        self.assertEquals((cc, nc, tt, ct), (1, 1, 0.0, 0.5))
+
+    def test_recursion_counted_once(self):
+        """
+        A function appearing twice in one stack gets cumulative time once.
+
+        """
+        def recurse(n):
+            if n:
+                return recurse(n - 1)
+            return sys._getframe()
+
+        sampler = Sampler()
+        sampler._record(recurse(3), 1.0)
+        stats = sampler.get_func_stats().stats
+        code = recurse.__code__
+        key = (code.co_filename, code.co_firstlineno, code.co_name)
+        self.assertEquals(stats[key][3], 1.0)
+        self.assertEquals(stats[key][2], 1.0)
+
+    def test_clear_stats(self):
+        """
+        Clearing discards samples.
+
+        """
+        sampler = Sampler()
+        sampler._record(middle(), 0.01)
+        sampler.clear_stats()
+        self.assertEquals(len(sampler.get_func_stats()), 0)
+
+    def test_snapshot(self):
+        """
+        Snapshots convert lazily. Resetting starts a new set of samples
+        and not resetting keeps a copy that later samples do not change.
+
+        """
+        sampler = Sampler()
+        frame = middle()
+        sampler._record(frame, 0.5)
+        kept = sampler.snapshot(reset=False)
+        sampler._record(frame, 0.5)
+        taken = sampler.snapshot(reset=True)
+        sampler._record(frame, 0.5)
+        leaf_key = self.key(leaf)
+        self.assertEquals(kept.stats().stats[leaf_key][:4], (1, 1, 0.5, 0.5))
+        self.assertEquals(taken.stats().stats[leaf_key][:4], (2, 2, 1.0, 1.0))
+        self.assertEquals(sampler._stacks.values(), [[1, 0.5]])
+
+    def test_thread_timer(self):
+        """
+        The thread timer samples the busy main thread.
+
+        """
+        sampler = Sampler(hz=500)
+        sampler.start()
+        self.assertTrue(sampler.is_running())
+        busy(0.2)
+        sampler.stop()
+        self.assertFalse(sampler.is_running())
+        stats = sampler.get_func_stats().stats
+        self.assertTrue(self.key(busy) in stats)
+        self.assertTrue(stats[self.key(busy)][0] > 10)
+
+    def test_signal_timer(self):
+        """
+        The signal timer samples the main thread using cpu time.
+
+        """
+        sampler = Sampler(hz=500, timer='signal')
+        sampler.set_clock_type('cpu')
+        sampler.start()
+        busy(0.2)
+        sampler.stop()
+        stats = sampler.get_func_stats().stats
+        self.assertTrue(self.key(busy) in stats)
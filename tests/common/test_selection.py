@@ -0,0 +1,50 @@
+import unittest
+
+from os_code_profiler.common.selection import \
+    is_selected, \
+    score, \
+    selected
+
+
+class TestSelection(unittest.TestCase):
+    """
+    Tests fleet wide selection of processes.
+
+    """
+    def test_score(self):
+        """
+        Scores are deterministic and change with the epoch.
+
+        """
+        self.assertEquals(score('h', 1, 't', 5), score('h', 1, 't', 5))
+        self.assertNotEquals(score('h', 1, 't', 5), score('h', 1, 't', 6))
+        self.assertTrue(0 <= score('h', 1, 't', 5) < 1)
+
+    def test_fraction(self):
+        """
+        About pct percent of processes are selected in each epoch, and a
+        different set in each epoch.
+
+        """
+        pids = range(1, 2001)
+        first = set(p for p in pids if is_selected('h', p, 't', 1, 10))
+        second = set(p for p in pids if is_selected('h', p, 't', 2, 10))
+        self.assertTrue(150 < len(first) < 250)
+        self.assertTrue(150 < len(second) < 250)
+        self.assertTrue(len(first & second) < 50)
+        self.assertEquals(
+            len([p for p in pids if is_selected('h', p, 't', 1, 100)]),
+            2000
+        )
+
+    def test_selected(self):
+        """
+        Selection compares a process's score with the percentage.
+
+        """
+        self.assertTrue(selected(0.099, 10))
+        self.assertFalse(selected(0.1, 10))
+        value = score('h', 1, 't', 5)
+        for pct in [value * 100, value * 100 + 0.001]:
+            self.assertEquals(is_selected('h', 1, 't', 5, pct),
+                              selected(value, pct))
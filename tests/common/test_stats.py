@@ -0,0 +1,137 @@
+import mock
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from os_code_profiler.common.stats import \
+    Snapshot, \
+    Stats, \
+    add_callers, \
+    load
+
+
+def create_stats():
+    """
+    Creates a small stats object where a calls b.
+
+    """
+    a = ('a.py', 1, 'a')
+    b = ('b.py', 2, 'b')
+    return Stats({
+        a: (1, 1, 0.5, 2.0, {}),
+        b: (3, 3, 1.5, 1.5, {a: (3, 3, 1.5, 1.5)})
+    })
+
+
+class TestStats(unittest.TestCase):
+    """
+    Tests the pstats style stats container.
+
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_add_callers(self):
+        """
+        Callers with the same key are summed. Others are copied.
+
+        """
+        target = {'x': (1, 1, 1.0, 1.0)}
+        source = {'x': (1, 2, 3.0, 4.0), 'y': (1, 1, 1.0, 1.0)}
+        result = add_callers(target, source)
+        self.assertEquals(result['x'], (2, 3, 4.0, 5.0))
+        self.assertEquals(result['y'], (1, 1, 1.0, 1.0))
+        self.assertEquals(target, {'x': (1, 1, 1.0, 1.0)})
+
+    def test_add(self):
+        """
+        Adding stats sums counters of matching functions.
+
+        """
+        stats = create_stats()
+        stats.add(create_stats())
+        a = stats.stats[('a.py', 1, 'a')]
+        b = stats.stats[('b.py', 2, 'b')]
+        self.assertEquals(a[:4], (2, 2, 1.0, 4.0))
+        self.assertEquals(b[:4], (6, 6, 3.0, 3.0))
+        self.assertEquals(b[4][('a.py', 1, 'a')], (6, 6, 3.0, 3.0))
+
+    def test_scale(self):
+        """
+        Scaling multiplies every counter, rounding call counts.
+
+        """
+        stats = create_stats()
+        scaled = stats.scale(2.5)
+        b = scaled.stats[('b.py', 2, 'b')]
+        self.assertEquals(b[:4], (8, 8, 3.75, 3.75))
+        self.assertEquals(b[4][('a.py', 1, 'a')], (8, 8, 3.75, 3.75))
+        self.assertEquals(stats.stats[('b.py', 2, 'b')][:4],
+                          (3, 3, 1.5, 1.5))
+
+    def test_total_time(self):
+        """
+        Total time is the sum of own time.
+
+        """
+        self.assertEquals(create_stats().total_time(), 2.0)
+
+    def test_save_load(self):
+        """
+        Saved stats can be loaded back and read by pstats.
+
+        """
+        path = os.path.join(self.tmpdir, 'test.stats')
+        stats = create_stats()
+        stats.save(path)
+        self.assertEquals(load(path).stats, stats.stats)
+        self.assertEquals(pstats.Stats(path).total_calls, 4)
+
+    def test_snapshot(self):
+        """
+        Snapshots convert their raw counters once, on first use.
+
+        """
+        convert = mock.Mock(return_value=create_stats())
+        snapshot = Snapshot('raw', convert)
+        convert.assert_not_called()
+        path = os.path.join(self.tmpdir, 'snapshot.stats')
+        snapshot.save(path)
+        snapshot.stats()
+        convert.assert_called_once_with('raw')
+        self.assertEquals(load(path).stats, create_stats().stats)
+
+    def test_load_ystat(self):
+        """
+        Files saved by GreenletProfiler are converted when loaded.
+
+        """
+        import GreenletProfiler
+
+        def callee():
+            pass
+
+        def caller():
+            callee()
+
+        GreenletProfiler.clear_stats()
+        GreenletProfiler.start()
+        caller()
+        caller()
+        GreenletProfiler.stop()
+        path = os.path.join(self.tmpdir, 'ystat.stats')
+        GreenletProfiler.get_func_stats().save(path)
+        GreenletProfiler.clear_stats()
+
+        stats = load(path).stats
+        code = callee.__code__
+        callee_key = (code.co_filename, code.co_firstlineno, 'callee')
+        code = caller.__code__
+        caller_key = (code.co_filename, code.co_firstlineno, 'caller')
+        self.assertEquals(stats[callee_key][:2], (2, 2))
+        self.assertEquals(stats[callee_key][4][caller_key][:2], (2, 2))
@@ -0,0 +1,134 @@
+import os
+import unittest
+
+from os_code_profiler.collectors.base import Document
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.common.workers import \
+    Aggregator, \
+    PipeOutput, \
+    Workers
+
+A = ('a.py', 1, 'a')
+
+
+class FakeWriter(object):
+    def __init__(self):
+        self.submitted = []
+        self.started = False
+        self.stopped = False
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.stopped = True
+
+    def submit(self, ctx, stats):
+        self.submitted.append((ctx, stats))
+
+
+class TestAggregator(unittest.TestCase):
+    """
+    Tests merging the dumps of workers.
+
+    """
+    def setUp(self):
+        self.writer = FakeWriter()
+        self.aggregator = Aggregator(self.writer, timeout=10)
+        # Receive on the calling thread
+        self.aggregator._thread = True
+
+    def tearDown(self):
+        for fd in self.aggregator.fds():
+            os.close(fd)
+
+    def connect(self):
+        read_fd, write_fd = os.pipe()
+        self.aggregator.add(read_fd)
+        return read_fd, PipeOutput(write_fd)
+
+    def test_merge_interval(self):
+        """
+        Stats dumps of an interval are merged once every worker sent
+        theirs. Documents are passed on.
+
+        """
+        pipes = [self.connect(), self.connect()]
+        for pid, (read_fd, output) in zip([10, 20], pipes):
+            output.write(Context(pid=pid, started=pid, ended=60, topic='t'),
+                         Stats({A: (1, 1, 1.0, 1.0, {})}))
+        pipes[0][1].write(Context(pid=10, kind='histograms'),
+                          Document({'functions': {}}))
+
+        self.aggregator._receive(pipes[0][0], 0)
+        self.assertEquals(self.writer.submitted[0][1].data,
+                          {'functions': {}})
+        self.assertEquals(len(self.writer.submitted), 1)
+        self.aggregator._receive(pipes[1][0], 0)
+        ctx, stats = self.writer.submitted[1]
+        self.assertEquals(stats.stats, {A: (2, 2, 2.0, 2.0, {})})
+        self.assertEquals((ctx.started, ctx.ended, ctx.topic),
+                          (10, 60, 't'))
+        self.assertEquals(ctx.metadata['workers'],
+                          {'pids': [10, 20], 'count': 2})
+
+    def test_timeout(self):
+        """
+        Intervals missing a worker are written after the timeout.
+
+        """
+        self.connect()
+        self.connect()
+        self.aggregator.handle(Context(pid=1, ended=60),
+                               {A: (1, 1, 1.0, 1.0, {})}, 0)
+        self.assertEquals(self.writer.submitted, [])
+        self.aggregator.flush(5)
+        self.assertEquals(self.writer.submitted, [])
+        self.aggregator.flush(10)
+        self.assertEquals(len(self.writer.submitted), 1)
+
+    def test_worker_exit(self):
+        """
+        Pipes of exited workers are closed.
+
+        """
+        read_fd, output = self.connect()
+        os.close(output._fd)
+        self.aggregator._receive(read_fd, 0)
+        self.assertEquals(self.aggregator.fds(), [])
+
+
+class TestWorkers(unittest.TestCase):
+    """
+    Tests selecting forked workers.
+
+    """
+    def test_max_workers(self):
+        """
+        At most max_workers live workers are profiled.
+
+        """
+        workers = Workers(max_workers=2)
+        for pid in [1, 2, 3]:
+            child = workers.before_fork([1, 2])
+            workers.after_fork(pid, child)
+        self.assertEquals(workers._profiled, set([1, 2]))
+        child = workers.before_fork([2])
+        self.assertTrue(child['selected'])
+        self.assertEquals(child['fd'], None)
+
+    def test_pipes(self):
+        """
+        With aggregation each profiled worker gets a pipe.
+
+        """
+        aggregator = Aggregator(FakeWriter(), timeout=1)
+        aggregator._thread = True
+        workers = Workers(aggregator=aggregator)
+        child = workers.before_fork([])
+        self.assertTrue(child['fd'] is not None)
+        workers.after_fork(5, child)
+        self.assertEquals(len(aggregator.fds()), 1)
+        self.assertEquals(child['inherited'], aggregator.fds())
+        os.close(aggregator.fds()[0])
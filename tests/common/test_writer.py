@@ -0,0 +1,202 @@
+import eventlet
+import mock
+import time
+import unittest
+
+from os_code_profiler.common.writer import Writer
+
+
+class FakeOutput(object):
+    """
+    Output that records what was written to it.
+
+    """
+    def __init__(self):
+        self.written = []
+
+    def write(self, ctx, stats):
+        self.written.append((ctx, stats))
+
+
+class BadOutput(object):
+    """
+    Output that always fails.
+
+    """
+    def write(self, ctx, stats):
+        raise Exception("Stuff happened yo")
+
+
+def flush(writer):
+    """
+    Writes the queued snapshots on the writer's thread.
+
+    """
+    writer.start()
+    writer.stop()
+
+
+class TestWriter(unittest.TestCase):
+    """
+    Tests the background writer stage.
+
+    """
+    def test_submit_does_not_write(self):
+        """
+        Submitting only queues the snapshot.
+
+        """
+        output = FakeOutput()
+        writer = Writer([output])
+        self.assertTrue(writer.submit('ctx', 'stats'))
+        self.assertEquals(output.written, [])
+        self.assertEquals(writer.metrics()['queue_depth'], 1)
+
+    def test_in_order(self):
+        """
+        Snapshots are written in submission order.
+
+        """
+        output = FakeOutput()
+        writer = Writer([output])
+        for i in range(3):
+            writer.submit(i, 'stats%s' % i)
+        flush(writer)
+        self.assertEquals([c for c, s in output.written], [0, 1, 2])
+        self.assertEquals(writer.metrics()['queue_depth'], 0)
+
+    def test_bounded(self):
+        """
+        A full queue drops new snapshots instead of blocking.
+
+        """
+        output = FakeOutput()
+        writer = Writer([output], queue_size=2)
+        self.assertTrue(writer.submit(1, 'a'))
+        self.assertTrue(writer.submit(2, 'b'))
+        self.assertFalse(writer.submit(3, 'c'))
+        flush(writer)
+        self.assertEquals([c for c, s in output.written], [1, 2])
+        metrics = writer.metrics()
+        self.assertEquals(metrics['submitted'], 3)
+        self.assertEquals(metrics['dropped'], 1)
+        self.assertEquals(metrics['written'], 2)
+
+    def test_output_exception(self):
+        """
+        A failing output does not prevent writes to other outputs.
+
+        """
+        output = FakeOutput()
+        writer = Writer([BadOutput(), output])
+        writer.submit(1, 'a')
+        flush(writer)
+        self.assertEquals(len(output.written), 1)
+        self.assertEquals(writer.metrics()['errors'], 1)
+
+    def test_transforms(self):
+        """
+        Transforms are applied in order before writing. A failing
+        transform skips the snapshot.
+
+        """
+        def double(ctx, stats):
+            return stats * 2
+
+        def fail_on_two(ctx, stats):
+            if ctx == 2:
+                raise Exception("Stuff happened yo")
+            return stats + 1
+
+        output = FakeOutput()
+        writer = Writer([output], transforms=[double, fail_on_two])
+        writer.submit(1, 1)
+        writer.submit(2, 1)
+        flush(writer)
+        self.assertEquals(output.written, [(1, 3)])
+        self.assertEquals(writer.metrics()['errors'], 1)
+
+    @mock.patch(
+        'os_code_profiler.common.writer.time.time',
+        side_effect=[10.0, 12.5, 20.0, 20.5]
+    )
+    def test_latency(self, mocked_time):
+        """
+        Write latency is recorded per snapshot.
+
+        """
+        writer = Writer([FakeOutput()])
+        writer.submit(1, 'a')
+        writer.submit(2, 'b')
+        flush(writer)
+        metrics = writer.metrics()
+        self.assertEquals(metrics['last_latency'], 0.5)
+        self.assertEquals(metrics['max_latency'], 2.5)
+        self.assertEquals(metrics['mean_latency'], 1.5)
+
+    def test_thread(self):
+        """
+        The writer thread writes queued snapshots and flushes on stop.
+
+        """
+        output = FakeOutput()
+        writer = Writer([output], queue_size=5)
+        writer.start()
+        for i in range(5):
+            writer.submit(i, 'stats')
+        writer.stop()
+        self.assertEquals([c for c, s in output.written], range(5))
+        self.assertTrue(writer._thread is None)
+
+    def test_stop_full_queue(self):
+        """
+        Stopping with a full queue does not block and still writes
+        every queued snapshot.
+
+        """
+        output = FakeOutput()
+        writer = Writer([output], queue_size=2)
+        writer.submit(1, 'a')
+        writer.submit(2, 'b')
+        writer.start()
+        writer.stop()
+        self.assertEquals([c for c, s in output.written], [1, 2])
+        self.assertTrue(writer._thread is None)
+
+    def test_stop_green(self):
+        """
+        Waiting for the writer lets other green threads run.
+
+        """
+        ran = []
+
+        def slow_write(ctx, stats):
+            time.sleep(0.2)
+
+        output = FakeOutput()
+        output.write = slow_write
+        writer = Writer([output])
+        writer.start()
+        writer.submit(1, 'a')
+        with mock.patch('os_code_profiler.common.writer.time.sleep',
+                        eventlet.sleep):
+            other = eventlet.spawn(ran.append, True)
+            writer.stop()
+            other.wait()
+        self.assertEquals(ran, [True])
+
+    def test_close_outputs(self):
+        """
+        Outputs with a close method are closed after the last write.
+
+        """
+        output = FakeOutput()
+        output.close = mock.Mock(
+            side_effect=lambda: self.assertEquals(len(output.written), 1)
+        )
+        writer = Writer([output, FakeOutput()])
+        writer.start()
+        writer.submit(1, 'stats')
+        writer.stop()
+        output.close.assert_called_once_with()
+        self.assertEquals(writer.errors, 0)
@@ -1,7 +1,18 @@
+import eventlet
 import mock
 import os
+import subprocess
+import sys
+import time
 import unittest
 
+from os_code_profiler.backends.base import Base as BaseBackend
+from os_code_profiler.backends.sampling import SamplingBackend
+from os_code_profiler.backends.tracing import GreenletProfilerBackend
+from os_code_profiler.common.delta import DeltaEncoder
+from os_code_profiler.common.profiling import Config as ProfilingConfig
+from os_code_profiler.common.pruning import Pruner
+from os_code_profiler.common.workers import PipeOutput
 from os_code_profiler.decorators.nova import \
     NovaServiceProfilingException, \
     Service, \
@@ -9,13 +20,13 @@ from os_code_profiler.decorators.nova import \
     _Dumper
 
 
-def fake_start(builtins=False, profile_threads=True):
-    raise(Exception('This should not be called'))
+def work(n):
+    for i in range(n):
+        square(i)
 
 
-class FakeConfig():
-    def __init__(self, d):
-        self.__dict__ = d
+def square(i):
+    return i * i
 
 
 class FakeThreadGroup(object):
@@ -44,109 +55,481 @@ class TestNovaServiceDumper(unittest.TestCase):
                 os.remove(os.path.join(self.results_dir, f))
 
     def create_config(self, clock_type='wall', interval=30,
-                      clear_each_interval=True, results_dir=None):
+                      clear_each_interval=True, results_dir=None,
+                      **kwargs):
         """
-        Creates a fake configuration for all _Dumper instances
+        Creates a configuration for all _Dumper instances
 
         """
         if results_dir is None:
             results_dir = self.results_dir
 
-        return FakeConfig({
+        kwargs.update({
             'clock_type': clock_type,
             'interval': interval,
             'clear_each_interval': clear_each_interval,
             'results_dir': results_dir
         })
+        return ProfilingConfig(kwargs)
 
-    @mock.patch(
-        'os_code_profiler.decorators.nova.profiler.is_running',
-        return_value=True
-    )
-    def test_profiling_already_enabled(self, mocked):
+    def create_dumper(self, config=None, outputs=None, running=False):
+        """
+        Creates a _Dumper with a mocked backend.
+
+        """
+        if config is None:
+            config = self.create_config()
+        if outputs is None:
+            outputs = []
+        dumper = _Dumper(object(), config, outputs)
+        dumper._backend = mock.Mock(spec=BaseBackend)
+        dumper._backend.is_running.return_value = running
+        dumper._backend.snapshot.return_value = 5
+        return dumper
+
+    def test_profiling_already_enabled(self):
         """
         Worker method should raise exception if profiling already enabled.
 
         """
-        config = self.create_config()
-        dumper = _Dumper(object(), config, [])
+        dumper = self.create_dumper(running=True)
         with self.assertRaises(NovaServiceProfilingException):
             dumper.work()
 
-    @mock.patch('os_code_profiler.decorators.nova.profiler.start')
-    def test_set_started(self, mocked_start):
+    def test_set_started(self):
         """
         Tests that _started attribute is set at the beginning of work()
 
         """
-        config = self.create_config()
-        dumper = _Dumper(object(), config, [])
+        dumper = self.create_dumper()
         dumper._stop = True
         dumper.work()
         self.assertTrue(dumper._started is not None)
+        dumper._backend.start.assert_called_with()
 
-    @mock.patch('os_code_profiler.decorators.nova.profiler.start')
-    def test_set_ended(self, mocked_start):
+    def test_set_ended(self):
         """
         Tests that _ended attribute is set at the end of work()
 
         """
-        config = self.create_config()
-        dumper = _Dumper(object(), config, [])
+        dumper = self.create_dumper()
         dumper._stop = True
         dumper.work()
         self.assertTrue(dumper._ended is not None)
+        dumper._backend.stop.assert_called_with()
 
-    @mock.patch('os_code_profiler.decorators.nova.profiler.start')
-    @mock.patch('os_code_profiler.decorators.nova.profiler.stop')
-    @mock.patch('os_code_profiler.decorators.nova.profiler.clear_stats')
     @mock.patch(
         'os_code_profiler.decorators.nova.utils.utc_seconds',
-        return_value=1
+        return_value=2
     )
-    def test_dump_with_clear(
-        self, mocked_time, mocked_clear,
-        mocked_stop, mocked_start
-    ):
+    def test_dump_with_clear(self, mocked_time):
         """
-        Tests that dump stops, clears, then restarts the profiler
+        Tests that dump snapshots and resets the stats without stopping
+        the profiler, and starts the next interval where this one ended.
 
         """
         config = self.create_config(clear_each_interval=True)
-        dumper = _Dumper(object(), config, [])
+        dumper = self.create_dumper(config)
         dumper._started = 1
         dumper._dump()
-        mocked_stop.assert_called_with()
-        mocked_clear.assert_called_with()
-        mocked_start.assert_called_with()
-        self.assertEquals(mocked_time.call_count, 3)
+        dumper._backend.snapshot.assert_called_with(reset=True)
+        dumper._backend.stop.assert_not_called()
+        dumper._backend.clear_stats.assert_not_called()
+        dumper._backend.start.assert_not_called()
+        self.assertEquals(dumper._started, 2)
+        ctx, stats = dumper._writer._queue.get_nowait()
+        self.assertEquals((ctx.started, ctx.ended), (1, 2))
 
-    @mock.patch('os_code_profiler.decorators.nova.profiler.start')
-    @mock.patch('os_code_profiler.decorators.nova.profiler.stop')
-    @mock.patch('os_code_profiler.decorators.nova.profiler.clear_stats')
-    def test_dump_no_clear(self, mocked_clear, mocked_stop, mocked_start):
+    @mock.patch(
+        'os_code_profiler.decorators.nova.utils.utc_seconds',
+        return_value=2
+    )
+    def test_dump_no_clear(self, mocked_time):
         """
-        Tests that the profiler is not stopped, cleared, then restarted
+        Tests that the stats are not reset and the interval keeps
+        its original start.
 
         """
         config = self.create_config(clear_each_interval=False)
-        dumper = _Dumper(object(), config, [])
+        dumper = self.create_dumper(config)
+        dumper._started = 1
         dumper._dump()
-        mocked_stop.assert_not_called()
-        mocked_clear.assert_not_called()
-        mocked_start.assert_not_called()
+        dumper._backend.snapshot.assert_called_with(reset=False)
+        dumper._backend.stop.assert_not_called()
+        self.assertEquals(dumper._started, 1)
+
+    def test_no_gap_between_intervals(self):
+        """
+        Calls made while a dump is being written are counted in the
+        next interval, so consecutive intervals cover every call.
+
+        """
+        class BusyOutput(object):
+            def __init__(self):
+                self.calls = 0
+
+            def write(self, ctx, stats):
+                # The service keeps working while the writer writes
+                work(7)
+                code = square.__code__
+                entry = stats.stats().stats.get(
+                    (code.co_filename, code.co_firstlineno, code.co_name)
+                )
+                if entry is not None:
+                    self.calls += entry[1]
+
+        output = BusyOutput()
+        config = self.create_config(backend='cprofile')
+        dumper = _Dumper(object(), config, [output])
+
+        def write_queued():
+            # cProfile only traces this thread, so write here
+            dumper._writer._write(*dumper._writer._queue.get_nowait())
+
+        dumper.set_clock_type()
+        dumper._backend.start()
+        work(10)
+        dumper._dump()
+        write_queued()
+        work(5)
+        dumper._dump()
+        write_queued()
+        dumper._backend.stop()
+        dumper._dump()
+        write_queued()
+        self.assertEquals(output.calls, 10 + 7 + 5 + 7)
+
+    def test_next_deadline_aligned(self):
+        """
+        Aligned deadlines fall on multiples of the interval.
+
+        """
+        dumper = self.create_dumper(self.create_config(interval=300))
+        self.assertEquals(dumper._next_deadline(0, 1000), 1200)
+        self.assertEquals(dumper._next_deadline(0, 1200), 1500)
+
+    def test_next_deadline_unaligned(self):
+        """
+        Unaligned deadlines follow the previous one without drifting,
+        skipping any that were missed.
+
+        """
+        dumper = self.create_dumper(
+            self.create_config(interval=300, align_intervals=False)
+        )
+        self.assertEquals(dumper._next_deadline(1000, 1000.5), 1300)
+        self.assertEquals(dumper._next_deadline(1000, 1301), 1600)
+        self.assertEquals(dumper._next_deadline(1000, 1900), 2200)
+
+    def test_stop_wakes_worker(self):
+        """
+        Stopping a worker that is waiting for its next dump takes effect
+        immediately and flushes the writer.
 
-    @mock.patch('os_code_profiler.decorators.nova.profiler.set_clock_type')
-    def test_set_clock_type(self, mocked):
+        """
+        dumper = self.create_dumper(self.create_config(interval=3600))
+        thread = eventlet.spawn(dumper.work)
+        eventlet.sleep(0)
+        began = time.time()
+        dumper.stop()
+        thread.wait()
+        self.assertTrue(time.time() - began < 0.5)
+        dumper._backend.stop.assert_called_with()
+        dumper._backend.snapshot.assert_not_called()
+        self.assertEquals(dumper._writer._thread, None)
+
+    def test_kill_flushes(self):
+        """
+        Killing the worker's green thread still stops the profiler.
+
+        """
+        dumper = self.create_dumper(self.create_config(interval=3600))
+        thread = eventlet.spawn(dumper.work)
+        eventlet.sleep(0)
+        thread.kill()
+        dumper._backend.stop.assert_called_with()
+        self.assertEquals(dumper._writer._thread, None)
+
+    def test_work_dumps_on_boundaries(self):
+        """
+        Intervals end exactly on the aligned deadlines.
+
+        """
+        dumper = self.create_dumper(self.create_config(interval=1))
+        dumper._dump = mock.Mock(side_effect=lambda ended: dumper.stop())
+        thread = eventlet.spawn(dumper.work)
+        thread.wait()
+        ended = dumper._dump.call_args[1]['ended']
+        self.assertEquals(ended % 1, 0)
+        self.assertTrue(dumper._started < ended <= dumper._ended)
+
+    def test_local_clock_change(self):
+        """
+        Dumps are scheduled with time.time, so turning the local clock
+        back an hour neither delays the next dump nor misaligns its
+        label.
+
+        """
+        dumper = self.create_dumper(self.create_config(interval=1))
+        dumper._wakeup = mock.Mock()
+        dumper._wakeup.wait.side_effect = lambda remaining: dumper.stop()
+        with mock.patch(
+            'os_code_profiler.decorators.nova.utils.utc_seconds',
+            side_effect=lambda: time.time() - 3600
+        ):
+            dumper._wait_until(time.time() + 10)
+            ended = dumper._context_time(1000.25)
+        self.assertTrue(dumper._wakeup.wait.call_args[0][0] <= 10)
+        self.assertEquals(ended, 1000.25 - 3600)
+
+    def test_duty_cycle(self):
+        """
+        On a duty cycle the profiler only runs during each window, and
+        each dump covers one window and records the duty cycle.
+
+        """
+        class FakeOutput(object):
+            def write(self, context, stats):
+                pass
+
+        output = FakeOutput()
+        output.write = mock.Mock()
+        config = self.create_config(
+            align_intervals=False, duty_cycle_on=0.05,
+            duty_cycle_period=0.2, duty_cycle_jitter=0.1
+        )
+        dumper = self.create_dumper(config, [output])
+        self.assertTrue(0 <= dumper._duty_cycle_offset <= 0.1)
+
+        dump = dumper._dump
+
+        def dump_once(ended):
+            dump(ended=ended)
+            dumper.stop()
+
+        dumper._dump = dump_once
+        began = time.time()
+        eventlet.spawn(dumper.work).wait()
+        self.assertTrue(time.time() - began >= 0.05)
+        dumper._backend.start.assert_called_once_with()
+        dumper._backend.snapshot.assert_called_once_with(reset=True)
+
+        ctx, stats = output.write.call_args[0]
+        self.assertAlmostEquals(ctx.ended - ctx.started, 0.05)
+        self.assertEquals(ctx.metadata['duty_cycle'], {
+            'on': 0.05, 'period': 0.2, 'offset': dumper._duty_cycle_offset
+        })
+
+    def test_overhead_budget(self):
+        """
+        With an overhead budget, each dump records the cpu used and the
+        profiler is stopped for intervals the budget skips.
+
+        """
+        config = self.create_config(max_overhead_pct=1)
+        dumper = self.create_dumper(config)
+        self.assertTrue(dumper._budget in dumper._writer._transforms)
+
+        dumper._budget.should_profile = mock.Mock(
+            side_effect=[True, False, True]
+        )
+        dumper._start_interval(1)
+        dumper._backend.start.assert_called_once_with()
+        self.assertEquals(dumper._started, dumper._context_time(1))
+        dumper._dump(ended=2)
+        ctx, stats = dumper._writer._queue.get_nowait()
+        self.assertEquals(sorted(ctx.metadata['overhead']),
+                          ['cpu', 'dump'])
+
+        dumper._start_interval(2)
+        dumper._backend.stop.assert_called_once_with()
+        self.assertFalse(dumper._profiling)
+        dumper._start_interval(3)
+        self.assertEquals(dumper._backend.start.call_count, 2)
+        self.assertEquals(dumper._started, dumper._context_time(3))
+
+    def test_overhead_budget_module_filter(self):
+        """
+        The budget counts calls a module filter dropped, since they were
+        traced all the same.
+
+        """
+        class FakeOutput(object):
+            def write(self, context, stats):
+                self.context = context
+                self.stats = stats
+
+        output = FakeOutput()
+        config = self.create_config(backend='cprofile',
+                                    include_modules='nothing.*',
+                                    max_overhead_pct=1)
+        dumper = _Dumper(object(), config, [output])
+        dumper._budget.per_call = 0.001
+        dumper.set_clock_type()
+        dumper._start_interval(time.time())
+        work(1000)
+        dumper._backend.stop()
+        dumper._dump()
+        dumper._writer._write(*dumper._writer._queue.get_nowait())
+        self.assertEquals(len(output.stats), 0)
+        self.assertTrue(output.context.metadata['overhead']['calls'] >= 1000)
+        self.assertTrue(dumper._budget.fraction < 1.0)
+
+    def test_select_pct(self):
+        """
+        Only selected processes profile an interval, and their dumps
+        record the selection.
+
+        """
+        config = self.create_config(select_pct=50, interval=60)
+        dumper = self.create_dumper(config)
+        with mock.patch('os_code_profiler.decorators.nova.selection.score',
+                        side_effect=[0.7, 0.2]) as mocked:
+            dumper._start_interval(120)
+            self.assertFalse(dumper._profiling)
+            dumper._backend.start.assert_not_called()
+            dumper._start_interval(180)
+            self.assertTrue(dumper._profiling)
+        self.assertEquals(mocked.call_args[0][2:], ('nova-unknown', 3))
+
+        dumper._dump(ended=240)
+        ctx, stats = dumper._writer._queue.get_nowait()
+        self.assertEquals(ctx.metadata['selection'],
+                          {'pct': 50, 'epoch': 3, 'score': 0.2})
+
+    def test_set_clock_type(self):
         """
         Tests setting of the clock type.
 
         """
         config = self.create_config()
         config.clock_type = 'blah'
-        dumper = _Dumper(object(), config, [])
+        dumper = self.create_dumper(config)
         dumper.set_clock_type()
-        mocked.assert_called_with('blah')
+        dumper._backend.set_clock_type.assert_called_with('blah')
+
+    def test_default_backend(self):
+        """
+        GreenletProfiler is the default backend.
+
+        """
+        dumper = _Dumper(object(), self.create_config(), [])
+        self.assertTrue(isinstance(dumper._backend, GreenletProfilerBackend))
+
+    def test_backend_from_config(self):
+        """
+        The backend is loaded from the config with its own config.
+
+        """
+        config = self.create_config(
+            backend='sampling',
+            backend_config={'hz': 50, 'max_depth': 8}
+        )
+        dumper = _Dumper(object(), config, [])
+        self.assertTrue(isinstance(dumper._backend, SamplingBackend))
+        self.assertEquals(dumper._backend._sampler._period, 0.02)
+        self.assertEquals(dumper._backend._sampler._max_depth, 8)
+
+    def test_delta_each_interval(self):
+        """
+        Delta dumps keep the counters and encode deltas on the writer.
+
+        """
+        config = self.create_config(delta_each_interval=True)
+        dumper = self.create_dumper(config)
+        self.assertTrue(isinstance(dumper._writer._transforms[0],
+                                   DeltaEncoder))
+        dumper._started = 1
+        dumper._dump()
+        dumper._backend.snapshot.assert_called_with(reset=False)
+        self.assertTrue(dumper._started != 1)
+
+    def test_module_filter(self):
+        """
+        The module filter from the config is handed to the backend.
+
+        """
+        config = self.create_config(backend='cprofile',
+                                    include_modules='nova.*, oslo',
+                                    exclude_modules=['nova.db'])
+        dumper = _Dumper(object(), config, [])
+        module_filter = dumper._backend._module_filter
+        self.assertEquals(module_filter._include, ['nova.*', 'oslo'])
+        self.assertEquals(module_filter._exclude, ['nova.db'])
+        self.assertEquals(dumper._writer._transforms, [])
+
+    def test_pruning(self):
+        """
+        Pruning is applied on the writer after delta encoding.
+
+        """
+        config = self.create_config(delta_each_interval=True,
+                                    prune_top_n=10)
+        dumper = self.create_dumper(config)
+        transforms = dumper._writer._transforms
+        self.assertTrue(isinstance(transforms[0], DeltaEncoder))
+        self.assertTrue(isinstance(transforms[1], Pruner))
+
+    def test_collectors(self):
+        """
+        Collectors run with the worker and are dumped to their own kind
+        without the writer's transforms.
+
+        """
+        class FakeOutput(object):
+            def write(self, context, stats):
+                pass
+
+        config = self.create_config(
+            prune_top_n=1,
+            collectors={'histogram': {'functions': []}}
+        )
+        output = FakeOutput()
+        output.write = mock.Mock()
+        dumper = self.create_dumper(config, [output])
+        collector = dumper._collectors[0]
+        collector.start = mock.Mock()
+        collector.stop = mock.Mock()
+        dumper._stop = True
+        dumper.work()
+        collector.start.assert_called_with()
+        collector.stop.assert_called_with()
+
+        dumper._collectors_started = 1
+        dumper._dump_collectors(ended=2)
+        dumper._writer.start()
+        dumper._writer.stop()
+        ctx, document = output.write.call_args[0]
+        self.assertEquals(ctx.kind, 'histograms')
+        self.assertEquals((ctx.started, ctx.ended), (1, 2))
+        self.assertEquals(document.data, {'functions': {}})
+        self.assertEquals(dumper._collectors_started, 2)
+        self.assertEquals(output.write.call_count, 1)
+
+    def test_collectors_every_interval(self):
+        """
+        Collectors are dumped every interval, even those the process is
+        not selected to profile, and the writer's queue has room for
+        their documents.
+
+        """
+        config = self.create_config(
+            interval=1, select_pct=50, writer_queue_size=2,
+            collectors={'histogram': {'functions': []},
+                        'slow_calls': {'functions': []}}
+        )
+        dumper = self.create_dumper(config)
+        self.assertEquals(dumper._writer._queue.maxsize, 6)
+        dumper._dump = mock.Mock()
+        dumper._dump_collectors = mock.Mock(
+            side_effect=lambda ended: dumper.stop()
+        )
+        with mock.patch('os_code_profiler.decorators.nova.selection.score',
+                        return_value=0.9):
+            eventlet.spawn(dumper.work).wait()
+        self.assertFalse(dumper._dump.called)
+        ended = dumper._dump_collectors.call_args[0][0]
+        self.assertEquals(ended % 1, 0)
 
     def test_outputs_init(self):
         """
@@ -159,16 +542,12 @@ class TestNovaServiceDumper(unittest.TestCase):
         dumper = _Dumper(object(), config, outputs)
         self.assertEquals(dumper._outputs, outputs)
 
-    @mock.patch('os_code_profiler.decorators.nova.profiler.start')
-    @mock.patch('os_code_profiler.decorators.nova.profiler.stop')
-    @mock.patch('os_code_profiler.decorators.nova.profiler.clear_stats')
-    def test_outputs_exception(self, *mocked):
+    def test_outputs_exception(self):
         """
         Execution should continue even if output encounters
         exception during write.
 
         """
-        config = self.create_config()
         class BadOutput(object):
             def write(self, ctx, stats):
                 raise Exception("Stuff happened yo")
@@ -180,18 +559,13 @@ class TestNovaServiceDumper(unittest.TestCase):
         outputs = [BadOutput(), GoodOutput()]
         outputs[1].write = mock.Mock()
 
-        dumper = _Dumper(object(), config, outputs)
+        dumper = self.create_dumper(outputs=outputs)
         dumper._dump()
+        dumper._writer.start()
+        dumper._writer.stop()
         self.assertEquals(outputs[1].write.call_count, 1)
 
-    @mock.patch(
-        'os_code_profiler.decorators.nova.profiler.get_func_stats',
-        return_value=5
-    )
-    @mock.patch('os_code_profiler.decorators.nova.profiler.start')
-    @mock.patch('os_code_profiler.decorators.nova.profiler.stop')
-    @mock.patch('os_code_profiler.decorators.nova.profiler.clear_stats')
-    def test_dump_outputs(self, *mocked):
+    def test_dump_outputs(self):
         """
         Tests that the write method of each output is called
         during a dump.
@@ -201,22 +575,66 @@ class TestNovaServiceDumper(unittest.TestCase):
             def write(self, context, stats):
                 pass
 
-        config = self.create_config()
         outputs = [FakeOutput(), FakeOutput()]
         for o in outputs:
             o.write = mock.Mock()
 
-        dumper = _Dumper(object(), config, outputs)
+        dumper = self.create_dumper(outputs=outputs)
         dumper._dump()
+        for o in outputs:
+            o.write.assert_not_called()
+        dumper._writer.start()
+        dumper._writer.stop()
         for o in outputs:
             self.assertEquals(o.write.call_count, 1)
 
+    def test_dump_writer_metrics(self):
+        """
+        Each dump's context should carry the writer's metrics.
+
+        """
+        class FakeOutput(object):
+            def write(self, context, stats):
+                pass
+
+        config = self.create_config(writer_queue_size=1)
+        output = FakeOutput()
+        output.write = mock.Mock()
+        dumper = self.create_dumper(config, [output])
+        dumper._dump()
+        dumper._dump()
+        dumper._writer.start()
+        dumper._writer.stop()
+        ctx, stats = output.write.call_args[0]
+        self.assertEquals(stats, 5)
+        self.assertEquals(ctx.metadata['writer']['queue_depth'], 0)
+        self.assertEquals(dumper._writer.dropped, 1)
+
 
 class TestNovaService(unittest.TestCase):
     """
     Class for testing the nova service decorator.
 
     """
+    def test_lazy_imports(self):
+        """
+        Importing the decorator does not import eventlet or a profiler.
+
+        """
+        code = (
+            'import sys\n'
+            'import os_code_profiler.decorators.nova\n'
+            'heavy = ["eventlet", "greenlet", "GreenletProfiler", "yappi",'
+            ' "socket"]\n'
+            'print ",".join(n for n in heavy if sys.modules.get(n))\n'
+        )
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)
+        )))
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=root)
+        self.assertEquals(output.strip(), '')
+
     def test_callable_instance(self):
         """
         Tests that Service is an instance of ServiceCallable
@@ -226,7 +644,7 @@ class TestNovaService(unittest.TestCase):
 
     @mock.patch(
         'os_code_profiler.decorators.nova.ProfilingConfig',
-        return_value=FakeConfig({})
+        return_value=ProfilingConfig({})
     )
     def test_config(self, mocked_config_class):
         """
@@ -260,6 +678,93 @@ class TestNovaService(unittest.TestCase):
         s = module.Service()
         self.assertEquals(s.tg.thread_counter, 1)
 
+    def test_stop_stops_dumper(self):
+        """
+        Stopping the service stops its dumper first.
+
+        """
+        class FakeModule():
+            class Service(object):
+                def __init__(self, threads=1000):
+                    self.tg = FakeThreadGroup()
+                    self.stopped = False
+
+                def stop(self):
+                    self.stopped = True
+
+        module = Service(FakeModule(), {})
+        s = module.Service()
+        s.stop()
+        self.assertTrue(s.stopped)
+        self.assertTrue(s._os_code_profiler_dumper.should_stop())
+
+    def test_forked_workers(self):
+        """
+        The parent stops profiling and each forked worker re-arms with
+        fresh state, up to max_workers, sending its dumps to the parent.
+
+        """
+        class FakeModule():
+            class Service(object):
+                def __init__(self, threads=1000):
+                    self.tg = FakeThreadGroup()
+                    self.started = 0
+
+                def start(self):
+                    self.started += 1
+
+            class ProcessLauncher(object):
+                def _start_child(self, wrap):
+                    return wrap.next_pid
+
+        class FakeWrap(object):
+            def __init__(self, service):
+                self.service = service
+                self.children = set()
+                self.next_pid = None
+
+        module = Service(FakeModule(), {'max_workers': 1,
+                                        'aggregate_workers': True})
+        s = module.Service()
+        parent = s._os_code_profiler_dumper
+        s.start()
+        self.assertTrue(s._os_code_profiler_dumper is parent)
+
+        launcher = module.ProcessLauncher()
+        wrap = FakeWrap(s)
+        for pid in [101, 102]:
+            wrap.next_pid = pid
+            self.assertEquals(launcher._start_child(wrap), pid)
+            wrap.children.add(pid)
+        self.assertTrue(parent.should_stop())
+        workers = s._os_code_profiler_workers
+        self.assertEquals(workers._profiled, set([101]))
+        workers._aggregator.stop()
+
+        # Pretend to be the second worker, which was not selected
+        with mock.patch('os_code_profiler.decorators.nova.os.getpid',
+                        return_value=102):
+            s.start()
+        self.assertEquals(s._os_code_profiler_dumper, None)
+        self.assertEquals(s.started, 2)
+
+        # And then the first
+        s._os_code_profiler_dumper = parent
+        read_fd, write_fd = os.pipe()
+        first = {'selected': True, 'fd': write_fd, 'inherited': [read_fd]}
+        with mock.patch('os_code_profiler.decorators.nova._fork_child',
+                        first):
+            with mock.patch('os_code_profiler.decorators.nova.os.getpid',
+                            return_value=101):
+                s.start()
+        dumper = s._os_code_profiler_dumper
+        self.assertEquals(dumper.pid, 101)
+        self.assertTrue(isinstance(dumper._outputs[0], PipeOutput))
+        self.assertEquals(s.tg.thread_counter, 2)
+        with self.assertRaises(OSError):
+            os.close(read_fd)
+        os.close(write_fd)
+
     @mock.patch('os_code_profiler.common.utils.PluginLoader.load')
     def test_load_outputs(self, mocked):
         """
@@ -287,5 +792,5 @@ class TestNovaService(unittest.TestCase):
         module = FakeModule()
         module = Service(module, output_config_dict)
         s = module.Service()
-        mocked.assert_called_with(plugin_name, config=plugin_config_dict)
+        mocked.assert_any_call(plugin_name, config=plugin_config_dict)
 
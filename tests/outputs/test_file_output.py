@@ -1,7 +1,19 @@
 import mock
+import os
+import shutil
+import tempfile
 import unittest
 
-from os_code_profiler.outputs.file import FileOutput
+from os_code_profiler.common import stats as stats_module
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.common.compression import \
+    CompressionException, \
+    methods
+from os_code_profiler.outputs.file import \
+    FileOutput, \
+    is_stats_file, \
+    parse_filename
 
 
 class FakeContext(object):
@@ -129,10 +141,13 @@ class TestFileOutput(unittest.TestCase):
             "%s_to_%s_%s.stats" % (self.started_string, self.ended_string, self.pid)
         )
 
-    def test_write(self):
+    @mock.patch('os_code_profiler.outputs.file.os.rename')
+    def test_write(self, mocked_rename):
         """
         Tests for the write method
 
+        Stats are saved to a temporary name and renamed into place.
+
         """
         class FakeStats(object):
             pass
@@ -145,11 +160,173 @@ class TestFileOutput(unittest.TestCase):
         o = FileOutput(config)
         o.write(ctx, stats)
 
-        stats.save.assert_called_with('%s/%s/%s/%s_to_%s_%s.stats' % (
+        path = '%s/%s/%s' % (
             '/var/log/os_code_profiler',
             self.hostname,
-            self.topic,
+            self.topic
+        )
+        name = '%s_to_%s_%s.stats' % (
             self.started_string,
             self.ended_string,
             self.pid
-        ))
+        )
+        tmpname = '%s/.%s.%s.tmp' % (path, name, os.getpid())
+        stats.save.assert_called_with(tmpname)
+        mocked_rename.assert_called_with(tmpname, '%s/%s' % (path, name))
+
+    def test_write_context(self):
+        """
+        Stats that can dump to a file are followed by the context.
+
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            o = FileOutput({'results_dir': tmpdir})
+            ctx = Context(hostname=self.hostname, pid=self.pid,
+                          started=self.started, ended=self.ended,
+                          topic=self.topic, metadata={'a': 1})
+            stats = Stats({('a.py', 1, 'a'): (1, 1, 1.0, 1.0, {})})
+            o.write(ctx, stats)
+            fullname = os.path.join(o._path(ctx), o._filename(ctx))
+            loaded = stats_module.load(fullname)
+            self.assertEquals(loaded.stats, stats.stats)
+            self.assertEquals(loaded.context, ctx.to_dict())
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_parse_filename(self):
+        """
+        File names made by FileOutput can be parsed back.
+
+        """
+        o = FileOutput({})
+        fields = parse_filename(o._filename(self.create_ctx()))
+        self.assertEquals(fields, {
+            'started': self.started,
+            'ended': self.ended,
+            'pid': self.pid,
+            'kind': 'stats'
+        })
+        self.assertEquals(parse_filename('other.stats'), None)
+        self.assertEquals(parse_filename('a_to_b_1.stats'), None)
+
+    def test_write_compressed(self):
+        """
+        Files written with each compression method load transparently.
+
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            ctx = Context(hostname=self.hostname, pid=self.pid,
+                          started=self.started, ended=self.ended,
+                          topic=self.topic)
+            stats = Stats({('a.py', 1, 'a'): (1, 1, 1.0, 1.0, {})})
+            for name, method in methods.iteritems():
+                o = FileOutput({'results_dir': tmpdir,
+                                'compression': name,
+                                'compression_level': 1})
+                o.write(ctx, stats)
+                filename = o._filename(ctx)
+                self.assertTrue(filename.endswith(method.extension))
+                self.assertTrue(is_stats_file(filename))
+                self.assertNotEquals(parse_filename(filename), None)
+                fullname = os.path.join(o._path(ctx), filename)
+                with open(fullname, 'rb') as f:
+                    self.assertTrue(f.read().startswith(method.magic))
+                loaded = stats_module.load(fullname)
+                self.assertEquals(loaded.stats, stats.stats)
+                self.assertEquals(loaded.context, ctx.to_dict())
+            self.assertEquals(len(os.listdir(o._path(ctx))), len(methods))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @mock.patch('tempfile.TemporaryFile')
+    def test_write_compressed_large(self, mocked_tempfile):
+        """
+        Large stats are compressed a chunk at a time and load from memory
+        along with a context that repeats strings.
+
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            ctx = Context(hostname=self.hostname, pid=self.pid,
+                          started=self.started, ended=self.ended,
+                          topic='stats', metadata={'stats': 'stats'})
+            stats = Stats(dict(
+                (('a.py', i, 'a'), (1, 1, 0.1, 0.2,
+                                    {('a.py', 0, 'a'): (1, 1, 0.1, 0.2)}))
+                for i in xrange(3000)
+            ))
+            o = FileOutput({'results_dir': tmpdir, 'compression': 'gzip'})
+            with mock.patch.object(stats_module.marshal, 'dumps',
+                                   wraps=stats_module.marshal.dumps) as dumps:
+                o.write(ctx, stats)
+            self.assertTrue(dumps.called)
+            for args, kwargs in dumps.call_args_list:
+                self.assertNotEquals(args[0], stats.stats)
+            loaded = stats_module.load(os.path.join(o._path(ctx),
+                                                    o._filename(ctx)))
+            self.assertEquals(loaded.stats, stats.stats)
+            self.assertEquals(loaded.context, ctx.to_dict())
+            self.assertFalse(mocked_tempfile.called)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_write_compressed_save(self):
+        """
+        Stats that can only save are compressed after saving.
+
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            ctx = self.create_ctx()
+            stats = Stats({('a.py', 1, 'a'): (1, 1, 1.0, 1.0, {})})
+            o = FileOutput({'results_dir': tmpdir, 'compression': 'gzip'})
+            o.write(ctx, mock.Mock(spec=['save'], save=stats.save))
+            path = o._path(ctx)
+            self.assertEquals(os.listdir(path), [o._filename(ctx)])
+            loaded = stats_module.load(os.path.join(path, o._filename(ctx)))
+            self.assertEquals(loaded.stats, stats.stats)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_write_failure(self):
+        """
+        A failed write leaves neither the file nor the temporary file.
+
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            ctx = self.create_ctx()
+            stats = mock.Mock(spec=['dump'])
+            stats.dump.side_effect = IOError('disk full')
+            o = FileOutput({'results_dir': tmpdir})
+            with self.assertRaises(IOError):
+                o.write(ctx, stats)
+            self.assertEquals(os.listdir(o._path(ctx)), [])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_invalid_compression(self):
+        """
+        Unknown compression methods are rejected.
+
+        """
+        with self.assertRaises(CompressionException):
+            FileOutput({'compression': 'rar'})
+
+    def test_compression_level(self):
+        """
+        Compression levels are cast and checked against the method.
+
+        """
+        o = FileOutput({'compression': 'gzip', 'compression_level': '1'})
+        self.assertEquals(o._compression_level, 1)
+        o = FileOutput({'compression': 'bz2'})
+        self.assertEquals(o._compression_level, 9)
+        for level in ['fast', 10, -1]:
+            with self.assertRaises(CompressionException):
+                FileOutput({'compression': 'gzip',
+                            'compression_level': level})
+        with self.assertRaises(CompressionException):
+            FileOutput({'compression': 'bz2', 'compression_level': 0})
@@ -0,0 +1,162 @@
+import mock
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.outputs.file import FileOutput
+from os_code_profiler.outputs import index as index_module
+from os_code_profiler.outputs.index import Index
+
+
+class TestIndex(unittest.TestCase):
+    """
+    Tests the results index.
+
+    """
+    def setUp(self):
+        """
+        Writes one file per host, topic, pid and minute with the index on.
+
+        """
+        self.results_dir = tempfile.mkdtemp()
+        self.output = FileOutput({'results_dir': self.results_dir,
+                                  'index': True})
+        for host in ['compute1', 'api1']:
+            for topic in ['nova-compute', 'nova-scheduler']:
+                for pid in [10, 20]:
+                    for minute in range(3):
+                        ctx = Context(hostname=host, pid=pid, topic=topic,
+                                      started=minute * 60,
+                                      ended=(minute + 1) * 60)
+                        self.output.write(ctx, Stats({
+                            ('a.py', 1, 'a'): (1, 1, 1.0, 1.0, {})
+                        }))
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+
+    def test_disabled_by_default(self):
+        """
+        The index is only kept when enabled.
+
+        """
+        self.assertEquals(FileOutput({})._index, None)
+
+    def test_write_adds(self):
+        """
+        Each written file is indexed with its context and size.
+
+        """
+        entries = Index(self.results_dir).query()
+        self.assertEquals(len(entries), 24)
+        entry = entries[0]
+        self.assertEquals(entry['started'], 0)
+        self.assertEquals(entry['ended'], 60)
+        self.assertTrue(os.path.isfile(entry['path']))
+        self.assertEquals(entry['size'], os.path.getsize(entry['path']))
+
+    def test_query(self):
+        """
+        Files are found by host glob, topic, pid and time range.
+
+        """
+        index = Index(self.results_dir)
+        entries = index.query(hosts=['compute*'], topics=['nova-scheduler'],
+                              pids=[20], start=60, end=120)
+        self.assertEquals(len(entries), 1)
+        self.assertEquals(entries[0]['hostname'], 'compute1')
+        self.assertEquals(entries[0]['topic'], 'nova-scheduler')
+        self.assertEquals(entries[0]['pid'], 20)
+        self.assertEquals(entries[0]['started'], 60)
+
+        # Windows overlapping the range are selected
+        self.assertEquals(len(index.query(start=90, end=150)), 16)
+        self.assertEquals(len(index.query(topics=['x*'])), 0)
+
+    def test_query_missing(self):
+        """
+        An absent index has no files.
+
+        """
+        self.assertEquals(Index(os.path.join(self.results_dir, 'x')).query(),
+                          [])
+
+    def test_rebuild(self):
+        """
+        Rebuilding indexes the files already in the tree exactly once.
+
+        """
+        index = Index(self.results_dir)
+        os.remove(os.path.join(self.results_dir, Index.filename))
+        self.assertEquals(index.rebuild(), 24)
+        self.assertEquals(index.rebuild(), 24)
+        self.assertEquals(len(index.query()), 24)
+        self.assertEquals(len(index.query(hosts=['api1'], pids=[10])), 6)
+
+    def test_query_long_window(self):
+        """
+        Files longer than the rest are found by the bounded lookup.
+
+        """
+        index = Index(self.results_dir)
+        index.add(Context(hostname='api1', pid=30, topic='nova-api',
+                          started=0, ended=3600),
+                  os.path.join(self.results_dir, 'long.stats'), 1)
+        entries = index.query(pids=[30], start=3000, end=3100)
+        self.assertEquals([e['pid'] for e in entries], [30])
+        self.assertEquals(index.query(pids=[30], start=3600), [])
+
+    def test_query_bounded(self):
+        """
+        Time range lookups scan started between two bounds.
+
+        """
+        index = Index(self.results_dir)
+        connection = index._connect()
+        try:
+            max_window, = connection.execute(
+                "SELECT value FROM meta WHERE key = 'max_window'"
+            ).fetchone()
+            plan = connection.execute(
+                'EXPLAIN QUERY PLAN SELECT path FROM files '
+                'WHERE started < ? AND started > ? AND ended > ?',
+                (120, 0, 60)
+            ).fetchall()
+        finally:
+            connection.close()
+        self.assertEquals(max_window, 60)
+        self.assertTrue('started>? AND started<?' in plan[0][-1])
+
+    def test_index_without_meta(self):
+        """
+        Indexes written before the meta table learn their longest window.
+
+        """
+        connection = sqlite3.connect(
+            os.path.join(self.results_dir, Index.filename)
+        )
+        with connection:
+            connection.execute('DROP TABLE meta')
+        connection.close()
+        entries = Index(self.results_dir).query(start=90, end=150)
+        self.assertEquals(len(entries), 16)
+
+    def test_schema_created_once(self):
+        """
+        The schema and longest window are only set up on the first
+        connection of an index.
+
+        """
+        index = Index(self.results_dir)
+        self.assertEquals(len(index.query(start=90, end=150)), 16)
+        with mock.patch.object(index_module, '_schema', 'NOT SQL;'):
+            self.assertEquals(len(index.query(start=90, end=150)), 16)
+            index.add(Context(hostname='compute1', pid=30,
+                              topic='nova-compute', started=180,
+                              ended=240),
+                      os.path.join(self.results_dir, 'new.stats'), 1)
+        self.assertEquals(len(index.query(pids=[30])), 1)
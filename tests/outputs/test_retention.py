@@ -0,0 +1,176 @@
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from os_code_profiler.common import stats as stats_module
+from os_code_profiler.common.profiling import ConfigException, Context
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.outputs.file import FileOutput
+from os_code_profiler.outputs.index import Index
+
+A = ('a.py', 1, 'a')
+DAY = 86400
+
+
+class TestRetention(unittest.TestCase):
+    """
+    Tests retention limits of FileOutput.
+
+    """
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.results_dir, 'ahost', 'testing')
+        patcher = mock.patch(
+            'os_code_profiler.outputs.retention.utils.utc_seconds',
+            return_value=10 * DAY
+        )
+        self.now = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+
+    def create_output(self, **config):
+        config['results_dir'] = self.results_dir
+        return FileOutput(config)
+
+    def write(self, output, started, ended, pid=10, calls=1):
+        ctx = Context(hostname='ahost', pid=pid, started=started,
+                      ended=ended, topic='testing')
+        output.write(ctx, Stats({A: (calls, calls, 1.0, 1.0, {})}))
+
+    def files(self):
+        return sorted(f for f in os.listdir(self.path)
+                      if not f.startswith('.'))
+
+    def test_not_configured(self):
+        """
+        Retention is off by default.
+
+        """
+        self.assertEquals(self.create_output()._retention, None)
+
+    def test_invalid_rollup(self):
+        """
+        Unknown rollup periods are rejected.
+
+        """
+        with self.assertRaises(ConfigException):
+            self.create_output(rollup='week')
+
+    def test_invalid_limits(self):
+        """
+        Limits are cast from strings and must be in range.
+
+        """
+        retention = self.create_output(max_age='60', max_bytes='100',
+                                       max_files='3', rollup='Hour',
+                                       rollup_after='0')._retention
+        self.assertEquals(retention._max_age, 60.0)
+        self.assertEquals(retention._max_bytes, 100)
+        self.assertEquals(retention._max_files, 3)
+        self.assertEquals(retention._period, 3600)
+        self.assertEquals(retention._rollup_after, 0.0)
+        for key, value in [('max_age', 0), ('max_bytes', '0'),
+                           ('max_files', -1), ('rollup_after', -1),
+                           ('rescan_interval', -1)]:
+            config = {'max_files': 1}
+            config[key] = value
+            with self.assertRaises(ConfigException):
+                self.create_output(**config)
+        with self.assertRaises(ValueError):
+            self.create_output(max_files='many')
+
+    def test_max_files(self):
+        """
+        Only the newest max_files files are kept.
+
+        """
+        output = self.create_output(max_files=3)
+        for i in range(5):
+            self.write(output, i * 60, (i + 1) * 60)
+        files = self.files()
+        self.assertEquals(len(files), 3)
+        self.assertTrue(files[0].startswith('1970-01-01T00:02:00_to'))
+
+    def test_max_bytes(self):
+        """
+        Oldest files are deleted until the directory fits in max_bytes.
+        The newest file is always kept.
+
+        """
+        output = self.create_output(max_bytes=1)
+        for i in range(3):
+            self.write(output, i * 60, (i + 1) * 60)
+        self.assertEquals(len(self.files()), 1)
+
+        size = os.path.getsize(os.path.join(self.path, self.files()[0]))
+        output = self.create_output(max_bytes=size * 2)
+        for i in range(3, 6):
+            self.write(output, i * 60, (i + 1) * 60)
+        self.assertEquals(len(self.files()), 2)
+
+    def test_max_age(self):
+        """
+        Files that ended more than max_age seconds ago are deleted.
+
+        """
+        output = self.create_output(max_age=DAY)
+        now = 10 * DAY
+        for ended in [now - 3 * DAY, now - 2 * DAY, now - 60, now]:
+            self.write(output, ended - 60, ended)
+        self.assertEquals(len(self.files()), 2)
+
+    def test_index(self):
+        """
+        Deleted files are removed from the index.
+
+        """
+        output = self.create_output(max_files=2, index=True)
+        for i in range(4):
+            self.write(output, i * 60, (i + 1) * 60)
+        entries = Index(self.results_dir).query()
+        self.assertEquals([os.path.basename(e['path']) for e in entries],
+                          self.files())
+
+    def test_rescan(self):
+        """
+        Files written by other processes are counted after a rescan.
+
+        """
+        other = self.create_output()
+        for i in range(4):
+            self.write(other, i * 60, (i + 1) * 60, pid=20)
+        output = self.create_output(max_files=3, rescan_interval=0)
+        self.write(output, 600, 660)
+        self.assertEquals(len(self.files()), 3)
+
+    def test_rollup(self):
+        """
+        Old files of each pid are merged into one file per period.
+
+        """
+        output = self.create_output(rollup='hour', rollup_after=DAY)
+        self.now.return_value = 3600
+        for pid in [10, 20]:
+            for i in range(12):
+                self.write(output, i * 300, (i + 1) * 300, pid=pid, calls=i)
+        # Nothing is rolled up until a write after the period is old
+        self.assertEquals(len(self.files()), 24)
+
+        self.now.return_value = 10 * DAY
+        self.write(output, 9 * DAY, 9 * DAY + 300)
+        files = self.files()
+        self.assertEquals(len(files), 3)
+        self.assertEquals(files[0],
+                          '1970-01-01T00:00:00_to_1970-01-01T01:00:00_10.stats')
+        loaded = stats_module.load(os.path.join(self.path, files[0]))
+        self.assertEquals(loaded.stats[A][1], sum(range(12)))
+        self.assertEquals(loaded.context['metadata']['rollup'],
+                          {'period': 'hour', 'files': 12})
+
+        # A rolled up period is not rolled up again
+        self.write(output, 9 * DAY + 300, 9 * DAY + 600)
+        self.assertEquals(len(self.files()), 4)
@@ -0,0 +1,227 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from os_code_profiler.common.profiling import ConfigException, Context
+from os_code_profiler.common.pruning import OTHER
+from os_code_profiler.common.stats import Snapshot, Stats
+from os_code_profiler.outputs.shared import SharedMemoryOutput
+from os_code_profiler.outputs.shared import function_id
+
+
+class FakeOutput(object):
+    """
+    Output that keeps what it is given.
+
+    """
+    writes = []
+
+    def __init__(self, config):
+        pass
+
+    def write(self, ctx, stats):
+        FakeOutput.writes.append((ctx, stats))
+
+
+class TestSharedMemoryOutput(unittest.TestCase):
+    """
+    Tests merging stats through shared segments.
+
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        FakeOutput.writes = []
+        self.output = self._output()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _output(self, **config):
+        config.setdefault('directory', self.directory)
+        config.setdefault('outputs', {
+            'tests.outputs.test_shared.FakeOutput': {}
+        })
+        return SharedMemoryOutput(config)
+
+    def _write(self, output, pid, minute, stats, topic='nova-compute'):
+        ctx = Context(hostname='compute1', pid=pid, topic=topic,
+                      started=minute * 60 + pid, ended=(minute + 1) * 60)
+        output.write(ctx, Stats(stats))
+
+    def test_function_id(self):
+        """
+        Tests that function ids are stable and never zero.
+
+        """
+        func = ('a.py', 1, 'a')
+        self.assertEqual(function_id(func), function_id(func))
+        self.assertNotEqual(function_id(func), function_id(('a.py', 2, 'a')))
+        self.assertNotEqual(function_id(func), 0)
+
+    def test_merge(self):
+        """
+        Tests that publishers of an interval are merged into one dump
+        emitted when a later interval is written.
+
+        """
+        a = ('a.py', 1, 'a')
+        b = ('b.py', 2, 'b')
+        self._write(self.output, 1, 0,
+                    {a: (1, 2, 1.0, 2.0, {b: (1, 1, 1.0, 1.0)})})
+        self._write(self._output(), 2, 0, {a: (3, 4, 0.5, 1.0, {}),
+                                           b: (1, 1, 0.25, 0.25, {})})
+        self.assertEqual(FakeOutput.writes, [])
+
+        self._write(self.output, 1, 1, {a: (1, 1, 1.0, 1.0, {})})
+        self.assertEqual(len(FakeOutput.writes), 1)
+        ctx, stats = FakeOutput.writes[0]
+        self.assertEqual(ctx.hostname, 'compute1')
+        self.assertEqual(ctx.topic, 'nova-compute')
+        self.assertEqual(ctx.pid, os.getpid())
+        self.assertEqual(ctx.started, 1)
+        self.assertEqual(ctx.ended, 60)
+        self.assertEqual(ctx.metadata,
+                         {'shared': {'publishers': 2, 'dropped': 0}})
+        self.assertEqual(stats.stats, {a: (4, 6, 1.5, 3.0, {}),
+                                       b: (1, 1, 0.25, 0.25, {})})
+
+        # Only the current interval is left
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_topics(self):
+        """
+        Tests that topics are merged separately.
+
+        """
+        a = ('a.py', 1, 'a')
+        self._write(self.output, 1, 0, {a: (1, 1, 1.0, 1.0, {})})
+        self._write(self.output, 1, 0, {a: (1, 1, 1.0, 1.0, {})},
+                    topic='nova-api')
+        self._write(self.output, 1, 1, {a: (1, 1, 1.0, 1.0, {})})
+        self.assertEqual([ctx.topic for ctx, stats in FakeOutput.writes],
+                         ['nova-compute'])
+
+    def test_flush(self):
+        """
+        Tests that flushing emits the current interval.
+
+        """
+        a = ('a.py', 1, 'a')
+        ctx = Context(hostname='compute1', topic='nova-compute')
+        self.output.flush(ctx)
+        self.assertEqual(FakeOutput.writes, [])
+        self._write(self.output, 1, 0, {a: (1, 1, 1.0, 1.0, {})})
+        self.output.flush(ctx)
+        self.assertEqual(len(FakeOutput.writes), 1)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_close(self):
+        """
+        Tests that closing emits the topics this process wrote and
+        closes the downstream outputs.
+
+        """
+        a = ('a.py', 1, 'a')
+        self._write(self._output(), 2, 0, {a: (1, 1, 1.0, 1.0, {})},
+                    topic='nova-api')
+        self._write(self.output, 1, 0, {a: (1, 1, 1.0, 1.0, {})})
+        with mock.patch.object(FakeOutput, 'close', create=True) as close:
+            self.output.close()
+        close.assert_called_once_with()
+        self.assertEqual([ctx.topic for ctx, stats in FakeOutput.writes],
+                         ['nova-compute'])
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_close_current(self):
+        """
+        Tests that closing leaves the segment of an interval that has
+        not ended to the processes still publishing to it.
+
+        """
+        a = ('a.py', 1, 'a')
+        self._write(self.output, 1, 0, {a: (1, 1, 1.0, 1.0, {})})
+        self._write(self.output, 1, 1, {a: (1, 1, 1.0, 1.0, {})})
+        with mock.patch('os_code_profiler.common.utils.utc_seconds',
+                        return_value=90):
+            self.output.close()
+        self.assertEqual([ctx.ended for ctx, stats in FakeOutput.writes],
+                         [60])
+        self._write(self._output(), 2, 1, {a: (1, 1, 1.0, 1.0, {})})
+        self._output().flush(Context(hostname='compute1',
+                                     topic='nova-compute'))
+        self.assertEqual(len(FakeOutput.writes), 2)
+        ctx, stats = FakeOutput.writes[1]
+        self.assertEqual(ctx.ended, 120)
+        self.assertEqual(ctx.metadata['shared']['publishers'], 2)
+
+    def test_stale(self):
+        """
+        Tests that segments of other topics are emitted by a write once
+        they are stale_after seconds old.
+
+        """
+        a = ('a.py', 1, 'a')
+        output = self._output(stale_after=120)
+        self._write(output, 1, 0, {a: (1, 1, 1.0, 1.0, {})},
+                    topic='nova-api')
+        self._write(output, 1, 1, {a: (1, 1, 1.0, 1.0, {})},
+                    topic='nova-api-metadata')
+        self._write(output, 1, 2, {a: (1, 1, 1.0, 1.0, {})})
+        self.assertEqual(FakeOutput.writes, [])
+        self._write(output, 1, 3, {a: (1, 1, 1.0, 1.0, {})})
+        self.assertEqual([(ctx.topic, ctx.ended)
+                          for ctx, stats in FakeOutput.writes],
+                         [('nova-api', 60), ('nova-compute', 180)])
+
+    def test_full(self):
+        """
+        Tests that functions past a full table are counted as OTHER.
+
+        """
+        output = self._output(slots=2)
+        a = ('a.py', 1, 'a')
+        b = ('b.py', 1, 'b')
+        c = ('c.py', 1, 'c')
+        self._write(output, 1, 0, {a: (1, 1, 1.0, 1.0, {})})
+        self._write(output, 1, 0, {b: (1, 1, 1.0, 1.0, {}),
+                                   c: (1, 1, 1.0, 1.0, {})})
+        output.flush(Context(hostname='compute1', topic='nova-compute'))
+        ctx, stats = FakeOutput.writes[0]
+        self.assertEqual(len(stats), 3)
+        self.assertIn(a, stats.stats)
+        self.assertEqual(stats.stats[OTHER], (1, 1, 1.0, 1.0, {}))
+        self.assertEqual(ctx.metadata['shared']['dropped'], 1)
+
+    def test_snapshot(self):
+        """
+        Tests that snapshots are converted before publishing.
+
+        """
+        a = ('a.py', 1, 'a')
+        ctx = Context(hostname='compute1', topic='nova-compute')
+        self.output.write(ctx, Snapshot(
+            None, lambda raw: Stats({a: (1, 1, 1.0, 1.0, {})})
+        ))
+        self.output.flush(ctx)
+        self.assertEqual(FakeOutput.writes[0][1].stats,
+                         {a: (1, 1, 1.0, 1.0, {})})
+
+    def test_other_kinds(self):
+        """
+        Tests that collector documents pass through.
+
+        """
+        ctx = Context(hostname='compute1', kind='histograms')
+        self.output.write(ctx, 'document')
+        self.assertEqual(FakeOutput.writes, [(ctx, 'document')])
+
+    def test_config(self):
+        """
+        Tests config validation.
+
+        """
+        self.assertRaises(ConfigException, self._output, slots=0)
+        self.assertRaises(ConfigException, self._output, stale_after=0)
@@ -0,0 +1,252 @@
+import marshal
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+from os_code_profiler.collectors.base import Document
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.outputs.stream import UnixSocketOutput
+
+A = ('a.py', 1, 'a')
+
+
+def read_messages(connection):
+    """
+    Reads every message sent so far.
+
+    """
+    connection.setblocking(False)
+    data = ''
+    while True:
+        try:
+            chunk = connection.recv(65536)
+        except socket.error:
+            break
+        if not chunk:
+            break
+        data += chunk
+    messages = []
+    while data:
+        size, = struct.unpack('!I', data[:4])
+        messages.append(marshal.loads(data[4:4 + size]))
+        data = data[4 + size:]
+    return messages
+
+
+class TestUnixSocketOutput(unittest.TestCase):
+    """
+    Tests streaming dumps over a Unix domain socket.
+
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'collector.sock')
+        self.listener = None
+
+    def tearDown(self):
+        if self.listener is not None:
+            self.listener.close()
+        shutil.rmtree(self.directory)
+
+    def listen(self):
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(1)
+
+    def output(self, **config):
+        config.setdefault('path', self.path)
+        config.setdefault('reconnect_interval', 0)
+        return UnixSocketOutput(config)
+
+    def test_write(self):
+        """
+        Tests that stats and documents are sent as framed messages.
+
+        """
+        self.listen()
+        output = self.output()
+        output.write(Context(pid=10, topic='t', started=0, ended=60),
+                     Stats({A: (1, 1, 1.0, 1.0, {})}))
+        output.write(Context(pid=10, kind='histograms'), Document({'x': 1}))
+        connection = self.listener.accept()[0]
+        messages = read_messages(connection)
+        connection.close()
+        self.assertEqual(len(messages), 2)
+        ctx, payload = messages[0]
+        self.assertEqual((ctx['pid'], ctx['topic'], ctx['ended']),
+                         (10, 't', 60))
+        self.assertEqual(payload, {A: (1, 1, 1.0, 1.0, {})})
+        self.assertEqual(messages[1][0]['kind'], 'histograms')
+        self.assertEqual(messages[1][1], {'x': 1})
+        self.assertEqual(output.sent, 2)
+
+    def test_batch(self):
+        """
+        Tests that dumps are held until a batch is queued.
+
+        """
+        self.listen()
+        output = self.output(batch_size=2)
+        output.write(Context(), Stats())
+        self.assertEqual(output.sent, 0)
+        output.write(Context(), Stats())
+        self.assertEqual(output.sent, 2)
+        connection = self.listener.accept()[0]
+        self.assertEqual(len(read_messages(connection)), 2)
+        connection.close()
+
+    def test_close(self):
+        """
+        Tests that closing sends a partial batch and disconnects.
+
+        """
+        self.listen()
+        output = self.output(batch_size=3)
+        output.write(Context(pid=1), Stats())
+        output.write(Context(pid=2), Stats())
+        self.assertEqual(output.sent, 0)
+        output.close()
+        self.assertEqual(output.sent, 2)
+        self.assertEqual(output._socket, None)
+        connection = self.listener.accept()[0]
+        messages = read_messages(connection)
+        connection.close()
+        self.assertEqual([ctx['pid'] for ctx, payload in messages], [1, 2])
+
+    def test_close_no_collector(self):
+        """
+        Tests that closing without a collector drops what is queued.
+
+        """
+        output = self.output(batch_size=3)
+        output.write(Context(), Stats())
+        output.close()
+        self.assertEqual((output.sent, output.dropped), (0, 1))
+        self.assertEqual(len(output._queue), 0)
+
+    def test_no_collector(self):
+        """
+        Tests that dumps are queued until the collector listens, and the
+        oldest are dropped past the byte limit.
+
+        """
+        output = self.output(max_queued_bytes=300)
+        stats = Stats({A: (1, 1, 1.0, 1.0, {})})
+        for pid in range(10):
+            output.write(Context(pid=pid), stats)
+        self.assertEqual(output.sent, 0)
+        self.assertTrue(output.dropped > 0)
+
+        self.listen()
+        dropped = output.dropped
+        output.write(Context(pid=10), stats)
+        connection = self.listener.accept()[0]
+        messages = read_messages(connection)
+        connection.close()
+        self.assertEqual(len(messages) + output.dropped, 11)
+        self.assertEqual(messages[-1][0]['pid'], 10)
+        self.assertEqual(messages[-1][0]['metadata'],
+                         {'stream': {'dropped': dropped}})
+
+    def test_connect_full_backlog(self):
+        """
+        Tests that connecting to a collector that does not accept does
+        not block the write.
+
+        """
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(0)
+        waiting = []
+        for _ in range(2):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                sock.connect(self.path)
+            except socket.error:
+                pass
+            waiting.append(sock)
+        output = self.output(send_timeout=0.1)
+        started = time.time()
+        output.write(Context(), Stats())
+        self.assertTrue(time.time() - started < 1)
+        self.assertEqual(output.sent, 0)
+        self.assertEqual(len(output._queue), 1)
+        for sock in waiting:
+            sock.close()
+
+    def test_backpressure(self):
+        """
+        Tests that writes wait at most send_timeout when the collector
+        does not read.
+
+        """
+        self.listen()
+        output = self.output(max_queued_bytes=1024 * 1024,
+                             send_timeout=0.01)
+        stats = Stats(dict(
+            (('a.py', i, 'a'), (1, 1, 1.0, 1.0, {})) for i in range(5000)
+        ))
+        started = time.time()
+        for pid in range(50):
+            output.write(Context(pid=pid), stats)
+        self.assertTrue(time.time() - started < 5)
+        self.assertTrue(output.dropped > 0)
+        self.assertTrue(output.sent < 50)
+
+    def test_large_dump(self):
+        """
+        Tests that a dump larger than the socket buffer is sent whole by
+        one write to a collector that reads.
+
+        """
+        self.listen()
+        received = []
+
+        def collect():
+            connection = self.listener.accept()[0]
+            data = ''
+            while True:
+                chunk = connection.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+            connection.close()
+            received.append(data)
+
+        thread = threading.Thread(target=collect)
+        thread.start()
+        output = self.output()
+        stats = Stats(dict(
+            (('module_%s.py' % i, i, 'function_%s' % i),
+             (1, 1, 1.0, 1.0, {})) for i in range(20000)
+        ))
+        output.write(Context(pid=10), stats)
+        self.assertEqual(output.sent, 1)
+        sndbuf = output._socket.getsockopt(socket.SOL_SOCKET,
+                                           socket.SO_SNDBUF)
+        output._socket.close()
+        thread.join()
+        self.assertTrue(len(received[0]) > sndbuf)
+        size, = struct.unpack('!I', received[0][:4])
+        self.assertEqual(len(received[0]), 4 + size)
+        ctx, payload = marshal.loads(received[0][4:])
+        self.assertEqual(payload, stats.stats)
+        self.assertEqual(output.dropped, 0)
+
+    def test_shared_context(self):
+        """
+        Tests that reporting drops does not change the shared context.
+
+        """
+        output = self.output(max_queued_bytes=1)
+        output.write(Context(), Stats())
+        ctx = Context()
+        output.write(ctx, Stats())
+        self.assertEqual(ctx.metadata, {})
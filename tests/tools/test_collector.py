@@ -0,0 +1,165 @@
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import time
+import unittest
+
+import mock
+
+from os_code_profiler.collectors.base import Document
+from os_code_profiler.common import stats as stats_module
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.common.writer import Writer
+from os_code_profiler.outputs.file import FileOutput
+from os_code_profiler.outputs.stream import UnixSocketOutput
+from os_code_profiler.tools.collector import Collector
+from os_code_profiler.tools.merge import select_files
+
+A = ('a.py', 1, 'a')
+
+
+class FakeWriter(object):
+    def __init__(self):
+        self.submitted = []
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def submit(self, ctx, stats):
+        self.submitted.append((ctx, stats))
+
+
+class TestCollector(unittest.TestCase):
+    """
+    Tests collecting streamed dumps.
+
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'collector.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def output(self):
+        return UnixSocketOutput({'path': self.path})
+
+    def test_merge(self):
+        """
+        Tests that dumps of a topic and interval from many processes are
+        merged once they time out, and documents are passed on.
+
+        """
+        writer = FakeWriter()
+        collector = Collector(self.path, writer, timeout=10)
+        with mock.patch.object(Collector, 'start'):
+            collector.listen()
+        listener = collector.fds()[-1]
+        outputs = [self.output(), self.output()]
+        for pid, output in zip([10, 20], outputs):
+            output.write(Context(pid=pid, topic='t', started=pid, ended=60),
+                         Stats({A: (1, 1, 1.0, 1.0, {})}))
+        outputs[0].write(Context(pid=10, kind='histograms'),
+                         Document({'functions': {}}))
+
+        collector._receive(listener, 0)
+        collector._receive(listener, 0)
+        for fd in collector.fds()[:-1]:
+            collector._receive(fd, 0)
+        self.assertEqual(len(writer.submitted), 1)
+        self.assertEqual(writer.submitted[0][1].data, {'functions': {}})
+
+        collector.flush(10)
+        ctx, stats = writer.submitted[1]
+        self.assertEqual(stats.stats, {A: (2, 2, 2.0, 2.0, {})})
+        self.assertEqual((ctx.started, ctx.ended, ctx.topic), (10, 60, 't'))
+        self.assertEqual(ctx.metadata['workers'],
+                         {'pids': [10, 20], 'count': 2})
+
+        collector.stop()
+        self.assertEqual(collector.fds(), [])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_disconnect(self):
+        """
+        Tests that connections are closed when processes go away.
+
+        """
+        collector = Collector(self.path, FakeWriter(), timeout=10)
+        with mock.patch.object(Collector, 'start'):
+            collector.listen()
+        listener = collector.fds()[-1]
+        output = self.output()
+        output.write(Context(), Stats())
+        collector._receive(listener, 0)
+        self.assertEqual(len(collector.fds()), 2)
+        connection, = set(collector.fds()) - set([listener])
+        output._socket.close()
+        # The dump, then the end of the connection
+        collector._receive(connection, 0)
+        collector._receive(connection, 0)
+        self.assertEqual(collector.fds(), [listener])
+        collector.stop()
+
+    def test_results_dir(self):
+        """
+        Tests collecting into a results directory on its own threads.
+
+        """
+        results_dir = os.path.join(self.directory, 'results')
+        writer = Writer([FileOutput({'results_dir': results_dir})])
+        collector = Collector(self.path, writer, timeout=0.5)
+        collector.poll_interval = 0.01
+        collector.listen()
+        try:
+            output = self.output()
+            for pid in [10, 20]:
+                output.write(Context(hostname='compute1', pid=pid,
+                                     topic='t', started=0, ended=60),
+                             Stats({A: (1, 1, 1.0, 1.0, {})}))
+            deadline = time.time() + 5
+            while not list(select_files(results_dir)) and \
+                    time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            collector.stop()
+        paths = list(select_files(results_dir))
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(stats_module.load(paths[0]).stats[A][1], 2)
+
+    def test_bad_client(self):
+        """
+        Tests that a process sending garbage is disconnected without
+        stopping the collector receiving from the others.
+
+        """
+        writer = FakeWriter()
+        collector = Collector(self.path, writer, timeout=0)
+        collector.poll_interval = 0.01
+        collector.listen()
+        try:
+            bad = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            bad.connect(self.path)
+            bad.sendall(struct.pack('!I', 4) + 'junk')
+            deadline = time.time() + 5
+            while not collector.errors and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(collector.errors, 1)
+
+            output = self.output()
+            output.write(Context(pid=10, topic='t', ended=60),
+                         Stats({A: (1, 1, 1.0, 1.0, {})}))
+            while not writer.submitted and time.time() < deadline:
+                time.sleep(0.01)
+            bad.close()
+        finally:
+            collector.stop()
+        self.assertEqual(len(writer.submitted), 1)
+        self.assertEqual(writer.submitted[0][0].metadata['workers']['pids'],
+                         [10])
@@ -0,0 +1,157 @@
+import marshal
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from os_code_profiler.collectors.base import Document
+from os_code_profiler.common import stats as stats_module
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.outputs.file import FileOutput
+from os_code_profiler.outputs.index import Index
+from os_code_profiler.tools.merge import \
+    main, \
+    merge, \
+    merge_files, \
+    select_files
+
+A = ('a.py', 1, 'a')
+B = ('b.py', 2, 'b')
+
+
+class TestMerge(unittest.TestCase):
+    """
+    Tests the merge tool.
+
+    """
+    def setUp(self):
+        """
+        Writes one file per host, topic, pid and minute.
+
+        """
+        self.tmpdir = tempfile.mkdtemp()
+        self.results_dir = os.path.join(self.tmpdir, 'results')
+        output = FileOutput({'results_dir': self.results_dir})
+        for host in ['compute1', 'compute2', 'api1']:
+            for topic in ['nova-compute', 'nova-scheduler']:
+                for pid in [10, 20]:
+                    for minute in range(3):
+                        ctx = Context(hostname=host, pid=pid, topic=topic,
+                                      started=minute * 60,
+                                      ended=(minute + 1) * 60)
+                        output.write(ctx, Stats({
+                            A: (1, 1, 1.0, 2.0, {}),
+                            B: (2, 2, 0.5, 0.5, {A: (2, 2, 0.5, 0.5)})
+                        }))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_select_all(self):
+        """
+        Every file is selected by default.
+
+        """
+        self.assertEquals(len(list(select_files(self.results_dir))), 36)
+
+    def test_select_kind(self):
+        """
+        Only files of the selected kind are selected.
+
+        """
+        output = FileOutput({'results_dir': self.results_dir})
+        ctx = Context(hostname='api1', pid=10, topic='nova-compute',
+                      started=0, ended=60, kind='histograms')
+        output.write(ctx, Document({'functions': {}}))
+        self.assertEquals(len(list(select_files(self.results_dir))), 36)
+        paths = list(select_files(self.results_dir, kind='histograms'))
+        self.assertEquals(len(paths), 1)
+        self.assertTrue(paths[0].endswith('_10.histograms'))
+
+    def test_select_filters(self):
+        """
+        Files are selected by host glob, topic, pid and time range.
+
+        """
+        paths = list(select_files(
+            self.results_dir, hosts=['compute*'], topics=['nova-compute'],
+            pids=set([10]), start=60, end=120
+        ))
+        self.assertEquals(len(paths), 2)
+        for path in paths:
+            self.assertTrue('/compute' in path)
+            self.assertTrue('/nova-compute/' in path)
+            self.assertTrue(path.endswith(
+                '1970-01-01T00:01:00_to_1970-01-01T00:02:00_10.stats'
+            ))
+
+    def test_merge_files(self):
+        """
+        Files are summed and unreadable files are skipped.
+
+        """
+        paths = list(select_files(self.results_dir, hosts=['api1']))
+        bad = os.path.join(self.tmpdir, 'bad.stats')
+        with open(bad, 'w') as f:
+            f.write('not stats')
+        stats, merged, errors = merge_files(paths + [bad])
+        self.assertEquals((merged, errors), (12, 1))
+        self.assertEquals(stats[A][:4], (12, 12, 12.0, 24.0))
+        self.assertEquals(stats[B][4][A], (24, 24, 6.0, 6.0))
+
+    def test_merge_pool(self):
+        """
+        Merging across processes matches merging in process.
+
+        """
+        paths = list(select_files(self.results_dir))
+        pooled = merge(paths, processes=2, chunk_size=5)
+        single = merge(paths, processes=1)
+        self.assertEquals(pooled.context, {'merged': 36, 'errors': 0})
+        self.assertEquals(pooled.stats, single.stats)
+        self.assertEquals(pooled.stats[A][:4], (36, 36, 36.0, 72.0))
+
+    def test_main(self):
+        """
+        The command line writes a pstats file.
+
+        """
+        output = os.path.join(self.tmpdir, 'merged.stats')
+        main([self.results_dir, '-o', output, '--topic', 'nova-scheduler',
+              '--start', '1970-01-01T00:02:00', '--processes', '1'])
+        self.assertEquals(stats_module.load(output).stats[A][1], 6)
+        self.assertEquals(pstats.Stats(output).total_calls, 18)
+
+    def test_main_index(self):
+        """
+        The command line can select files using the index.
+
+        """
+        Index(self.results_dir).rebuild()
+        output = os.path.join(self.tmpdir, 'merged.stats')
+        main([self.results_dir, '-o', output, '--topic', 'nova-scheduler',
+              '--start', '1970-01-01T00:02:00', '--processes', '1',
+              '--index'])
+        self.assertEquals(stats_module.load(output).stats[A][1], 6)
+
+    def test_extrapolate(self):
+        """
+        Files profiled on a duty cycle are scaled to their period when
+        extrapolating.
+
+        """
+        path = os.path.join(self.tmpdir, 'duty.stats')
+        ctx = Context(hostname='h', pid=1, topic='t', started=0, ended=30,
+                      metadata={'duty_cycle': {'on': 30, 'period': 600,
+                                               'offset': 0}})
+        with open(path, 'wb') as f:
+            Stats({A: (1, 1, 1.0, 2.0, {})}).dump(f)
+            marshal.dump(ctx.to_dict(), f)
+
+        self.assertEquals(merge([path], processes=1).stats[A][1], 1)
+        merged = merge([path], processes=1, extrapolate=True)
+        self.assertEquals(merged.stats[A][:4], (20, 20, 20.0, 40.0))
+        merged = merge([path, path], processes=2, extrapolate=True)
+        self.assertEquals(merged.stats[A][1], 40)
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from os_code_profiler.common import stats as stats_module
+from os_code_profiler.common.delta import DeltaEncoder
+from os_code_profiler.common.profiling import Context
+from os_code_profiler.common.stats import Stats
+from os_code_profiler.outputs.file import FileOutput
+from os_code_profiler.tools.rebuild import main, rebuild
+
+A = ('a.py', 1, 'a')
+B = ('b.py', 2, 'b')
+
+
+class TestRebuild(unittest.TestCase):
+    """
+    Tests the rebuild tool.
+
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.deltas = os.path.join(self.tmpdir, 'deltas')
+        self.output = os.path.join(self.tmpdir, 'cumulative')
+        self.snapshots = {
+            1: [
+                {A: (1, 1, 1.0, 1.0, {})},
+                {A: (2, 2, 2.0, 2.0, {})},
+            ],
+            2: [
+                {B: (1, 1, 1.0, 1.0, {})},
+                {B: (1, 1, 1.0, 1.0, {}), A: (1, 1, 1.0, 1.0, {})},
+            ]
+        }
+        output = FileOutput({'results_dir': self.deltas})
+        for pid, snapshots in self.snapshots.iteritems():
+            encoder = DeltaEncoder()
+            for i, snapshot in enumerate(snapshots):
+                ctx = Context(hostname='host', pid=pid, topic='topic',
+                              started=100, ended=100 + (i + 1) * 60)
+                output.write(ctx, encoder(ctx, Stats(dict(snapshot))))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_rebuild(self):
+        """
+        Each process's deltas are replayed into cumulative views.
+
+        """
+        rebuilt = {}
+        for cumulative in rebuild([self.deltas]):
+            rebuilt.setdefault(cumulative.context['pid'], []).append(
+                cumulative.stats
+            )
+        self.assertEquals(rebuilt, self.snapshots)
+
+    def test_loads_each_file_once(self):
+        """
+        Files are grouped by name and loaded once when replayed.
+
+        """
+        load = stats_module.load
+        with mock.patch('os_code_profiler.tools.rebuild.stats_module.load',
+                        side_effect=load) as mocked:
+            list(rebuild([self.deltas]))
+        self.assertEquals(mocked.call_count, 4)
+
+    def test_main(self):
+        """
+        The command line writes cumulative files in the FileOutput layout.
+
+        """
+        main(['-o', self.output, self.deltas])
+        path = os.path.join(self.output, 'host', 'topic')
+        names = sorted(os.listdir(path))
+        self.assertEquals(names, [
+            '1970-01-01T00:01:40_to_1970-01-01T00:02:40_1.stats',
+            '1970-01-01T00:01:40_to_1970-01-01T00:02:40_2.stats',
+            '1970-01-01T00:01:40_to_1970-01-01T00:03:40_1.stats',
+            '1970-01-01T00:01:40_to_1970-01-01T00:03:40_2.stats'
+        ])
+        last = stats_module.load(os.path.join(path, names[3]))
+        self.assertEquals(last.stats, self.snapshots[2][1])